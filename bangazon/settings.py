@@ -96,6 +96,16 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        # WAL lets reads carry on while a checkout writes. IMMEDIATE makes
+        # every transaction take the write lock when it begins, so
+        # concurrent checkouts queue on `timeout` instead of failing to
+        # upgrade a read lock. Tests use a file so threads share the database.
+        "OPTIONS": {
+            "timeout": 20,
+            "transaction_mode": "IMMEDIATE",
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL",
+        },
+        "TEST": {"NAME": os.path.join(BASE_DIR, "test_db.sqlite3")},
     }
 }
 DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
@@ -130,5 +140,47 @@ USE_L10N = True
 USE_TZ = True
 APPEND_SLASH = False
 
+# Application caches. "lru" keeps an in-process LRU in each worker, which
+# only sees invalidations made by that worker, so multi-process
+# deployments should name a shared cache from CACHES instead.
+BANGAZON_CACHES = {
+    "products": {"BACKEND": "lru", "MAX_ENTRIES": 10000},
+    "facets": {"BACKEND": "lru", "MAX_ENTRIES": 1000, "TIMEOUT": 30},
+    "favorites": {"BACKEND": "lru", "MAX_ENTRIES": 10000},
+    "carts": {"BACKEND": "lru", "MAX_ENTRIES": 10000},
+    "reports": {"BACKEND": "lru", "MAX_ENTRIES": 500, "TIMEOUT": 300},
+    "analytics": {"BACKEND": "lru", "MAX_ENTRIES": 1000, "TIMEOUT": 300},
+}
+
+# Rendered HTML reports are fresh for one bucket of this many seconds and
+# served stale during the next one while a background thread rebuilds them.
+# `warm_report_cache` builds them ahead of viewers; with the "lru" backend
+# above that only helps the process running it, so point "reports" at a
+# shared cache to pre-warm for every worker.
+REPORT_CACHE_BUCKET_SECONDS = 60
+
+# Open carts. "database" writes every cart edit straight to Order and
+# OrderProduct. "write-behind" serves carts from the "carts" cache above and
+# writes edits back every FLUSH_INTERVAL seconds (0 for never), once
+# MAX_DIRTY carts are waiting, at checkout and at exit. Edits not yet
+# written back are lost if the process is killed. See bangazonapi/carts.py.
+CART_STORE = {"MODE": "database", "FLUSH_INTERVAL": 5, "MAX_DIRTY": 100}
+
+# Upper bounds of the price ranges counted by /products/facets. A final
+# open-ended range covers everything above the last bound.
+PRODUCT_PRICE_BUCKETS = (25, 50, 100, 500, 1000)
+
+# Product image uploads are rendered by WORKERS processes off the request
+# thread (0 renders them inline). Once MAX_PENDING uploads are queued, new
+# uploads get a 503 until a worker frees up.
+IMAGE_PROCESSING = {"WORKERS": 2, "MAX_PENDING": 16}
+
+# Daily sales rollups (bangazonapi/rollups.py). `rollup_sales` folds in
+# orders paid up to LAG_SECONDS ago, leaving time for checkouts still
+# committing, and `rollup_sales --rebuild` splits the work across WORKERS
+# processes, started with START_METHOD ("fork", "spawn" or "forkserver";
+# None for the platform's default).
+SALES_ROLLUP = {"LAG_SECONDS": 60, "WORKERS": 4, "START_METHOD": None}
+
 MEDIA_ROOT = "media"
 MEDIA_URL = "/media/"
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class BangazonapiConfig(AppConfig):
     name = 'bangazonapi'
+
+    def ready(self):
+        # Connect the signal handlers that maintain denormalized data
+        from bangazonapi import signals  # pylint: disable=import-outside-toplevel
+
+        post_migrate.connect(signals.create_search_index, sender=self)
@@ -0,0 +1,22 @@
+from django.conf import settings
+from .backends import DjangoCache, LRUCache, get_backend
+from .favorites import FavoriteSellers
+from .reports import ReportCache
+from .versioned import VersionedCache
+
+# Serialized ProductSerializer output, bumped by the signal handlers
+product_cache = VersionedCache("product", get_backend("products"))
+
+# Facet counts per filter signature, expired by TIMEOUT rather than bumped
+facet_cache = get_backend("facets")
+
+# Seller analytics per store and window, expired by TIMEOUT
+analytics_cache = get_backend("analytics")
+
+# Favorite seller ids per user, forgotten by the favoritesellers handlers
+favorite_sellers = FavoriteSellers(get_backend("favorites"))
+
+# Rendered reports per time bucket, served stale while a thread refreshes them
+report_cache = ReportCache(
+    get_backend("reports"), getattr(settings, "REPORT_CACHE_BUCKET_SECONDS", 60)
+)
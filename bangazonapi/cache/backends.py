@@ -0,0 +1,122 @@
+"""Storage backends for the application caches"""
+
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+
+# Use the backend's own timeout (None means entries never expire)
+DEFAULT_TIMEOUT = object()
+
+
+class LRUCache:
+    """Thread-safe, in-process least recently used cache
+
+    Entries live in the worker that wrote them, so only use it where each
+    process may hold its own copy, e.g. a single-process deployment or
+    data that is versioned per process.
+
+    Arguments:
+        max_entries {int} -- Entries kept before the oldest are evicted
+        timeout {int} -- Default lifetime of an entry in seconds, None to keep it
+    """
+
+    def __init__(self, max_entries=10000, timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key, self)
+            if value is not self:
+                found[key] = value
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.timeout
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        for key, value in data.items():
+            self.set(key, value, timeout)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCache:
+    """Adapter for a cache configured in settings.CACHES
+
+    Arguments:
+        alias {str} -- Name of the Django cache to use
+        timeout {int} -- Default lifetime of an entry in seconds, None to keep it
+    """
+
+    def __init__(self, alias="default", timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.cache.set(key, value, self.timeout if timeout is DEFAULT_TIMEOUT else timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT):
+        self.cache.set_many(data, self.timeout if timeout is DEFAULT_TIMEOUT else timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def get_backend(name):
+    """Build the backend configured for `name` in settings.BANGAZON_CACHES
+
+    A BACKEND of "lru" (the default) is an in-process LRUCache. Any other
+    value names a Django cache alias from settings.CACHES. TIMEOUT is the
+    default entry lifetime in seconds; leave it out to keep entries until
+    they are evicted.
+    """
+    options = getattr(settings, "BANGAZON_CACHES", {}).get(name, {})
+    backend = options.get("BACKEND", "lru")
+    timeout = options.get("TIMEOUT", None)
+    if backend == "lru":
+        return LRUCache(max_entries=options.get("MAX_ENTRIES", 10000), timeout=timeout)
+    return DjangoCache(alias=backend, timeout=timeout)
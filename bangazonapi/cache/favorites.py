@@ -0,0 +1,36 @@
+"""Cached set of the sellers each user has favorited"""
+
+from bangazonapi.models import Favorite
+
+
+class FavoriteSellers:
+    """Each user's favorite seller ids, cached as a frozenset
+
+    Sets are keyed by user id rather than customer id so views can look
+    them up from request.user without loading the Customer first. Any
+    code that adds or removes a Favorite must call forget() afterwards.
+
+    Arguments:
+        backend {LRUCache|DjangoCache} -- Where the sets live
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def _key(user_id):
+        return f"favorites:{user_id}"
+
+    def ids(self, user_id):
+        """Customer ids of the sellers `user_id` has favorited"""
+        sellers = self.backend.get(self._key(user_id))
+        if sellers is None:
+            sellers = frozenset(
+                Favorite.objects.filter(customer__user_id=user_id).values_list("seller_id", flat=True)
+            )
+            self.backend.set(self._key(user_id), sellers)
+        return sellers
+
+    def forget(self, user_id):
+        """Drop a user's cached set after their favorites change"""
+        self.backend.delete(self._key(user_id))
@@ -0,0 +1,111 @@
+"""Rendered reports cached per time bucket and refreshed in the background"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from django.db import close_old_connections, connection
+
+logger = logging.getLogger(__name__)
+
+
+class ReportCache:
+    """Reports keyed by name, parameters and time bucket
+
+    A report built during a bucket is fresh for the rest of it. In the
+    next bucket the previous copy is served stale while one background
+    thread rebuilds it; after that the report is rebuilt on request. Only
+    one build per key runs at a time in a process: concurrent requests for
+    a report being built wait for it rather than building it again.
+
+    The backend's TIMEOUT must cover at least two buckets, or stale copies
+    expire before they can be served.
+
+    Arguments:
+        backend {LRUCache|DjangoCache} -- Where rendered reports live
+        bucket_seconds {int} -- Length of a time bucket
+        clock {callable} -- Returns the current time in seconds
+    """
+
+    def __init__(self, backend, bucket_seconds=60, clock=time.time):
+        self.backend = backend
+        self.bucket_seconds = bucket_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._building = {}
+
+    def key(self, name, params, bucket):
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return f"report:{name}:{digest}:{bucket}"
+
+    def bucket(self):
+        return int(self.clock() // self.bucket_seconds)
+
+    def get(self, name, params, build):
+        """Cached report, stale while revalidating, or built now on a miss
+
+        Arguments:
+            name {str} -- Report name
+            params {dict} -- Parameters the report depends on
+            build {callable} -- Builds the report; runs in a thread when refreshing
+        """
+        bucket = self.bucket()
+        key = self.key(name, params, bucket)
+        value = self.backend.get(key)
+        if value is not None:
+            return value
+
+        stale = self.backend.get(self.key(name, params, bucket - 1))
+        if stale is None:
+            return self._build(key, build)
+
+        with self._lock:
+            starting = key not in self._building
+            if starting:
+                self._building[key] = threading.Event()
+        if starting:
+            threading.Thread(
+                target=self._refresh, args=(key, build), name="report-refresh", daemon=True
+            ).start()
+        return stale
+
+    def warm(self, name, params, build):
+        """Build a report for the current bucket now, replacing any copy"""
+        key = self.key(name, params, self.bucket())
+        value = build()
+        self.backend.set(key, value)
+        return value
+
+    def _build(self, key, build):
+        """Build on this thread, or wait for the build already running"""
+        with self._lock:
+            running = self._building.get(key, None)
+            if running is None:
+                self._building[key] = threading.Event()
+
+        if running is not None:
+            running.wait(timeout=30)
+            value = self.backend.get(key)
+            return value if value is not None else build()
+
+        try:
+            value = build()
+            self.backend.set(key, value)
+            return value
+        finally:
+            self._done(key)
+
+    def _refresh(self, key, build):
+        close_old_connections()
+        try:
+            self.backend.set(key, build())
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Refreshing report %s failed", key)
+        finally:
+            self._done(key)
+            connection.close()
+
+    def _done(self, key):
+        with self._lock:
+            self._building.pop(key).set()
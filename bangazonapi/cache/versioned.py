@@ -0,0 +1,94 @@
+"""Read-through cache of serialized objects keyed by id and version"""
+
+import threading
+import uuid
+
+
+class VersionedCache:
+    """Cache of serialized payloads that is invalidated by version bumps
+
+    Every object id has a version token stored next to its payloads.
+    Payloads are stored under (id, version, variant), so bumping the
+    version makes every cached copy of the object unreachable without
+    having to find and delete them. A version that was evicted is simply
+    replaced with a fresh token, so eviction can never resurrect an old
+    payload.
+
+    Arguments:
+        namespace {str} -- Prefix that keeps keys apart from other caches
+        backend {LRUCache|DjangoCache} -- Where versions and payloads live
+    """
+
+    def __init__(self, namespace, backend):
+        self.namespace = namespace
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _version_key(self, pk):
+        return f"{self.namespace}:version:{pk}"
+
+    def _payload_key(self, pk, version, variant):
+        return f"{self.namespace}:{pk}:{version}:{variant}"
+
+    def versions(self, pks):
+        """Current version token for each id, creating any that are missing
+
+        Returns:
+            dict -- Version token keyed by id
+        """
+        keys = {self._version_key(pk): pk for pk in pks}
+        stored = self.backend.get_many(list(keys))
+        versions = {keys[key]: version for key, version in stored.items()}
+
+        created = {}
+        for key, pk in keys.items():
+            if pk not in versions:
+                versions[pk] = created[key] = uuid.uuid4().hex
+        if created:
+            self.backend.set_many(created)
+        return versions
+
+    def bump(self, *pks):
+        """Invalidate every cached payload for the given ids"""
+        self.backend.set_many({self._version_key(pk): uuid.uuid4().hex for pk in pks})
+
+    def get_many(self, pks, variant=""):
+        """Cached payloads for the given ids
+
+        Returns:
+            tuple -- (payloads keyed by id, versions keyed by id)
+        """
+        versions = self.versions(pks)
+        keys = {self._payload_key(pk, versions[pk], variant): pk for pk in pks}
+        stored = self.backend.get_many(list(keys))
+        payloads = {keys[key]: payload for key, payload in stored.items()}
+
+        with self._lock:
+            self.hits += len(payloads)
+            self.misses += len(keys) - len(payloads)
+        return payloads, versions
+
+    def set_many(self, payloads, versions, variant=""):
+        """Store payloads under the versions returned by get_many()"""
+        self.backend.set_many(
+            {
+                self._payload_key(pk, versions[pk], variant): payload
+                for pk, payload in payloads.items()
+            }
+        )
+
+    def stats(self):
+        """Hit and miss counters since the process started"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
@@ -0,0 +1,332 @@
+"""Write-behind storage for open carts
+
+With settings.CART_STORE["MODE"] set to "write-behind", each user's open
+cart is kept in the "carts" cache from BANGAZON_CACHES and cart reads and
+edits are served from there. Edited carts are also pinned in the process
+that made the edit until they are written back to Order/OrderProduct, so
+cache eviction never drops an unsaved edit. They are written back in
+batches:
+
+- every FLUSH_INTERVAL seconds by a background thread (0 turns it off),
+- as soon as MAX_DIRTY carts are waiting,
+- synchronously at checkout, before the order is priced and paid,
+- when the process exits normally.
+
+Durability: an acknowledged edit that is still waiting is lost if the
+process is killed, so up to FLUSH_INTERVAL seconds of cart changes are
+at risk. Checkout always sees every edit made through its own process.
+The open Order row itself is created synchronously on the first add, so
+its id is stable. Until a flush, the database copy of the cart (used by
+reports and /orders/:id) lags the cached one. With a shared Django cache,
+edits to the same cart from two processes at the same moment can
+overwrite each other.
+
+Use "database" mode (the default) to write every edit straight through.
+"""
+
+import atexit
+import copy
+import datetime
+import logging
+import threading
+import time
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from bangazonapi.cache import get_backend
+from bangazonapi.models import Customer, Order, OrderProduct
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {"MODE": "database", "FLUSH_INTERVAL": 5, "MAX_DIRTY": 100}
+
+_lock = threading.Lock()
+_store = None
+
+
+def get_store():
+    """The configured WriteBehindCarts, or None in "database" mode"""
+    global _store  # pylint: disable=global-statement
+    options = {**DEFAULTS, **getattr(settings, "CART_STORE", {})}
+    if options["MODE"] != "write-behind":
+        return None
+    with _lock:
+        if _store is None:
+            _store = WriteBehindCarts(
+                get_backend("carts"), options["FLUSH_INTERVAL"], options["MAX_DIRTY"]
+            )
+        return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    """Rebuild the store when tests override its settings"""
+    global _store  # pylint: disable=global-statement
+    if setting in ("CART_STORE", "BANGAZON_CACHES"):
+        with _lock:
+            _store = None
+
+
+class WriteBehindCarts:
+    """Open carts served from a cache and written back in batches
+
+    A cart is a dict holding the customer id, the open order's id and
+    created date, and its lines keyed by product id with the line id
+    (None until written), quantity and unit price.
+
+    Arguments:
+        backend {LRUCache|DjangoCache} -- Where carts are cached
+        flush_interval {int} -- Seconds between background flushes, 0 for none
+        max_dirty {int} -- Waiting carts that trigger an immediate flush
+    """
+
+    def __init__(self, backend, flush_interval=5, max_dirty=100):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self._pending = {}
+        self._lock = threading.RLock()
+        # Held for a whole flush. checkout() takes it too, so a cart the
+        # background flusher already picked up is written before payment.
+        # Never acquire it while holding _lock.
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+
+    @staticmethod
+    def _key(user_id):
+        return f"cart:{user_id}"
+
+    def get(self, user):
+        """The user's open cart, loaded from the database on a miss"""
+        with self._lock:
+            cart = self._pending.get(user.id, None) or self.backend.get(self._key(user.id))
+            if cart is None:
+                cart = self._load(user)
+                self.backend.set(self._key(user.id), cart)
+            return cart
+
+    @staticmethod
+    def _load(user):
+        customer_id = Customer.objects.filter(user=user).values_list("id", flat=True).get()
+        order = Order.objects.filter(customer_id=customer_id, payment_type__isnull=True).first()
+        cart = {"customer_id": customer_id, "order_id": None, "created_date": None, "lines": {}}
+        if order is None:
+            return cart
+
+        cart["order_id"] = order.id
+        cart["created_date"] = str(order.created_date)
+        for line in order.lineitems.all():
+            cart["lines"][line.product_id] = {
+                "id": line.id,
+                "quantity": line.quantity,
+                "unit_price": line.unit_price,
+            }
+        return cart
+
+    def _edited(self, user, cart):
+        """Cache an edited cart and hold it until it is written back
+
+        Returns:
+            bool -- True once MAX_DIRTY carts are waiting; the caller
+                flushes after letting go of the lock
+        """
+        self.backend.set(self._key(user.id), cart)
+        self._pending[user.id] = cart
+        self._start_flusher()
+        return len(self._pending) >= self.max_dirty
+
+    def add(self, user, product, quantity=1):
+        """Add units of a product, opening the order if there is none"""
+        self.edit(user, {product: quantity})
+
+    def remove(self, user, product_id, quantity=1):
+        """Take units of a product off the cart
+
+        Returns:
+            bool -- False when the product is not in the cart
+        """
+        return not self.edit(user, removed={product_id: quantity})
+
+    def edit(self, user, added=None, removed=None):
+        """Apply several cart changes as one edit
+
+        Arguments:
+            added {dict} -- Units to add keyed by Product
+            removed {dict} -- Units to take off keyed by product id, None for the whole line
+
+        Returns:
+            set -- Ids in `removed` that were not in the cart
+        """
+        added = added or {}
+        removed = removed or {}
+        full = False
+        with self._lock:
+            cart = self.get(user)
+            if added and cart["order_id"] is None:
+                order = Order.objects.create(
+                    customer_id=cart["customer_id"], created_date=datetime.datetime.now()
+                )
+                cart["order_id"] = order.id
+                cart["created_date"] = str(order.created_date)[:10]
+
+            for product, quantity in added.items():
+                line = cart["lines"].setdefault(
+                    product.pk, {"id": None, "quantity": 0, "unit_price": product.price}
+                )
+                line["quantity"] += quantity
+
+            missing = set()
+            for product_id, quantity in removed.items():
+                line = cart["lines"].get(product_id, None)
+                if line is None:
+                    missing.add(product_id)
+                    continue
+                line["quantity"] = 0 if quantity is None else line["quantity"] - quantity
+                if line["quantity"] <= 0:
+                    del cart["lines"][product_id]
+
+            if len(missing) < len(removed) or added:
+                full = self._edited(user, cart)
+        if full:
+            self.flush()
+        return missing
+
+    def clear(self, user):
+        """Delete the open order and its lines right away
+
+        Returns:
+            bool -- False when there was no open order
+        """
+        with self._lock:
+            cart = self.get(user)
+            self.forget(user.id)
+            if cart["order_id"] is None:
+                return False
+            with transaction.atomic():
+                OrderProduct.objects.filter(order_id=cart["order_id"]).delete()
+                Order.objects.filter(pk=cart["order_id"], payment_type__isnull=True).delete()
+            return True
+
+    def checkout(self, user):
+        """Write the user's cart back before it is paid for, then drop it
+
+        Waits for a flush already in progress, which may hold this cart.
+        """
+        self.flush([user.id])
+        self.forget(user.id)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self.backend.delete(self._key(user_id))
+
+    def flush(self, user_ids=None):
+        """Write waiting carts to the database in one transaction
+
+        Carts whose order was paid or deleted in the meantime are dropped.
+        Each cart is copied when it is taken, so edits made while it is
+        being written wait for the next flush.
+
+        Returns:
+            int -- Number of carts written
+        """
+        with self._flush_lock:
+            with self._lock:
+                wanted = list(self._pending) if user_ids is None else user_ids
+                carts = {
+                    uid: copy.deepcopy(self._pending.pop(uid))
+                    for uid in wanted
+                    if uid in self._pending
+                }
+            if not carts:
+                return 0
+
+            try:
+                return self._write(carts)
+            except Exception:
+                with self._lock:
+                    for uid, cart in carts.items():
+                        self._pending.setdefault(uid, cart)
+                raise
+
+    def _write(self, carts):
+        order_ids = [cart["order_id"] for cart in carts.values()]
+        with transaction.atomic():
+            # Checked under the row locks, so an order paid in the meantime
+            # is never given lines after it was priced
+            open_orders = set(
+                Order.objects.select_for_update()
+                .filter(pk__in=order_ids, payment_type__isnull=True)
+                .values_list("id", flat=True)
+            )
+            carts = {
+                uid: cart for uid, cart in carts.items() if cart["order_id"] in open_orders
+            }
+            if not carts:
+                return 0
+
+            removed = Q()
+            lines = []
+            for cart in carts.values():
+                removed |= Q(order_id=cart["order_id"]) & ~Q(product_id__in=list(cart["lines"]))
+                lines += [
+                    OrderProduct(
+                        order_id=cart["order_id"],
+                        product_id=product_id,
+                        quantity=line["quantity"],
+                        unit_price=line["unit_price"],
+                    )
+                    for product_id, line in cart["lines"].items()
+                ]
+
+            OrderProduct.objects.filter(removed).delete()
+            OrderProduct.objects.bulk_create(
+                lines,
+                update_conflicts=True,
+                unique_fields=["order", "product"],
+                update_fields=["quantity"],
+            )
+            ids = list(
+                OrderProduct.objects.filter(order_id__in=list(open_orders)).values_list(
+                    "order_id", "product_id", "id"
+                )
+            )
+
+        # Give newly written lines their ids in whatever the cache now holds
+        line_ids = {(order_id, product_id): pk for order_id, product_id, pk in ids}
+        with self._lock:
+            for uid in carts:
+                cart = self._pending.get(uid, None) or self.backend.get(self._key(uid))
+                if cart is None:
+                    continue
+                for product_id, line in cart["lines"].items():
+                    line["id"] = line_ids.get((cart["order_id"], product_id), line["id"])
+                self.backend.set(self._key(uid), cart)
+        return len(carts)
+
+    def _start_flusher(self):
+        if self.flush_interval and self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._run, name="cart-flusher", daemon=True
+            )
+            self._flusher.start()
+            atexit.register(self._flush_at_exit)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Writing carts back to the database failed")
+            finally:
+                connection.close()
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Carts waiting at exit could not be written")
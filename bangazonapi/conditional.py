@@ -0,0 +1,46 @@
+"""Conditional GET support driven by cheap version stamps"""
+
+import hashlib
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*stamp):
+    """Strong ETag for a representation identified by `stamp`
+
+    The stamp should hold everything the body depends on, e.g. the
+    request path and query string plus the modified dates and row counts
+    of the tables it is built from.
+    """
+    digest = hashlib.sha1(repr(stamp).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_response(request, build, stamp, last_modified=None):
+    """Answer a GET with 304 when the client's copy is still current
+
+    The stamp is checked against If-None-Match and If-Modified-Since
+    before `build` runs, so an unchanged resource is never serialized.
+
+    Arguments:
+        request {Request} -- Incoming request
+        build {callable} -- Returns the full Response when one is needed
+        stamp {tuple} -- Values that change whenever the body changes
+        last_modified {datetime} -- Newest modification among the rows used
+
+    Returns:
+        HttpResponse -- 304 Not Modified, or the built response
+    """
+    etag = make_etag(request.get_full_path(), *stamp)
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build()
+
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+        if timestamp is not None:
+            response["Last-Modified"] = http_date(timestamp)
+        patch_vary_headers(response, ("Authorization",))
+    return response
@@ -0,0 +1,85 @@
+"""Sparse fieldsets (?fields=) and on-demand relations (?expand=)"""
+
+from rest_framework.exceptions import ParseError
+
+
+def _names(request, param):
+    value = request.query_params.get(param, None)
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(",") if name.strip()}
+
+
+class Fieldset:
+    """Fields a serializer should render
+
+    Views build one from the query string with from_request(). Without
+    `fields` or `expand` every field is rendered, as before. With either,
+    only the chosen fields are kept: `fields` picks from all of the
+    serializer's fields and defaults to the ones that are not relations,
+    and `expand` adds relations listed in the serializer's
+    Meta.expandable_fields. Views check includes() before fetching a
+    relation, so anything left out is never queried.
+
+    Arguments:
+        fields {set} -- Field names to keep, None for all of them
+    """
+
+    def __init__(self, fields=None):
+        self.fields = None if fields is None else set(fields)
+
+    @classmethod
+    def from_request(cls, request, serializer_class):
+        """Fieldset for the request's `fields` and `expand` parameters
+
+        Arguments:
+            request {Request} -- Incoming request
+            serializer_class {type} -- Serializer using SparseFieldsMixin
+
+        Raises:
+            ParseError -- A requested field does not exist on the serializer
+        """
+        available = set(serializer_class.Meta.fields)
+        expandable = set(getattr(serializer_class.Meta, "expandable_fields", ()))
+        requested = _names(request, "fields")
+        expand = _names(request, "expand")
+
+        if requested is None and expand is None:
+            return cls()
+
+        selected = requested if requested is not None else available - expandable
+        selected |= expand or set()
+        unknown = selected - available
+        if unknown:
+            raise ParseError(
+                f"Unknown field(s): {', '.join(sorted(unknown))}. "
+                f"Choose from: {', '.join(sorted(available))}"
+            )
+        return cls(selected)
+
+    def includes(self, name):
+        """Whether the response will contain field `name`"""
+        return self.fields is None or name in self.fields
+
+    def project(self, payload):
+        """Copy of an already serialized dict holding only the chosen fields"""
+        if self.fields is None:
+            return payload
+        return {name: value for name, value in payload.items() if name in self.fields}
+
+
+class SparseFieldsMixin:
+    """Serializer mixin that drops the fields a Fieldset leaves out
+
+    Dropped fields are removed before serialization, so their
+    SerializerMethodFields, properties and nested serializers never run.
+
+    Keyword Arguments:
+        fieldset {Fieldset} -- Fields to keep; None keeps them all
+    """
+
+    def __init__(self, *args, fieldset=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fieldset is not None and fieldset.fields is not None:
+            for name in set(self.fields) - fieldset.fields:
+                self.fields.pop(name)
@@ -0,0 +1,6 @@
+"""Product image processing
+
+`transform` is pure Pillow code that runs inside worker processes and
+must not import Django. `pipeline` owns the process pool and writes the
+results back to storage and the product row.
+"""
@@ -0,0 +1,180 @@
+"""Process product image uploads off the request thread
+
+Uploads are rendered by `transform.process_image` in a bounded process
+pool. A small thread pool then writes the variants to storage and points
+the product at them, so requests only pay for queueing the upload.
+"""
+
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.signals import setting_changed
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.text import slugify
+from bangazonapi import profiles
+from bangazonapi.cache import product_cache
+from bangazonapi.models import Product
+from .transform import ImageRejected, process_image
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+_lock = threading.Lock()
+_workers = None
+_writers = None
+_slots = None
+
+
+def _options():
+    options = {"WORKERS": 2, "MAX_PENDING": 16}
+    options.update(getattr(settings, "IMAGE_PROCESSING", {}))
+    return options
+
+
+def _pools():
+    """Process pool, writer threads and pending-upload slots, made on first use"""
+    global _workers, _writers, _slots  # pylint: disable=global-statement
+    with _lock:
+        if _workers is None:
+            options = _options()
+            _workers = ProcessPoolExecutor(max_workers=options["WORKERS"])
+            _writers = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-writer")
+            _slots = threading.BoundedSemaphore(options["MAX_PENDING"])
+    return _workers, _writers, _slots
+
+
+@receiver(setting_changed)
+def reset_pools(setting, **kwargs):
+    """Start fresh pools when tests override IMAGE_PROCESSING"""
+    global _workers, _writers, _slots  # pylint: disable=global-statement
+    if setting != "IMAGE_PROCESSING":
+        return
+    with _lock:
+        if _workers is not None:
+            _workers.shutdown(wait=False)
+            _writers.shutdown(wait=False)
+        _workers = _writers = _slots = None
+
+
+class Slot:
+    """A place in the upload queue, held from reserve() until the job is stored"""
+
+    def __init__(self, semaphore=None):
+        self._semaphore = semaphore
+        self._lock = threading.Lock()
+
+    def release(self):
+        """Give the place back; only the first call has any effect"""
+        with self._lock:
+            semaphore, self._semaphore = self._semaphore, None
+        if semaphore is not None:
+            semaphore.release()
+
+
+def parse_data_url(data_url):
+    """Base64 payload of a `data:image/...;base64,` upload"""
+    header, separator, encoded = str(data_url).partition(";base64,")
+    if not separator or not header.startswith("data:image/"):
+        raise ImageRejected("image_path must be a base64 encoded image data URL")
+    return encoded
+
+
+def reserve():
+    """Claim a place for an upload without waiting
+
+    Returns:
+        Slot -- To pass to submit(), or release() if the upload is dropped;
+            None when MAX_PENDING uploads are already queued
+    """
+    if _options()["WORKERS"] == 0:
+        return Slot()
+    _, _, slots = _pools()
+    if not slots.acquire(blocking=False):
+        return None
+    return Slot(slots)
+
+
+def submit(product, encoded, slot):
+    """Queue an upload for a saved product and mark its image pending
+
+    With IMAGE_PROCESSING["WORKERS"] set to 0 the upload is processed
+    before returning instead, which is handy for tests and scripts.
+
+    Arguments:
+        product {Product} -- Product the image belongs to, already saved
+        encoded {str} -- Base64 payload from parse_data_url()
+        slot {Slot} -- Place from reserve(), released once the job is stored
+    """
+    try:
+        basename = slugify(product.name)[:40] or "product"
+        Product.all_objects.filter(pk=product.pk).update(image_status=PENDING)
+        product.image_status = PENDING
+        product_cache.bump(product.pk)
+
+        if _options()["WORKERS"] == 0:
+            _store(product.pk, basename, _render(encoded))
+            product.refresh_from_db()
+            slot.release()
+            return
+
+        workers, writers, _ = _pools()
+        future = workers.submit(process_image, encoded)
+    except BaseException:
+        slot.release()
+        raise
+    future.add_done_callback(
+        lambda done: writers.submit(_finish, product.pk, basename, done, slot)
+    )
+
+
+def _render(encoded):
+    try:
+        return process_image(encoded)
+    except ImageRejected as ex:
+        return ex
+
+
+def _finish(product_id, basename, future, slot):
+    """Writer thread: store a finished job and free its slot"""
+    close_old_connections()
+    try:
+        exception = future.exception()
+        _store(product_id, basename, exception if exception else future.result())
+    finally:
+        slot.release()
+        connection.close()
+
+
+def _store(product_id, basename, variants):
+    """Save rendered variants and point the product at them"""
+    if isinstance(variants, BaseException):
+        logger.warning("Image for product %s was rejected: %s", product_id, variants)
+        Product.all_objects.filter(pk=product_id).update(
+            image_status=FAILED, modified_date=timezone.now()
+        )
+        product_cache.bump(product_id)
+        return
+
+    paths = {}
+    for name, (extension, data) in variants.items():
+        paths[name] = default_storage.save(
+            f"products/{product_id}-{basename}-{name}.{extension}", ContentFile(data)
+        )
+
+    Product.all_objects.filter(pk=product_id).update(
+        image_path=paths.pop("original"),
+        image_variants=paths,
+        image_status=READY,
+        modified_date=timezone.now(),
+    )
+    product_cache.bump(product_id)
+    # update() sends no post_save, so drop the profiles showing the old image
+    profiles.forget_product(product_id)
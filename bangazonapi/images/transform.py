@@ -0,0 +1,97 @@
+"""Validate uploaded images and render their stored variants
+
+Runs in worker processes, so it only depends on Pillow.
+"""
+
+import base64
+import binascii
+import io
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+# Longest edge, in pixels, of each generated thumbnail
+THUMBNAIL_SIZES = (150, 600)
+
+ACCEPTED_FORMATS = ("JPEG", "PNG", "GIF", "WEBP")
+MAX_BYTES = 10 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+WEBP_QUALITY = 80
+
+
+class ImageRejected(ValueError):
+    """Raised when an upload is not an image we are willing to store"""
+
+
+def decode(encoded):
+    """Bytes of a base64 payload, enforcing the upload size limit"""
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError) as ex:
+        raise ImageRejected("Image is not valid base64") from ex
+    if len(data) > MAX_BYTES:
+        raise ImageRejected(f"Image is larger than {MAX_BYTES // (1024 * 1024)} MB")
+    return data
+
+
+def load(data):
+    """Open and fully decode an upload, rejecting anything suspicious"""
+    try:
+        with Image.open(io.BytesIO(data)) as probe:
+            if probe.format not in ACCEPTED_FORMATS:
+                raise ImageRejected(f"Unsupported image format {probe.format}")
+            if probe.width * probe.height > MAX_PIXELS:
+                raise ImageRejected("Image has too many pixels")
+            probe.verify()
+
+        # verify() leaves the image unusable, so decode it again
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError) as ex:
+        raise ImageRejected("File is not a readable image") from ex
+    return image
+
+
+def strip(image):
+    """Copy of the image upright and without EXIF, ICC or text metadata"""
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+    image.info = {}
+    image.format = source_format
+    return image
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        image.convert("RGB").save(buffer, "JPEG", quality=85, optimize=True)
+    elif image_format == "WEBP":
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+    else:
+        image.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def process_image(encoded):
+    """Render every stored variant of a base64 encoded upload
+
+    The original is re-encoded from its pixels, which drops metadata such
+    as GPS coordinates, and each thumbnail size is produced both in the
+    upload's own family (JPEG, otherwise PNG) and as WebP.
+
+    Returns:
+        dict -- (file extension, bytes) keyed by variant name
+    """
+    image = strip(load(decode(encoded)))
+    image_format, extension = ("JPEG", "jpg") if image.format == "JPEG" else ("PNG", "png")
+
+    variants = {
+        "original": (extension, encode(image, image_format)),
+        "original_webp": ("webp", encode(image, "WEBP")),
+    }
+    for size in THUMBNAIL_SIZES:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[f"thumb_{size}"] = (extension, encode(thumbnail, image_format))
+        variants[f"thumb_{size}_webp"] = ("webp", encode(thumbnail, "WEBP"))
+    return variants
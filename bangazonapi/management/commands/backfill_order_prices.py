@@ -0,0 +1,32 @@
+"""Fill in line item prices and order subtotals recorded before checkout stored them"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Round
+from bangazonapi.models import Order, OrderProduct, Product
+
+
+class Command(BaseCommand):
+    help = "Copy current product prices onto unpriced line items and store paid orders' subtotals"
+
+    def handle(self, *args, **options):
+        price = Product.all_objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+        subtotal = (
+            OrderProduct.objects.filter(order=OuterRef("pk"))
+            .values("order")
+            .annotate(total=Sum(F("unit_price") * F("quantity")))
+            .values("total")
+        )
+
+        with transaction.atomic():
+            lines = OrderProduct.objects.filter(unit_price__isnull=True).update(
+                unit_price=Subquery(price)
+            )
+            orders = Order.objects.filter(
+                payment_type__isnull=False, subtotal__isnull=True
+            ).update(subtotal=Round(Coalesce(Subquery(subtotal), 0.0), 2))
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Priced {lines} line items and stored {orders} order subtotals")
+        )
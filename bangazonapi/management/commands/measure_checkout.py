@@ -0,0 +1,163 @@
+"""Measure checkout latency with many buyers paying at once"""
+
+import math
+import threading
+import time
+import uuid
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from safedelete.models import HARD_DELETE
+from bangazonapi.models import Customer, Order, OrderProduct, Payment, Product, ProductCategory
+
+
+def percentile(ordered, share):
+    """Nearest-rank percentile of an ascending list"""
+    return ordered[max(0, math.ceil(len(ordered) * share / 100) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Check out orders from several threads at once through PUT /orders/:id and report "
+        "latency percentiles. Creates throwaway buyers, products and orders and deletes them "
+        "afterwards. Run against a copy of the database, not one serving traffic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buyers", type=int, default=8, help="Buyers checking out in parallel")
+        parser.add_argument("--orders", type=int, default=10, help="Orders per buyer")
+        parser.add_argument("--items", type=int, default=3, help="Products per order")
+        parser.add_argument(
+            "--stock",
+            type=int,
+            default=None,
+            help="Units of each product; less than buyers * orders forces out-of-stock failures",
+        )
+
+    def handle(self, *args, **options):
+        category = ProductCategory.objects.first()
+        if category is None:
+            raise CommandError("Load at least one product category first")
+
+        buyers, orders, items = options["buyers"], options["orders"], options["items"]
+        stock = options["stock"] if options["stock"] is not None else buyers * orders
+        tag = uuid.uuid4().hex[:8]
+
+        users = [
+            User.objects.create(username=f"checkout-{tag}-{number}") for number in range(buyers)
+        ]
+        try:
+            plans = self.prepare(users, category, stock, orders, items)
+            latencies, outcomes, elapsed = self.run(plans)
+        finally:
+            self.clean_up(users)
+
+        journal = self.journal_mode()
+        latencies.sort()
+        self.stdout.write(
+            f"{len(latencies)} checkouts from {buyers} threads in {elapsed:.2f}s "
+            f"({len(latencies) / elapsed:.1f}/s), {connection.vendor} journal_mode={journal}"
+        )
+        self.stdout.write(
+            "latency ms: "
+            + "  ".join(
+                f"p{share} {1000 * percentile(latencies, share):.1f}" for share in (50, 95, 99)
+            )
+            + f"  max {1000 * latencies[-1]:.1f}"
+        )
+        self.stdout.write(
+            ", ".join(f"{count} x HTTP {code}" for code, count in sorted(outcomes.items()))
+        )
+
+    @staticmethod
+    def prepare(users, category, stock, orders, items):
+        """Token plus (order id, payment id) pairs to check out, per buyer"""
+        customers = [
+            Customer.objects.create(user=user, phone_number="555-1212", address="1 Way")
+            for user in users
+        ]
+        products = [
+            Product.objects.create(
+                name=f"Checkout load {number}",
+                customer=customers[0],
+                price=9.99,
+                description="Created by measure_checkout",
+                quantity=stock,
+                category=category,
+                location="Nashville",
+            )
+            for number in range(items)
+        ]
+
+        plans = []
+        for customer in customers:
+            payment = Payment.objects.create(
+                merchant_name="Load",
+                account_number="4111111111",
+                expiration_date="2030-01-01",
+                customer=customer,
+            )
+            pairs = []
+            for _ in range(orders):
+                order = Order.objects.create(customer=customer, created_date="2024-01-01")
+                OrderProduct.objects.bulk_create(
+                    [
+                        OrderProduct(order=order, product=product, unit_price=product.price)
+                        for product in products
+                    ]
+                )
+                pairs.append((order.id, payment.id))
+            plans.append((Token.objects.create(user=customer.user).key, pairs))
+        return plans
+
+    @staticmethod
+    def run(plans):
+        latencies, outcomes = [], {}
+        lock = threading.Lock()
+        start = threading.Barrier(len(plans))
+
+        def buyer(token, pairs):
+            client = APIClient(SERVER_NAME="localhost")
+            client.credentials(HTTP_AUTHORIZATION="Token " + token)
+            start.wait()
+            try:
+                for order_id, payment_id in pairs:
+                    began = time.perf_counter()
+                    response = client.put(
+                        f"/orders/{order_id}", {"payment_type": payment_id}, format="json"
+                    )
+                    took = time.perf_counter() - began
+                    with lock:
+                        latencies.append(took)
+                        outcomes[response.status_code] = outcomes.get(response.status_code, 0) + 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buyer, args=plan) for plan in plans]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, outcomes, time.perf_counter() - began
+
+    @staticmethod
+    def clean_up(users):
+        customers = Customer.objects.filter(user__in=users)
+        OrderProduct.objects.filter(order__customer__in=customers).delete()
+        Order.objects.filter(customer__in=customers).delete()
+        Payment.all_objects.filter(customer__in=customers).delete(force_policy=HARD_DELETE)
+        Product.all_objects.filter(customer__in=customers).delete(force_policy=HARD_DELETE)
+        Token.objects.filter(user__in=users).delete()
+        customers.delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    @staticmethod
+    def journal_mode():
+        if connection.vendor != "sqlite":
+            return "n/a"
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            return cursor.fetchone()[0]
@@ -0,0 +1,37 @@
+"""Merge duplicate line items into one row per order and product"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from bangazonapi.models import OrderProduct
+
+
+class Command(BaseCommand):
+    help = (
+        "Collapse repeated (order, product) line items into a single row with a quantity. "
+        "Run on databases from before OrderProduct.quantity, ahead of adding its unique constraint."
+    )
+
+    def handle(self, *args, **options):
+        duplicates = (
+            OrderProduct.objects.values("order", "product")
+            .annotate(rows=Count("id"), keep=Min("id"), units=Sum("quantity"))
+            .filter(rows__gt=1)
+            .order_by()
+        )
+
+        merged = removed = 0
+        with transaction.atomic():
+            for group in duplicates:
+                OrderProduct.objects.filter(pk=group["keep"]).update(quantity=group["units"])
+                deleted, _ = (
+                    OrderProduct.objects.filter(order=group["order"], product=group["product"])
+                    .exclude(pk=group["keep"])
+                    .delete()
+                )
+                merged += 1
+                removed += deleted
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Merged {merged} line items, removing {removed} duplicate rows")
+        )
@@ -0,0 +1,33 @@
+"""Rebuild stored profile snapshots"""
+
+from django.core.management.base import BaseCommand
+from bangazonapi.models import Customer, ProfileSnapshot
+from bangazonapi.profiles import build_snapshot
+
+
+class Command(BaseCommand):
+    help = "Re-render ProfileSnapshot rows; missing ones are otherwise built on first read"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "customers", nargs="*", type=int, help="Customer ids to rebuild (default: all)"
+        )
+        parser.add_argument(
+            "--drop", action="store_true", help="Delete the snapshots instead of rebuilding them"
+        )
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.select_related("user")
+        if options["customers"]:
+            customers = customers.filter(pk__in=options["customers"])
+
+        if options["drop"]:
+            deleted, _ = ProfileSnapshot.objects.filter(customer__in=customers).delete()
+            self.stdout.write(self.style.SUCCESS(f"Dropped {deleted} profile snapshots"))
+            return
+
+        count = 0
+        for customer in customers.iterator():
+            build_snapshot(customer)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} profile snapshots"))
@@ -0,0 +1,33 @@
+"""Rebuild every product's RatingAggregate from its ratings"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from bangazonapi.models import ProductRating, RatingAggregate
+
+
+class Command(BaseCommand):
+    help = "Recompute rating sums, counts and histograms from ProductRating"
+
+    def handle(self, *args, **options):
+        stars = {
+            f"stars_{score}": Count("id", filter=Q(rating=score))
+            for score in RatingAggregate.SCORES
+        }
+        totals = (
+            ProductRating.objects.values("product")
+            .annotate(rating_sum=Sum("rating"), rating_count=Count("id"), **stars)
+            .order_by()
+        )
+
+        aggregates = [
+            RatingAggregate(product_id=row.pop("product"), **row) for row in totals
+        ]
+
+        with transaction.atomic():
+            RatingAggregate.objects.all().delete()
+            RatingAggregate.objects.bulk_create(aggregates)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt rating aggregates for {len(aggregates)} products")
+        )
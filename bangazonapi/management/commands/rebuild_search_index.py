@@ -0,0 +1,15 @@
+"""Rebuild the full-text product search index"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from bangazonapi.queries import rebuild_product_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the FTS5 product search index from the product table"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            indexed = rebuild_product_index()
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products for search"))
@@ -0,0 +1,28 @@
+"""Rebuild the stored number_sold counter on every product"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from bangazonapi.models import OrderProduct, Product
+
+
+class Command(BaseCommand):
+    help = "Recount Product.number_sold from line items on completed orders"
+
+    def handle(self, *args, **options):
+        sold = (
+            OrderProduct.objects.filter(
+                product=OuterRef("pk"), order__payment_type__isnull=False
+            )
+            .values("product")
+            .annotate(units=Sum("quantity"))
+            .values("units")
+        )
+
+        with transaction.atomic():
+            updated = Product.all_objects.update(
+                number_sold=Coalesce(Subquery(sold), 0)
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sold counts for {updated} products"))
@@ -0,0 +1,36 @@
+"""Fold completed orders into the daily sales rollups"""
+
+from django.core.management.base import BaseCommand
+from bangazonapi import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Add orders paid since the last run to the daily sales rollups. "
+        "Rebuilds them from scratch on the first run or with --rebuild."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Recompute every day instead of only new orders"
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Processes for --rebuild (default SALES_ROLLUP['WORKERS'], 0 runs inline)",
+        )
+
+    def handle(self, *args, **options):
+        if not options["rebuild"]:
+            touched = rollups.roll_up()
+            if touched is not None:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Rolled up {touched} product days up to {rollups.watermark():%Y-%m-%d %H:%M:%S}"
+                    )
+                )
+                return
+
+        written = rollups.rebuild(options["workers"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt sales rollups with {written} product days"))
@@ -0,0 +1,49 @@
+"""Build cached HTML reports ahead of the people viewing them"""
+
+import time
+from django.core.management.base import BaseCommand, CommandError
+from bangazonapi.cache import report_cache
+from bangazonapi.views.report import HTML_REPORTS, render_report
+
+# Parameter sets dashboards ask for, per report
+DEFAULT_PARAMS = {
+    "orders": ({}, {"status": "complete"}, {"status": "incomplete"}),
+    "expensiveproducts": ({},),
+    "inexpensiveproducts": ({},),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Render reports into the report cache for the current time bucket. "
+        "Only useful across workers when BANGAZON_CACHES['reports'] names a shared cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "reports", nargs="*", help=f"Reports to warm (default: {', '.join(HTML_REPORTS)})"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running and re-warm at the start of every bucket",
+        )
+
+    def handle(self, *args, **options):
+        names = options["reports"] or list(HTML_REPORTS)
+        unknown = set(names) - set(HTML_REPORTS)
+        if unknown:
+            raise CommandError(f"Unknown report(s): {', '.join(sorted(unknown))}")
+
+        while True:
+            warmed = 0
+            for name in names:
+                for params in DEFAULT_PARAMS[name]:
+                    report_cache.warm(name, params, lambda: render_report(name, params))
+                    warmed += 1
+            self.stdout.write(self.style.SUCCESS(f"Warmed {warmed} reports"))
+            if not options["loop"]:
+                return
+
+            seconds = report_cache.bucket_seconds
+            time.sleep(seconds - report_cache.clock() % seconds)
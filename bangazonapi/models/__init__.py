@@ -1,5 +1,5 @@
 from .customer import Customer
-from .order import Order
+from .order import Order, OutOfStock
 from .orderproduct import OrderProduct
 from .payment import Payment
 from .product import Product
@@ -8,5 +8,8 @@ from .recommendation import Recommendation
 from .rating import Rating
 from .favorite import Favorite
 from .productrating import ProductRating
+from .ratingaggregate import RatingAggregate
 from .like import Like
 from .store import Store
+from .profilesnapshot import ProfileSnapshot
+from .salesrollup import DailyProductSales, DailySellerSales, DailyCategorySales, RollupWatermark
@@ -10,3 +10,10 @@ class Favorite(models.Model):
 
     customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING,)
     seller = models.ForeignKey(Customer, on_delete=models.DO_NOTHING, related_name='favorited_seller')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["customer", "seller"], name="unique_favorite_seller_per_customer"
+            )
+        ]
@@ -1,8 +1,29 @@
 """Customer order model"""
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
+from django.utils import timezone
 from .customer import Customer
 from .payment import Payment
+from .product import Product
+
+# Sent inside the checkout transaction with the completed order and the
+# ids of the products it sold.
+order_completed = Signal()
+
+
+class OutOfStock(Exception):
+    """Checkout failed because some line items want more units than are left
+
+    Arguments:
+        shortages {list} -- {product_id, name, requested, available} per product
+    """
+
+    def __init__(self, shortages):
+        super().__init__("Some items in this order are out of stock")
+        self.shortages = shortages
 
 
 class Order(models.Model):
@@ -14,14 +35,87 @@ class Order(models.Model):
     created_date = models.DateField(
         default="0000-00-00",
     )
+    # Sum of the line item prices, stored when the order is paid for
+    subtotal = models.FloatField(null=True, blank=True)
+    # When the order was paid for; null on open carts and on orders paid
+    # before it was recorded, whose sales are dated by created_date
+    completed_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     @property
     def total_price(self):
         """total_price property of an order
 
+        Paid orders read the subtotal stored at checkout. Open carts are
+        summed from their line items' recorded prices.
+
         Returns:
-            int -- Sum of the prices of all items in the order.
+            float -- Sum of the prices of all items in the order.
         """
-        line_items = self.lineitems.all()
-        total = sum(item.product.price for item in line_items)
-        return round(total, 2)
+        if self.subtotal is not None:
+            return self.subtotal
+        return self.line_total()
+
+    def line_total(self):
+        """Sum of unit price times quantity over the line items, in SQL
+
+        Lines without a recorded price fall back to the product's current
+        price.
+        """
+        total = self.lineitems.aggregate(
+            total=Sum(Coalesce("unit_price", "product__price") * F("quantity"))
+        )["total"]
+        return round(total or 0, 2)
+
+    def complete(self, payment_type):
+        """Pay for the order and record the sale of its line items
+
+        Stock and the sold counters on each product are updated in the
+        same transaction as the payment, and only the first time the order
+        is paid, so re-submitting a payment never double counts. The
+        order's subtotal is stored at the same time.
+
+        Arguments:
+            payment_type {Payment} -- Payment used to close the order
+
+        Raises:
+            OutOfStock -- A line wants more units than are in stock; nothing is saved
+        """
+        with transaction.atomic():
+            # Freeze prices on lines that predate unit_price being recorded
+            self.lineitems.filter(unit_price__isnull=True).update(
+                unit_price=Subquery(
+                    Product.all_objects.filter(pk=OuterRef("product_id")).values("price")[:1]
+                )
+            )
+            subtotal = self.line_total()
+            completed_at = timezone.now()
+
+            newly_paid = Order.objects.filter(
+                pk=self.pk, payment_type__isnull=True
+            ).update(payment_type=payment_type, subtotal=subtotal, completed_at=completed_at)
+            self.payment_type = payment_type
+
+            if not newly_paid:
+                self.save(update_fields=["payment_type"])
+                return
+
+            sold = self.lineitems.values("product").annotate(units=Sum("quantity"))
+            units_by_product = {row["product"]: row["units"] for row in sold}
+            shortages = Product.take_stock(units_by_product)
+            if shortages:
+                self.payment_type = None
+                raise OutOfStock(shortages)
+            Product.record_sales(units_by_product)
+            self.subtotal = subtotal
+            self.completed_at = completed_at
+
+            order_completed.send(
+                sender=Order, order=self, product_ids=list(units_by_product)
+            )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_date", "id"]),
+            # Order history: one customer's orders newest first, by date range
+            models.Index(fields=["customer", "created_date", "id"]),
+        ]
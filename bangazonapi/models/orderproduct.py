@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 
 
 class OrderProduct(models.Model):
@@ -10,3 +11,87 @@ class OrderProduct(models.Model):
     product = models.ForeignKey("Product",
                                 on_delete=models.DO_NOTHING,
                                 related_name="lineitems")
+
+    # Product price when the item went into the cart. Null on rows from
+    # before it was recorded until `backfill_order_prices` fills them.
+    unit_price = models.FloatField(null=True, blank=True)
+    quantity = models.PositiveIntegerField(default=1)
+
+    @classmethod
+    def add(cls, order, product, quantity=1):
+        """Add units of a product to an order, one row per product
+
+        Bumps the quantity of an existing line with a single UPDATE, or
+        inserts the line priced at the product's current price. A
+        concurrent insert of the same line falls back to the UPDATE.
+
+        Arguments:
+            order {Order} -- Open order to add to
+            product {Product} -- Product being added
+            quantity {int} -- Units to add
+        """
+        lines = cls.objects.filter(order=order, product=product)
+        if lines.update(quantity=F("quantity") + quantity):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    order=order, product=product, quantity=quantity, unit_price=product.price
+                )
+        except IntegrityError:
+            lines.update(quantity=F("quantity") + quantity)
+
+    @classmethod
+    def remove(cls, order, product_id, quantity=1):
+        """Take units of a product off an order, deleting the line at zero
+
+        Returns:
+            bool -- False when the order had no line for the product
+        """
+        lines = cls.objects.filter(order=order, product_id=product_id)
+        if lines.filter(quantity__gt=quantity).update(quantity=F("quantity") - quantity):
+            return True
+        deleted, _ = lines.delete()
+        return bool(deleted)
+
+    @classmethod
+    def apply(cls, order, added, removed):
+        """Apply many changes to an order's lines with one read and bulk writes
+
+        Call inside a transaction.
+
+        Arguments:
+            order {Order} -- Open order to change
+            added {dict} -- Units to add keyed by Product
+            removed {dict} -- Units to take off keyed by product id, None for the whole line
+        """
+        touched = {product.pk for product in added} | set(removed)
+        lines = {
+            line.product_id: line
+            for line in cls.objects.select_for_update().filter(
+                order=order, product_id__in=touched
+            )
+        }
+
+        for product, quantity in added.items():
+            if product.pk not in lines:
+                lines[product.pk] = cls(
+                    order=order, product=product, quantity=0, unit_price=product.price
+                )
+            lines[product.pk].quantity += quantity
+
+        for product_id, quantity in removed.items():
+            line = lines.get(product_id, None)
+            if line is not None:
+                line.quantity = 0 if quantity is None else line.quantity - quantity
+
+        emptied = [line.pk for line in lines.values() if line.quantity <= 0 and line.pk]
+        kept = [line for line in lines.values() if line.quantity > 0]
+        cls.objects.filter(pk__in=emptied).delete()
+        cls.objects.bulk_update([line for line in kept if line.pk], ["quantity"])
+        cls.objects.bulk_create([line for line in kept if not line.pk])
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["order", "product"], name="unique_product_per_order")
+        ]
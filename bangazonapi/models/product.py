@@ -1,11 +1,12 @@
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE
 from .customer import Customer
 from .productcategory import ProductCategory
-from .orderproduct import OrderProduct
-from .productrating import ProductRating
 
 
 class Product(SafeDeleteModel):
@@ -18,6 +19,7 @@ class Product(SafeDeleteModel):
         Customer, on_delete=models.DO_NOTHING, related_name="products"
     )
     price = models.FloatField(
+        db_index=True,
         validators=[MinValueValidator(0.00), MaxValueValidator(17500, message="Price too high, please set a lower value")],
     )
     description = models.CharField(
@@ -27,11 +29,13 @@ class Product(SafeDeleteModel):
         validators=[MinValueValidator(0)],
     )
     created_date = models.DateField(auto_now_add=True)
+    modified_date = models.DateTimeField(default=timezone.now, db_index=True)
     category = models.ForeignKey(
         ProductCategory, on_delete=models.DO_NOTHING, related_name="products"
     )
     location = models.CharField(
         max_length=50,
+        db_index=True,
     )
     image_path = models.ImageField(
         upload_to="products",
@@ -40,18 +44,96 @@ class Product(SafeDeleteModel):
         max_length=None,
         null=True,
     )
+    # Storage paths of the thumbnails and WebP copies of image_path, and
+    # where the upload is in the off-request processing pipeline.
+    image_variants = models.JSONField(default=dict, blank=True)
+    image_status = models.CharField(max_length=10, blank=True, default="")
+    # Units sold on completed orders. Maintained by Order.complete() and
+    # rebuilt from OrderProduct by the `rebuild_sold_counts` command.
+    number_sold = models.PositiveIntegerField(default=0, editable=False, db_index=True)
 
-    @property
-    def number_sold(self):
-        """number_sold property of a product
+    @classmethod
+    def record_sales(cls, units_by_product):
+        """Add sold units to each product's number_sold in one UPDATE
+
+        Arguments:
+            units_by_product {dict} -- Units sold keyed by product id
+        """
+        if not units_by_product:
+            return
+
+        units = Case(
+            *[When(pk=pk, then=Value(sold)) for pk, sold in units_by_product.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        cls.all_objects.filter(pk__in=units_by_product).update(
+            number_sold=F("number_sold") + units, modified_date=timezone.now()
+        )
+
+    @classmethod
+    def take_stock(cls, units_by_product):
+        """Take sold units out of quantity, all products or none
+
+        Stock is read under a row lock (SQLite's IMMEDIATE transactions
+        already hold the write lock) to report every shortage, then taken
+        with one UPDATE that only lowers rows still holding enough units,
+        so quantity never goes below zero even without the lock. Call
+        inside a transaction and roll it back when shortages are returned.
+
+        Arguments:
+            units_by_product {dict} -- Units wanted keyed by product id
 
         Returns:
-            int -- Number items on completed orders
+            list -- One {product_id, name, requested, available} per short product
         """
-        sold = OrderProduct.objects.filter(
-            product=self, order__payment_type__isnull=False
+        if not units_by_product:
+            return []
+
+        stock = {
+            pk: (name, quantity)
+            for pk, name, quantity in cls.all_objects.select_for_update()
+            .filter(pk__in=units_by_product)
+            .values_list("id", "name", "quantity")
+        }
+        shortages = []
+        for pk, units in units_by_product.items():
+            name, available = stock.get(pk, ("", 0))
+            if available < units:
+                shortages.append(
+                    {
+                        "product_id": pk,
+                        "name": name,
+                        "requested": units,
+                        "available": max(available, 0),
+                    }
+                )
+        if shortages:
+            return shortages
+
+        enough = Q()
+        for pk, units in units_by_product.items():
+            enough |= Q(pk=pk, quantity__gte=units)
+        units = Case(
+            *[When(pk=pk, then=Value(wanted)) for pk, wanted in units_by_product.items()],
+            default=Value(0),
+            output_field=IntegerField(),
         )
-        return sold.count()
+        taken = cls.all_objects.filter(enough).update(
+            quantity=F("quantity") - units, modified_date=timezone.now()
+        )
+        if taken < len(units_by_product):
+            # Only reachable if stock moved between the read and the UPDATE
+            return [
+                {"product_id": pk, "name": stock[pk][0], "requested": wanted, "available": None}
+                for pk, wanted in units_by_product.items()
+            ]
+        return []
+
+    @classmethod
+    def touch(cls, *pks):
+        """Mark products as modified after a change to data they embed"""
+        cls.all_objects.filter(pk__in=pks).update(modified_date=timezone.now())
 
     @property
     def can_be_rated(self):
@@ -70,24 +152,18 @@ class Product(SafeDeleteModel):
     def average_rating(self):
         """Average rating calculated attribute for each product
 
+        Read from the product's RatingAggregate, so select_related
+        "rating_aggregate" when serializing many products.
+
         Returns:
             number -- The average rating for the product
         """
-        ratings = ProductRating.objects.filter(product=self)
-
         try:
-            total_rating = 0
-            for rating in ratings:
-                total_rating += rating.rating
-
-            avg = total_rating / len(ratings)
-
-        except ZeroDivisionError:
-            avg = (
-                0  # If there are no ratings, set average to 0 to avoid division by zero
-            )
-        return avg
+            return self.rating_aggregate.average
+        except ObjectDoesNotExist:
+            return 0  # No ratings yet
 
     class Meta:
         verbose_name = "product"
         verbose_name_plural = "products"
+        indexes = [models.Index(fields=["created_date", "id"])]
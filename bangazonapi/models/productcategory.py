@@ -1,9 +1,11 @@
 from django.db import models
+from django.utils import timezone
 
 
 class ProductCategory(models.Model):
 
     name = models.CharField(max_length=55)
+    modified_date = models.DateTimeField(default=timezone.now)
 
     class Meta:
         verbose_name = "productcategory"
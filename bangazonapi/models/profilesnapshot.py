@@ -0,0 +1,34 @@
+from django.db import models
+from django.utils import timezone
+
+
+class ProfileSnapshot(models.Model):
+    """Serialized /profile response for one customer
+
+    Each section of the profile is its own column so the signal handlers
+    can refresh one section with a single UPDATE without racing writes
+    to the others. A missing row means "build on next read".
+    """
+
+    SECTIONS = (
+        "header",
+        "payment_types",
+        "recommends",
+        "recommended_by",
+        "liked_products",
+        "store",
+    )
+
+    customer = models.OneToOneField(
+        "Customer",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="profile_snapshot",
+    )
+    header = models.JSONField(default=dict)
+    payment_types = models.JSONField(default=list)
+    recommends = models.JSONField(default=list)
+    recommended_by = models.JSONField(default=list)
+    liked_products = models.JSONField(default=list)
+    store = models.JSONField(default=list)
+    modified_date = models.DateTimeField(default=timezone.now)
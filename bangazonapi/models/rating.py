@@ -1,23 +1,23 @@
-from django.db import models
-from django.core.validators import MaxValueValidator, MinValueValidator
-from .customer import Customer
-from .product import Product
+from .productrating import ProductRating
 
 
-class Rating(models.Model):
+class Rating(ProductRating):
+    """Legacy name for a product rating
 
-    customer = models.ForeignKey(
-        Customer,
-        on_delete=models.DO_NOTHING,
-    )
-    product = models.ForeignKey(
-        Product,
-        on_delete=models.DO_NOTHING,
-    )
-    score = models.IntegerField(
-        validators=[MinValueValidator(0), MaxValueValidator(5)],
-    )
+    Ratings used to be stored twice, here and in ProductRating. Rating is
+    now a proxy over the same table, so both names feed the same rating
+    aggregates.
+    """
 
     class Meta:
+        proxy = True
         verbose_name = "rating"
         verbose_name_plural = "ratings"
+
+    @property
+    def score(self):
+        return self.rating
+
+    @score.setter
+    def score(self, value):
+        self.rating = value
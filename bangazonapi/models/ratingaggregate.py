@@ -0,0 +1,83 @@
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
+
+
+class RatingAggregate(models.Model):
+    """Running totals of the ratings given to a product
+
+    Kept up to date by the ProductRating signal handlers so a product's
+    average rating is a single row read instead of a scan of its ratings.
+    """
+
+    SCORES = range(0, 6)
+
+    product = models.OneToOneField(
+        "Product",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rating_aggregate",
+    )
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    stars_0 = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+
+    @property
+    def average(self):
+        """Average of all ratings, or 0 when the product has none"""
+        if self.rating_count == 0:
+            return 0
+        return self.rating_sum / self.rating_count
+
+    @property
+    def histogram(self):
+        """Number of ratings given for each score from 0 to 5"""
+        return {score: getattr(self, f"stars_{score}") for score in self.SCORES}
+
+    @classmethod
+    def apply(cls, product_id, added=None, removed=None):
+        """Fold a single rating change into a product's aggregate
+
+        Arguments:
+            product_id {int} -- Product the rating belongs to
+            added {int} -- Score that was added, if any
+            removed {int} -- Score that was removed or replaced, if any
+        """
+        changes = {}
+        if added is not None:
+            changes["rating_sum"] = F("rating_sum") + added
+            changes["rating_count"] = F("rating_count") + 1
+            changes[f"stars_{added}"] = F(f"stars_{added}") + 1
+        if removed is not None:
+            changes["rating_sum"] = changes.get("rating_sum", F("rating_sum")) - removed
+            changes["rating_count"] = changes.get("rating_count", F("rating_count")) - 1
+            column = f"stars_{removed}"
+            changes[column] = changes.get(column, F(column)) - 1
+        if not changes:
+            return
+
+        if cls.objects.filter(product_id=product_id).update(**changes):
+            return
+
+        # Only a new rating can start an aggregate. A removal with no
+        # aggregate left means the product itself is being deleted.
+        if added is None:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    product_id=product_id,
+                    rating_sum=added,
+                    rating_count=1,
+                    **{f"stars_{added}": 1},
+                )
+        except IntegrityError:
+            cls.objects.filter(product_id=product_id).update(**changes)
+
+    class Meta:
+        verbose_name = "ratingaggregate"
+        verbose_name_plural = "ratingaggregates"
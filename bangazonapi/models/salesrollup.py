@@ -0,0 +1,73 @@
+from django.db import models
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue of one product on one day of completed orders
+
+    Filled by the `rollup_sales` command. The seller and category are
+    copied from the product so the derived rollups and reports never
+    join back to it. A sale's day is the date its order was paid.
+    """
+
+    day = models.DateField()
+    product = models.ForeignKey(
+        "Product", on_delete=models.DO_NOTHING, related_name="daily_sales"
+    )
+    seller = models.ForeignKey(
+        "Customer", on_delete=models.DO_NOTHING, related_name="+"
+    )
+    category = models.ForeignKey(
+        "ProductCategory", on_delete=models.DO_NOTHING, related_name="+"
+    )
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "product"], name="unique_product_sales_day")
+        ]
+        indexes = [
+            models.Index(fields=["product", "day"]),
+            models.Index(fields=["seller", "day"]),
+        ]
+
+
+class DailySellerSales(models.Model):
+    """Per seller and day totals, derived from DailyProductSales"""
+
+    day = models.DateField()
+    seller = models.ForeignKey(
+        "Customer", on_delete=models.DO_NOTHING, related_name="+"
+    )
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "seller"], name="unique_seller_sales_day")
+        ]
+        indexes = [models.Index(fields=["seller", "day"])]
+
+
+class DailyCategorySales(models.Model):
+    """Per category and day totals, derived from DailyProductSales"""
+
+    day = models.DateField()
+    category = models.ForeignKey(
+        "ProductCategory", on_delete=models.DO_NOTHING, related_name="+"
+    )
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["day", "category"], name="unique_category_sales_day")
+        ]
+
+
+class RollupWatermark(models.Model):
+    """Completion time up to which a rollup has folded in orders"""
+
+    name = models.CharField(max_length=30, primary_key=True)
+    completed_at = models.DateTimeField()
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from .customer import Customer
 
 
@@ -9,6 +10,7 @@ class Store(models.Model):
     name = models.CharField(max_length=55)
     description = models.CharField(max_length=155)
     created_date = models.DateField(auto_now_add=True)
+    modified_date = models.DateTimeField(default=timezone.now)
 
 
     @property
@@ -17,4 +19,7 @@ class Store(models.Model):
 
     @is_favorite.setter
     def is_favorite(self, value):
-        self.__is_favorite = value
\ No newline at end of file
+        self.__is_favorite = value
+
+    class Meta:
+        indexes = [models.Index(fields=["created_date", "id"])]
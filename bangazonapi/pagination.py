@@ -0,0 +1,154 @@
+"""Keyset (cursor) pagination for list endpoints"""
+
+import base64
+import binascii
+import datetime
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Opt-in keyset pagination over a unique, indexed ordering
+
+    Pages are located with a WHERE clause on the ordering columns of the
+    last (or first) row seen instead of an OFFSET, so page 1000 costs the
+    same as page 1. Cursors are opaque to clients and only valid for the
+    ordering that produced them.
+
+    Clients opt in by sending `page_size` or `cursor`. Without either the
+    view should keep returning its plain, unpaginated list.
+
+    Arguments:
+        ordering {tuple} -- Model fields to page over, last one unique (e.g. the pk)
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, ordering=("-created_date", "-id")):
+        self.ordering = tuple(ordering)
+        self.page_size = api_settings.PAGE_SIZE or 10
+
+    def is_requested(self, request):
+        """Whether the client asked for a paginated response"""
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        values, self.reverse = self.decode_cursor(request)
+        has_cursor = values is not None
+
+        ordering = self.ordering
+        if self.reverse:
+            ordering = tuple(self._flip(field) for field in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        if has_cursor:
+            queryset = queryset.filter(self._after(ordering, values))
+
+        rows = list(queryset[: self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = has_cursor, has_more
+        else:
+            self.has_next, self.has_previous = has_more, has_cursor
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        """Absolute URL for the page after (or before) the given row"""
+        values = [self._key(getattr(instance, field.lstrip("-"))) for field in self.ordering]
+        payload = {"o": self.ordering, "v": values, "r": reverse}
+        token = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        """Ordering values and direction stored in the request's cursor
+
+        Returns:
+            tuple -- (values or None, reverse)
+        """
+        token = request.query_params.get(self.cursor_query_param, None)
+        if not token:
+            self.base_url = remove_query_param(self.base_url, self.cursor_query_param)
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+            values, reverse = payload["v"], bool(payload["r"])
+            valid = tuple(payload["o"]) == self.ordering and len(values) == len(self.ordering)
+        except (binascii.Error, ValueError, KeyError, TypeError) as ex:
+            raise NotFound(self.invalid_cursor_message) from ex
+
+        if not valid:
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def _after(ordering, values):
+        """WHERE clause matching the rows that come after `values`
+
+        Expands the row comparison (a, b) > (x, y) into
+        a > x OR (a = x AND b > y), honouring each field's direction.
+        """
+        condition = Q()
+        for position, field in enumerate(ordering):
+            column = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+            equal = {
+                previous.lstrip("-"): values[index]
+                for index, previous in enumerate(ordering[:position])
+            }
+            condition |= Q(**equal, **{f"{column}__{lookup}": values[position]})
+        return condition
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    @staticmethod
+    def _key(value):
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        return value
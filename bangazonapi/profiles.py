@@ -0,0 +1,130 @@
+"""Stored /profile snapshots, refreshed one section at a time
+
+Profile.list reads a customer's ProfileSnapshot row instead of walking
+their recommendations, likes, payment types and store through nested
+serializers. The signal handlers re-render just the section a write
+touched, or drop the snapshot when a change reaches into many sections
+(such as a renamed product), and the next read rebuilds it.
+
+Snapshots are rendered without a request, so links are stored as paths
+and made absolute for the host of each read.
+"""
+
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.utils import timezone
+from bangazonapi.fieldsets import Fieldset
+from bangazonapi.models import Customer, Like, ProfileSnapshot, Recommendation, Store
+
+HEADER_FIELDS = ("id", "url", "user", "phone_number", "address")
+
+# Keys whose values are links rendered as paths
+LINK_FIELDS = ("url", "image_path")
+
+
+def _prepare(customer, sections):
+    """Attach the querysets the requested sections are rendered from"""
+    recommendations = Recommendation.objects.select_related("customer__user", "product")
+    if "recommends" in sections:
+        customer.recommends = recommendations.filter(recommender=customer)
+    if "recommended_by" in sections:
+        customer.recommended_by = recommendations.filter(customer=customer)
+    if "store" in sections:
+        customer.store = Store.objects.filter(seller=customer)
+    if "liked_products" in sections:
+        likes = Like.objects.select_related("customer__user", "product")
+        prefetch_related_objects([customer], Prefetch("likes", queryset=likes))
+
+
+def render_sections(customer, sections):
+    """Serialized payload of each section
+
+    Arguments:
+        customer {Customer} -- Customer with its user loaded
+        sections {iterable} -- Names from ProfileSnapshot.SECTIONS
+
+    Returns:
+        dict -- Payload keyed by section name
+    """
+    # Imported here because the profile view module imports this one
+    from bangazonapi.views.profile import ProfileSerializer  # pylint: disable=import-outside-toplevel
+
+    sections = set(sections)
+    fields = set(sections) - {"header"}
+    if "header" in sections:
+        fields.update(HEADER_FIELDS)
+
+    _prepare(customer, sections)
+    data = ProfileSerializer(
+        customer, context={"request": None}, fieldset=Fieldset(fields)
+    ).data
+
+    payloads = {name: data[name] for name in sections if name != "header"}
+    if "header" in sections:
+        payloads["header"] = {name: data[name] for name in HEADER_FIELDS}
+    return payloads
+
+
+def build_snapshot(customer):
+    """Render and store every section of a customer's profile"""
+    payloads = render_sections(customer, ProfileSnapshot.SECTIONS)
+    snapshot, _ = ProfileSnapshot.objects.update_or_create(
+        customer=customer, defaults={**payloads, "modified_date": timezone.now()}
+    )
+    return snapshot
+
+
+def refresh_sections(customer_ids, *sections):
+    """Re-render sections of existing snapshots after a write
+
+    Customers without a snapshot are skipped; theirs is built on read.
+    """
+    customer_ids = set(customer_ids)
+    stored = ProfileSnapshot.objects.filter(customer_id__in=customer_ids).values_list(
+        "customer_id", flat=True
+    )
+    for customer in Customer.objects.filter(pk__in=list(stored)).select_related("user"):
+        payloads = render_sections(customer, sections)
+        ProfileSnapshot.objects.filter(customer=customer).update(
+            **payloads, modified_date=timezone.now()
+        )
+
+
+def forget_snapshots(customer_ids):
+    """Drop snapshots so the next read rebuilds them from scratch"""
+    ProfileSnapshot.objects.filter(customer_id__in=set(customer_ids)).delete()
+
+
+def customers_showing_product(product_id):
+    """Customers whose likes or recommendations include a product"""
+    likes = Like.objects.filter(product_id=product_id).values_list("customer_id", flat=True)
+    recommendations = Recommendation.objects.filter(product_id=product_id).values_list(
+        "customer_id", "recommender_id"
+    )
+    return set(likes) | {pk for pair in recommendations for pk in pair}
+
+
+def forget_product(product_id):
+    """Drop the snapshots that copy a product's name, price or image"""
+    forget_snapshots(customers_showing_product(product_id))
+
+
+def customers_showing_customer(customer_id):
+    """Customers whose profile lists another customer's name"""
+    pairs = Recommendation.objects.filter(
+        Q(customer_id=customer_id) | Q(recommender_id=customer_id)
+    ).values_list("customer_id", "recommender_id")
+    return {pk for pair in pairs for pk in pair} | {customer_id}
+
+
+def absolutize(payload, request):
+    """Copy of a stored payload with its link paths made absolute"""
+    if isinstance(payload, list):
+        return [absolutize(item, request) for item in payload]
+    if isinstance(payload, dict):
+        return {
+            key: request.build_absolute_uri(value)
+            if key in LINK_FIELDS and isinstance(value, str) and value.startswith("/")
+            else absolutize(value, request)
+            for key, value in payload.items()
+        }
+    return payload
@@ -0,0 +1,5 @@
+from .analytics import StoreAnalytics
+from .facets import ProductFacets
+from .products import ProductQuery, ProductQueryError
+from .reports import OrderReport, ProductReport, ReportQueryError, SalesReport
+from .search import rebuild_product_index, search_products
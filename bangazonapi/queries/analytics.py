@@ -0,0 +1,209 @@
+"""Seller analytics aggregated in NumPy from bulk column fetches
+
+StoreAnalytics reads the seller's catalog (one row of numbers per
+product), the star counts of its rated products and the sold line items
+in the window (one row of numbers per line), turns each column into an
+array and computes every figure with vectorized operations instead of
+per-product queries. Only the names of the top products are looked up
+afterwards.
+"""
+
+import datetime
+import numpy as np
+from django.db import connections
+from django.db.models import BooleanField, CharField, ExpressionWrapper, F, Q
+from django.db.models.functions import Cast, Coalesce, Substr
+from django.utils import timezone
+from bangazonapi import rollups
+from bangazonapi.models import OrderProduct, Product, RatingAggregate
+from .reports import ReportQueryError, _date, _integer
+
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+DEFAULT_TOP = 10
+MAX_TOP = 100
+
+STAR_COLUMNS = tuple(f"stars_{score}" for score in RatingAggregate.SCORES)
+DELETED = ExpressionWrapper(Q(deleted__isnull=False), output_field=BooleanField())
+
+# rollups.SALE_DAY as YYYY-MM-DD text, left for NumPy to parse. The stored
+# UTC timestamp's date matches TruncDate under the UTC TIME_ZONE, without
+# the per-row Python function TruncDate costs on SQLite.
+SALE_DATE = Coalesce(
+    Substr(Cast("order__completed_at", CharField()), 1, 10),
+    Cast("order__created_date", CharField()),
+)
+
+
+def _columns(queryset, dtypes):
+    """One array per column of a values_list() queryset
+
+    The compiled SQL runs on a plain cursor: NumPy does the type
+    conversion, so Django's per-row converters are skipped.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    if not rows:
+        return [np.empty(0, dtype=dtype) for dtype in dtypes]
+    return [np.array(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes)]
+
+
+class StoreAnalytics:
+    """Revenue, units, top products, sell-through, ratings and repeat buyers
+
+    Arguments:
+        store {Store} -- Store whose seller's catalog is analysed
+        params {QueryDict} -- from/to dates (default the last 30 days) and top
+
+    Raises:
+        ReportQueryError -- A parameter is malformed or the window is too long
+    """
+
+    def __init__(self, store, params, today=None):
+        self.store = store
+        today = today or timezone.localdate()
+        self.last = _date(params, "to") or today
+        self.first = _date(params, "from") or self.last - datetime.timedelta(days=DEFAULT_DAYS - 1)
+        if self.first > self.last:
+            raise ReportQueryError("'from' must not be after 'to'")
+        if (self.last - self.first).days >= MAX_DAYS:
+            raise ReportQueryError(f"The window can span at most {MAX_DAYS} days")
+
+        self.top = _integer(params, "top")
+        if self.top is None:
+            self.top = DEFAULT_TOP
+        if not 0 <= self.top <= MAX_TOP:
+            raise ReportQueryError(f"'top' must be between 0 and {MAX_TOP}")
+
+    @property
+    def signature(self):
+        """Cache key part identifying the store, window and options"""
+        return f"{self.store.pk}:{self.first}:{self.last}:{self.top}"
+
+    def _catalog(self):
+        """Sorted product ids, on-hand quantity and whether each is deleted"""
+        return _columns(
+            Product.all_objects.filter(customer_id=self.store.seller_id)
+            .order_by("id")
+            .values_list("id", "quantity", DELETED),
+            (np.int64, np.int64, bool),
+        )
+
+    def _stars(self):
+        """Ratings per score (columns) of each rated product still listed (rows)"""
+        stars = _columns(
+            RatingAggregate.objects.filter(
+                product__customer_id=self.store.seller_id, product__deleted__isnull=True
+            ).values_list(*STAR_COLUMNS),
+            (np.int64,) * len(STAR_COLUMNS),
+        )
+        return np.column_stack(stars)
+
+    def _lines(self):
+        """Product, order, buyer, units, revenue and sale day of each line sold"""
+        return _columns(
+            OrderProduct.objects.filter(
+                rollups.sold_between(self.first, self.last),
+                order__payment_type__isnull=False,
+                product__customer_id=self.store.seller_id,
+            )
+            .order_by()
+            .values_list(
+                "product_id",
+                "order_id",
+                "order__customer_id",
+                "quantity",
+                Coalesce("unit_price", "product__price") * F("quantity"),
+                SALE_DATE,
+            ),
+            (np.int64, np.int64, np.int64, np.int64, float, "datetime64[D]"),
+        )
+
+    def compute(self):
+        """Every figure of the analytics response
+
+        Returns:
+            dict -- JSON ready analytics payload
+        """
+        ids, on_hand, deleted = self._catalog()
+        product_ids, order_ids, buyers, units, revenue, days = self._lines()
+
+        # Revenue and units per day, zero filled across the window
+        start = np.datetime64(self.first, "D")
+        span = (self.last - self.first).days + 1
+        day = (days - start).astype(np.int64)
+        daily_revenue = np.bincount(day, weights=revenue, minlength=span)
+        daily_units = np.bincount(day, weights=units, minlength=span).astype(np.int64)
+        dates = np.arange(start, start + span)
+
+        # Per product totals, indexed like the catalog
+        position = np.searchsorted(ids, product_ids)
+        product_units = np.bincount(position, weights=units, minlength=len(ids)).astype(np.int64)
+        product_revenue = np.bincount(position, weights=revenue, minlength=len(ids))
+        stocked = product_units + np.where(deleted, 0, on_hand)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            product_sell_through = np.where(stocked > 0, product_units / stocked, 0.0)
+
+        top = np.argsort(-product_revenue, kind="stable")[: self.top]
+        top = top[product_revenue[top] > 0]
+        names = dict(
+            Product.all_objects.filter(pk__in=ids[top].tolist()).values_list("id", "name")
+        )
+
+        # Buyers with more than one order in the window
+        _, first_line = np.unique(order_ids, return_index=True)
+        _, orders_per_buyer = np.unique(buyers[first_line], return_counts=True)
+        repeat = int(np.count_nonzero(orders_per_buyer > 1))
+
+        sold = int(product_units.sum())
+        in_stock = int(on_hand[~deleted].clip(min=0).sum())
+        distribution = self._stars().sum(axis=0)
+        ratings = int(distribution.sum())
+
+        return {
+            "store": self.store.pk,
+            "from": str(self.first),
+            "to": str(self.last),
+            "revenue": round(float(revenue.sum()), 2),
+            "units": sold,
+            "orders": len(first_line),
+            "timeline": [
+                {"day": str(date), "revenue": round(float(amount), 2), "units": int(count)}
+                for date, amount, count in zip(dates, daily_revenue, daily_units)
+            ],
+            "top_products": [
+                {
+                    "id": int(ids[index]),
+                    "name": names.get(int(ids[index]), None),
+                    "units": int(product_units[index]),
+                    "revenue": round(float(product_revenue[index]), 2),
+                    "sell_through": round(float(product_sell_through[index]), 4),
+                }
+                for index in top
+            ],
+            "sell_through": {
+                "sold": sold,
+                "in_stock": in_stock,
+                "rate": round(sold / (sold + in_stock), 4) if sold + in_stock else 0.0,
+            },
+            "ratings": {
+                "count": ratings,
+                "average": round(
+                    float(np.dot(distribution, np.arange(len(distribution)))) / ratings, 2
+                )
+                if ratings
+                else 0,
+                "distribution": {
+                    str(score): int(count) for score, count in enumerate(distribution)
+                },
+            },
+            "buyers": {
+                "count": len(orders_per_buyer),
+                "repeat": repeat,
+                "repeat_rate": round(repeat / len(orders_per_buyer), 4)
+                if len(orders_per_buyer)
+                else 0.0,
+            },
+        }
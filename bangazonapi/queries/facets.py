@@ -0,0 +1,90 @@
+"""Category, location and price counts for a filtered product listing"""
+
+import hashlib
+from django.conf import settings
+from django.db.models import Count, Q
+from .products import ProductQueryError
+
+
+class ProductFacets:
+    """Facet counts for the products matching a ProductQuery
+
+    Each facet is one grouped aggregate over the same filtered queryset,
+    so the three counts cost three statements however many products
+    match. Price ranges are counted in a single pass with filtered Counts.
+
+    Arguments:
+        query {ProductQuery} -- Filters selecting the products to count
+        params {QueryDict} -- Request query parameters, read for price_buckets
+    """
+
+    def __init__(self, query, params):
+        self.query = query
+        self.bounds = self._bounds(params)
+
+    @staticmethod
+    def _bounds(params):
+        value = params.get("price_buckets", None)
+        if value is None:
+            return tuple(float(bound) for bound in settings.PRODUCT_PRICE_BUCKETS)
+        try:
+            bounds = tuple(float(bound) for bound in value.split(",") if bound.strip())
+        except ValueError as ex:
+            raise ProductQueryError("'price_buckets' must be comma separated numbers") from ex
+        if not bounds or list(bounds) != sorted(set(bounds)):
+            raise ProductQueryError("'price_buckets' must be increasing numbers")
+        return bounds
+
+    @property
+    def signature(self):
+        """Stable digest of these filters and buckets, for cache keys"""
+        return hashlib.sha1(repr((self.query.signature, self.bounds)).encode()).hexdigest()
+
+    def ranges(self):
+        """(min, max) price range per bucket, max None for the last one"""
+        lower = (0.0,) + self.bounds
+        upper = self.bounds + (None,)
+        return list(zip(lower, upper))
+
+    def categories(self, products):
+        rows = (
+            products.order_by()
+            .values("category_id", "category__name")
+            .annotate(count=Count("id"))
+            .order_by("-count", "category_id")
+        )
+        return [
+            {"id": row["category_id"], "name": row["category__name"], "count": row["count"]}
+            for row in rows
+        ]
+
+    def locations(self, products):
+        rows = (
+            products.order_by()
+            .values("location")
+            .annotate(count=Count("id"))
+            .order_by("-count", "location")
+        )
+        return [{"location": row["location"], "count": row["count"]} for row in rows]
+
+    def prices(self, products):
+        counts = {}
+        for index, (low, high) in enumerate(self.ranges()):
+            in_range = Q(price__gte=low) if high is None else Q(price__gte=low, price__lt=high)
+            counts[f"bucket_{index}"] = Count("id", filter=in_range)
+        totals = products.order_by().aggregate(**counts)
+        return [
+            {"min": low, "max": high, "count": totals[f"bucket_{index}"]}
+            for index, (low, high) in enumerate(self.ranges())
+        ]
+
+    def counts(self):
+        """All three facets plus the number of matching products"""
+        products = self.query.filtered()
+        categories = self.categories(products)
+        return {
+            "count": sum(category["count"] for category in categories),
+            "categories": categories,
+            "locations": self.locations(products),
+            "prices": self.prices(products),
+        }
@@ -0,0 +1,147 @@
+"""Compile /products query parameters into a single SQL statement"""
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+from bangazonapi.models import Product
+from .search import rank_products, search_products
+
+
+class ProductQueryError(ValueError):
+    """Raised when a product list parameter is missing or malformed"""
+
+
+# Public order_by names mapped to the column or annotation they sort on
+ORDERING_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "price": "price",
+    "quantity": "quantity",
+    "location": "location",
+    "created_date": "created_date",
+    "number_sold": "number_sold",
+    "average_rating": "rating_average",
+}
+
+RECENT_LIMIT = 5
+
+
+class ProductQuery:
+    """Filters, ordering and limit for a product listing
+
+    Every parameter is validated up front and applied to the same
+    queryset, so any combination still runs as one SELECT with the
+    rating aggregate joined in for sorting and serialization.
+
+    Arguments:
+        params {QueryDict} -- Request query parameters
+    """
+
+    def __init__(self, params):
+        self.category = self._integer(params, "category")
+        self.search = params.get("q", None) or None
+        self.location = params.get("location", None)
+        self.min_price = self._number(params, "min_price")
+        self.max_price = self._number(params, "max_price")
+        self.number_sold = self._integer(params, "number_sold")
+
+        self.order = params.get("order_by", None)
+        if self.order is not None and self.order not in ORDERING_FIELDS:
+            raise ProductQueryError(
+                f"Cannot order by '{self.order}'. Choose one of: {', '.join(ORDERING_FIELDS)}"
+            )
+        self.descending = params.get("direction", None) == "desc"
+
+        self.limit = self._integer(params, "quantity")
+        if self.limit is not None and self.limit < 0:
+            raise ProductQueryError("'quantity' cannot be negative")
+        if params.get("recent", None) is not None:
+            self.limit = min(self.limit or RECENT_LIMIT, RECENT_LIMIT)
+
+    @staticmethod
+    def _integer(params, name):
+        value = params.get(name, None)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError as ex:
+            raise ProductQueryError(f"'{name}' must be a whole number") from ex
+
+    @staticmethod
+    def _number(params, name):
+        value = params.get(name, None)
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError as ex:
+            raise ProductQueryError(f"'{name}' must be a number") from ex
+
+    @property
+    def ordering(self):
+        """Unique ordering for the requested order_by, newest first by default"""
+        if self.order is None:
+            if self.search is not None:
+                return ("search_rank", "id")
+            # quantity, recent and pagination all start from the newest products
+            return ("-created_date", "-id")
+
+        column = ORDERING_FIELDS[self.order]
+        if self.descending:
+            return (f"-{column}", "-id")
+        return (column, "id")
+
+    @property
+    def signature(self):
+        """Hashable summary of the filters, ignoring ordering and limit"""
+        return (
+            self.category,
+            self.search,
+            self.location,
+            self.min_price,
+            self.max_price,
+            self.number_sold,
+        )
+
+    def filtered(self):
+        """Products matching the filters, without ordering or limit"""
+        products = Product.objects.all()
+
+        if self.category is not None:
+            products = products.filter(category_id=self.category)
+        if self.location is not None:
+            products = products.filter(location=self.location)
+        if self.min_price is not None:
+            products = products.filter(price__gte=self.min_price)
+        if self.max_price is not None:
+            products = products.filter(price__lte=self.max_price)
+        if self.number_sold is not None:
+            products = products.filter(number_sold__gte=self.number_sold)
+        if self.search is not None:
+            products = search_products(products, self.search)
+
+        return products
+
+    def queryset(self):
+        """Ordered, limited products ready to serialize"""
+        products = self.filtered().select_related("rating_aggregate")
+
+        if self.order == "average_rating":
+            products = products.annotate(
+                rating_average=Coalesce(
+                    Cast("rating_aggregate__rating_sum", FloatField())
+                    / NullIf(F("rating_aggregate__rating_count"), 0),
+                    Value(0.0),
+                )
+            )
+
+        if self.search is not None:
+            products = rank_products(products)
+
+        if self.order is not None or self.limit is not None or self.search is not None:
+            products = products.order_by(*self.ordering)
+
+        if self.limit is not None:
+            products = products[: self.limit]
+
+        return products
@@ -0,0 +1,298 @@
+"""Report rows computed in SQL, one query per report"""
+
+import datetime
+from operator import attrgetter, itemgetter
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from bangazonapi import rollups
+from bangazonapi.models import (
+    DailyCategorySales,
+    DailyProductSales,
+    DailySellerSales,
+    Order,
+    OrderProduct,
+    Product,
+)
+
+
+class ReportQueryError(ValueError):
+    """Raised when a report parameter is missing or malformed"""
+
+
+# status parameter -> (title, heading, payment_type__isnull)
+ORDER_STATUSES = {
+    "complete": (
+        "Completed Orders",
+        "Orders that include a payment type that is not null",
+        False,
+    ),
+    "incomplete": (
+        "Incomplete Orders",
+        "Orders that include a payment type that is null",
+        True,
+    ),
+}
+
+
+def _date(params, name):
+    value = params.get(name, None)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError as ex:
+        raise ReportQueryError(f"'{name}' must be a date in YYYY-MM-DD format") from ex
+
+
+def _integer(params, name):
+    value = params.get(name, None)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError as ex:
+        raise ReportQueryError(f"'{name}' must be a whole number") from ex
+
+
+def pick_columns(columns, params):
+    """Columns named by the comma separated `columns` param, all by default
+
+    Arguments:
+        columns {dict} -- Every column the report offers, in default order
+        params {QueryDict} -- Request query parameters
+    """
+    names = params.get("columns", None)
+    if not names:
+        return columns
+    names = [name.strip() for name in names.split(",") if name.strip()]
+    unknown = [name for name in names if name not in columns]
+    if unknown:
+        raise ReportQueryError(
+            f"Unknown column(s): {', '.join(unknown)}. Choose from: {', '.join(columns)}"
+        )
+    return {name: columns[name] for name in names}
+
+
+def full_name(user):
+    return f"{user.first_name} {user.last_name}"
+
+
+def line_totals():
+    """Subquery summing an order's lines at their recorded prices"""
+    return Subquery(
+        OrderProduct.objects.filter(order=OuterRef("pk"))
+        .values("order")
+        .annotate(total=Sum(Coalesce("unit_price", "product__price") * F("quantity")))
+        .values("total")
+    )
+
+
+ORDER_COLUMNS = {
+    "id": attrgetter("id"),
+    "created_date": attrgetter("created_date"),
+    "status": lambda order: "incomplete" if order.payment_type_id is None else "complete",
+    "total": attrgetter("total"),
+    "customer_id": attrgetter("customer_id"),
+    "customer_name": lambda order: full_name(order.customer.user),
+    "merchant_name": lambda order: order.payment_type and order.payment_type.merchant_name,
+    "account_number": lambda order: order.payment_type and order.payment_type.obscured_num,
+}
+
+PRODUCT_COLUMNS = {
+    "id": attrgetter("id"),
+    "name": attrgetter("name"),
+    "price": attrgetter("price"),
+    "quantity": attrgetter("quantity"),
+    "location": attrgetter("location"),
+    "seller_id": attrgetter("customer_id"),
+    "seller_name": lambda product: full_name(product.customer.user),
+}
+
+
+class OrderReport:
+    """Orders report rows with their totals, customers and payments
+
+    Each row is an Order with `total` annotated: the subtotal stored at
+    checkout, or the sum of its lines for open carts. The customer, user
+    and payment type are joined in, so the whole report is one SELECT
+    however many orders it covers.
+
+    Arguments:
+        params {QueryDict} -- `status` (complete or incomplete), `from` and
+            `to` dates (inclusive) and a `customer` id, all optional
+    """
+
+    def __init__(self, params):
+        self.status = params.get("status", None) or None
+        if self.status is not None and self.status not in ORDER_STATUSES:
+            raise ReportQueryError(
+                f"Unknown status '{self.status}'. Choose one of: {', '.join(ORDER_STATUSES)}"
+            )
+        self.start = _date(params, "from")
+        self.end = _date(params, "to")
+        self.customer = _integer(params, "customer")
+        self.columns = pick_columns(ORDER_COLUMNS, params)
+
+    @property
+    def title(self):
+        return ORDER_STATUSES[self.status][0] if self.status else "Orders"
+
+    @property
+    def heading(self):
+        return ORDER_STATUSES[self.status][1] if self.status else "All orders"
+
+    def queryset(self):
+        """Annotated orders, oldest first"""
+        orders = Order.objects.all()
+
+        if self.status is not None:
+            orders = orders.filter(payment_type__isnull=ORDER_STATUSES[self.status][2])
+        if self.start is not None:
+            orders = orders.filter(created_date__gte=self.start)
+        if self.end is not None:
+            orders = orders.filter(created_date__lte=self.end)
+        if self.customer is not None:
+            orders = orders.filter(customer_id=self.customer)
+
+        return (
+            orders.select_related("customer__user", "payment_type")
+            .only(
+                "id",
+                "created_date",
+                "customer",
+                "payment_type",
+                "customer__user__first_name",
+                "customer__user__last_name",
+                "payment_type__merchant_name",
+                "payment_type__account_number",
+            )
+            .annotate(total=Round(Coalesce("subtotal", line_totals(), Value(0.0)), 2))
+            .order_by("created_date", "id")
+        )
+
+
+# Price ranges of the product reports -> (title, heading, filter)
+PRODUCT_RANGES = {
+    "expensive": (
+        "Expensive Products",
+        "Products that are greater than or equal to $1000",
+        {"price__gte": 1000},
+    ),
+    "inexpensive": (
+        "Inexpensive Products",
+        "Products that are less than or equal to $1000",
+        {"price__lte": 999},
+    ),
+}
+
+
+class ProductReport:
+    """Products in a price range with their sellers joined in
+
+    Arguments:
+        price_range {str} -- Key of PRODUCT_RANGES
+        params {QueryDict} -- Request query parameters, for `columns`
+    """
+
+    def __init__(self, price_range, params):
+        self.title, self.heading, self.filters = PRODUCT_RANGES[price_range]
+        self.columns = pick_columns(PRODUCT_COLUMNS, params)
+
+    def queryset(self):
+        return (
+            Product.objects.filter(**self.filters)
+            .select_related("customer__user")
+            .only(
+                "id",
+                "name",
+                "price",
+                "quantity",
+                "location",
+                "customer",
+                "customer__user__first_name",
+                "customer__user__last_name",
+            )
+            .order_by("id")
+        )
+
+
+# by parameter -> (rollup table, its key column, the same key on sold line items)
+SALES_GROUPS = {
+    "day": (DailyCategorySales, "day", "day"),
+    "product": (DailyProductSales, "product_id", "product_id"),
+    "seller": (DailySellerSales, "seller_id", "product__customer_id"),
+    "category": (DailyCategorySales, "category_id", "product__category_id"),
+}
+
+
+class SalesReport:
+    """Units and revenue of completed orders by day, product, seller or category
+
+    Totals come from the rollup tables up to their watermark, plus a live
+    aggregate of orders paid since. With `live=true`, or before the
+    rollups are first built, everything is aggregated from the line items.
+
+    Arguments:
+        params {QueryDict} -- `by` (default day), `from` and `to` sale
+            dates (inclusive), `live` and export `columns`
+    """
+
+    def __init__(self, params):
+        self.by = params.get("by", None) or "day"
+        if self.by not in SALES_GROUPS:
+            raise ReportQueryError(
+                f"Cannot group sales by '{self.by}'. Choose one of: {', '.join(SALES_GROUPS)}"
+            )
+        self.start = _date(params, "from")
+        self.end = _date(params, "to")
+        self.live = params.get("live", "").lower() in ("1", "true", "yes")
+        self.key = "day" if self.by == "day" else f"{self.by}_id"
+        self.columns = pick_columns(
+            {name: itemgetter(name) for name in (self.key, "units", "revenue")}, params
+        )
+        self.source = None
+
+    def _in_window(self, rows):
+        if self.start is not None:
+            rows = rows.filter(day__gte=self.start)
+        if self.end is not None:
+            rows = rows.filter(day__lte=self.end)
+        return rows
+
+    @staticmethod
+    def _totals(rows, key, units, revenue):
+        """{key: (units, revenue)} summed over rows"""
+        return {
+            row["key"]: (row["units"], row["revenue"])
+            for row in rows.values(key=F(key))
+            .annotate(units=Sum(units), revenue=Sum(revenue))
+            .order_by()
+        }
+
+    def _live(self, lines):
+        _, _, line_key = SALES_GROUPS[self.by]
+        revenue = Coalesce("unit_price", "product__price") * F("quantity")
+        return self._totals(self._in_window(lines), line_key, "quantity", revenue)
+
+    def rows(self):
+        """Rows of {key, units, revenue}, ordered by key; sets `source`"""
+        table, rollup_key, _ = SALES_GROUPS[self.by]
+        mark = None if self.live else rollups.watermark()
+
+        if mark is None:
+            self.source = "live"
+            totals = self._live(rollups.sold_lines())
+        else:
+            self.source = "rollups"
+            totals = self._totals(
+                self._in_window(table.objects.all()), rollup_key, "units", "revenue"
+            )
+            fresh = self._live(rollups.sold_lines(order__completed_at__gt=mark))
+            for key, (units, revenue) in fresh.items():
+                stored_units, stored_revenue = totals.get(key, (0, 0))
+                totals[key] = (stored_units + units, stored_revenue + revenue)
+
+        return [
+            {self.key: key, "units": units, "revenue": round(revenue, 2)}
+            for key, (units, revenue) in sorted(totals.items())
+        ]
@@ -0,0 +1,127 @@
+"""Full-text product search backed by an SQLite FTS5 index
+
+The index is a virtual table keyed by product id holding each live
+product's name, description and location. Signal handlers keep it in
+step with saves, soft deletes and hard deletes; `rebuild_search_index`
+recreates it from the product table.
+"""
+
+import re
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from bangazonapi.models import Product
+
+PRODUCT_INDEX = "bangazonapi_product_fts"
+
+# bm25() weights for the name, description and location columns
+RANK = f"bm25({PRODUCT_INDEX}, 10.0, 1.0, 2.0)"
+
+
+def is_supported():
+    """Whether the database can hold an FTS5 index"""
+    return connection.vendor == "sqlite"
+
+
+def create_product_index():
+    """Create the FTS5 table if it does not exist yet"""
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {PRODUCT_INDEX} "
+            "USING fts5(name, description, location, tokenize='porter unicode61')"
+        )
+
+
+def index_product(product):
+    """Add or refresh a product, or drop it once it is soft deleted"""
+    if not is_supported():
+        return
+    if product.deleted is not None:
+        unindex_product(product.pk)
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT OR REPLACE INTO {PRODUCT_INDEX} (rowid, name, description, location) "
+            "VALUES (%s, %s, %s, %s)",
+            [product.pk, product.name, product.description, product.location],
+        )
+
+
+def unindex_product(product_id):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {PRODUCT_INDEX} WHERE rowid = %s", [product_id])
+
+
+def rebuild_product_index():
+    """Repopulate the index from every live product
+
+    Returns:
+        int -- Number of products indexed
+    """
+    create_product_index()
+    products = Product.objects.all()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {PRODUCT_INDEX}")
+        sql, params = products.values_list("id", "name", "description", "location").query.sql_with_params()
+        cursor.execute(
+            f"INSERT INTO {PRODUCT_INDEX} (rowid, name, description, location) {sql}", params
+        )
+        return cursor.rowcount
+
+
+def match_expression(text):
+    """FTS5 query matching every word in `text` as a prefix
+
+    Search boxes send free text, so quotes, operators and column filters
+    are stripped rather than passed to MATCH where they would be syntax.
+
+    Returns:
+        str -- MATCH expression, or None when `text` has no words
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_products(products, text):
+    """Narrow a product queryset to matches for `text`
+
+    On SQLite the index is joined into the same statement so the ORM
+    filters still apply. Other databases fall back to substring matching.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return products.none()
+
+    if not is_supported():
+        words = Q()
+        for word in re.findall(r"\w+", text):
+            words &= (
+                Q(name__icontains=word)
+                | Q(description__icontains=word)
+                | Q(location__icontains=word)
+            )
+        return products.filter(words)
+
+    table = Product._meta.db_table
+    return products.extra(
+        tables=[PRODUCT_INDEX],
+        where=[f"{PRODUCT_INDEX} MATCH %s", f"{PRODUCT_INDEX}.rowid = {table}.id"],
+        params=[expression],
+    )
+
+
+def rank_products(products):
+    """Annotate searched products with their BM25 `search_rank`
+
+    Lower is a better match. Only valid on a queryset that went through
+    search_products().
+    """
+    if not is_supported():
+        return products.annotate(search_rank=RawSQL("0", ()))
+    return products.annotate(search_rank=RawSQL(RANK, ()))
@@ -0,0 +1,245 @@
+"""Daily sales rollups and the live queries they stand in for
+
+DailyProductSales holds units, revenue and order counts per (day,
+product) of completed orders. DailySellerSales and DailyCategorySales
+are re-derived from it for whichever days change.
+
+roll_up() folds in orders paid since the "sales" watermark. It stops
+SALES_ROLLUP["LAG_SECONDS"] short of now so a checkout still committing
+is picked up by the next run rather than skipped. rebuild() recomputes
+everything, splitting the date range across a process pool.
+"""
+
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from bangazonapi.models import (
+    DailyCategorySales,
+    DailyProductSales,
+    DailySellerSales,
+    OrderProduct,
+    RollupWatermark,
+)
+from bangazonapi.workers import database_names, setup_django
+
+WATERMARK = "sales"
+
+# Sale day: the date the order was paid, or created_date for orders paid
+# before completed_at was recorded
+SALE_DAY = Coalesce(TruncDate("order__completed_at"), F("order__created_date"))
+
+
+def _options():
+    options = {"LAG_SECONDS": 60, "WORKERS": 4, "START_METHOD": None}
+    options.update(getattr(settings, "SALES_ROLLUP", {}))
+    return options
+
+
+def watermark():
+    """Completion time covered by the rollups, None before the first build"""
+    return (
+        RollupWatermark.objects.filter(name=WATERMARK)
+        .values_list("completed_at", flat=True)
+        .first()
+    )
+
+
+def sold_lines(*conditions, **filters):
+    """Line items of completed orders, with their sale day annotated"""
+    return OrderProduct.objects.filter(
+        *conditions, order__payment_type__isnull=False, **filters
+    ).annotate(day=SALE_DAY)
+
+
+def paid_by(until):
+    """Orders completed up to `until`, including those without a completion time"""
+    return Q(order__completed_at__lte=until) | Q(order__completed_at__isnull=True)
+
+
+def aggregate_sales(lines):
+    """(day, product) rows of units, revenue and orders for some line items
+
+    Returns:
+        list -- Dicts shaped like DailyProductSales rows
+    """
+    return list(
+        lines.values("day", "product_id")
+        .annotate(
+            seller_id=F("product__customer_id"),
+            category_id=F("product__category_id"),
+            orders=Count("order_id", distinct=True),
+            units=Sum("quantity"),
+            revenue=Sum(Coalesce("unit_price", "product__price") * F("quantity")),
+        )
+        .order_by()
+    )
+
+
+def _derive(days=None):
+    """Rewrite the seller and category rollups for `days`, all days when None"""
+    rollups = ((DailySellerSales, "seller_id"), (DailyCategorySales, "category_id"))
+    products = DailyProductSales.objects.all()
+    if days is not None:
+        products = products.filter(day__in=days)
+
+    for model, key in rollups:
+        stale = model.objects.all() if days is None else model.objects.filter(day__in=days)
+        stale.delete()
+        totals = products.values("day", key).annotate(
+            total_units=Sum("units"), total_revenue=Sum("revenue")
+        )
+        model.objects.bulk_create(
+            [
+                model(
+                    day=row["day"],
+                    **{key: row[key]},
+                    units=row["total_units"],
+                    revenue=round(row["total_revenue"], 2),
+                )
+                for row in totals.order_by()
+            ],
+            batch_size=1000,
+        )
+
+
+def _set_watermark(completed_at):
+    RollupWatermark.objects.update_or_create(
+        name=WATERMARK, defaults={"completed_at": completed_at}
+    )
+
+
+def roll_up(until=None):
+    """Fold orders paid since the watermark into the rollups
+
+    The product rows are added to, and the watermark moves, in the same
+    transaction, so each order is counted exactly once.
+
+    Arguments:
+        until {datetime} -- Newest completion time to include; defaults to
+            now minus LAG_SECONDS
+
+    Returns:
+        int -- (day, product) rows touched, or None when there is no
+            watermark yet and rebuild() has to run first
+    """
+    since = watermark()
+    if since is None:
+        return None
+    if until is None:
+        until = timezone.now() - datetime.timedelta(seconds=_options()["LAG_SECONDS"])
+    if until <= since:
+        return 0
+
+    with transaction.atomic():
+        rows = aggregate_sales(
+            sold_lines(order__completed_at__gt=since, order__completed_at__lte=until)
+        )
+        existing = {
+            (row.day, row.product_id): row
+            for row in DailyProductSales.objects.filter(
+                day__in={row["day"] for row in rows},
+                product_id__in={row["product_id"] for row in rows},
+            )
+        }
+        for row in rows:
+            stored = existing.get((row["day"], row["product_id"]), None)
+            if stored is not None:
+                row["orders"] += stored.orders
+                row["units"] += stored.units
+                row["revenue"] += stored.revenue
+            row["revenue"] = round(row["revenue"], 2)
+
+        DailyProductSales.objects.bulk_create(
+            [DailyProductSales(**row) for row in rows],
+            update_conflicts=True,
+            unique_fields=["day", "product"],
+            update_fields=["orders", "units", "revenue", "seller", "category"],
+            batch_size=1000,
+        )
+        _derive({row["day"] for row in rows})
+        _set_watermark(until)
+    return len(rows)
+
+
+def sold_between(first_day, last_day):
+    """Orders whose sale day is in [first_day, last_day], on indexed columns"""
+    start = datetime.datetime.combine(first_day, datetime.time(), datetime.timezone.utc)
+    end = datetime.datetime.combine(last_day, datetime.time(), datetime.timezone.utc)
+    return Q(
+        order__completed_at__gte=start,
+        order__completed_at__lt=end + datetime.timedelta(days=1),
+    ) | Q(order__completed_at__isnull=True, order__created_date__range=(first_day, last_day))
+
+
+def _aggregate_range(until, first_day, last_day):
+    """Process pool worker: product rows for sale days in [first_day, last_day]"""
+    connections.close_all()
+    try:
+        return aggregate_sales(sold_lines(paid_by(until), sold_between(first_day, last_day)))
+    finally:
+        connections.close_all()
+
+
+def _day_ranges(first, last, parts):
+    """Split [first, last] into up to `parts` contiguous date ranges"""
+    span = (last - first).days + 1
+    step = max(1, -(-span // parts))
+    ranges = []
+    while first <= last:
+        end = min(first + datetime.timedelta(days=step - 1), last)
+        ranges.append((first, end))
+        first = end + datetime.timedelta(days=1)
+    return ranges
+
+
+def rebuild(workers=None):
+    """Recompute every rollup from scratch and reset the watermark
+
+    Date ranges are aggregated in parallel by a process pool (workers=0
+    runs them inline); the results are written in one transaction.
+    Workers start with SALES_ROLLUP["START_METHOD"], the platform's
+    default when None, and set Django up for themselves.
+
+    Returns:
+        int -- (day, product) rows written
+    """
+    workers = _options()["WORKERS"] if workers is None else workers
+    until = timezone.now() - datetime.timedelta(seconds=_options()["LAG_SECONDS"])
+
+    lines = sold_lines(paid_by(until))
+    bounds = lines.order_by().aggregate(first=Min("day"), last=Max("day"))
+    rows = []
+    if bounds["first"] is not None:
+        if workers:
+            ranges = _day_ranges(bounds["first"], bounds["last"], workers * 4)
+            # Children must open their own connections, not share the parent's
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(_options()["START_METHOD"]),
+                initializer=setup_django,
+                initargs=(database_names(),),
+            ) as pool:
+                for chunk in pool.map(
+                    _aggregate_range, [until] * len(ranges), *zip(*ranges)
+                ):
+                    rows += chunk
+        else:
+            rows = aggregate_sales(lines)
+
+    for row in rows:
+        row["revenue"] = round(row["revenue"], 2)
+
+    with transaction.atomic():
+        DailyProductSales.objects.all().delete()
+        DailyProductSales.objects.bulk_create(
+            [DailyProductSales(**row) for row in rows], batch_size=1000
+        )
+        _derive()
+        _set_watermark(until)
+    return len(rows)
@@ -0,0 +1,160 @@
+"""Signal handlers that keep denormalized data in step with its source rows"""
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from bangazonapi import profiles
+from bangazonapi.cache import product_cache
+from bangazonapi.models import Customer, Like, Payment, Recommendation
+from bangazonapi.models import Product, ProductCategory, ProductRating, Rating, RatingAggregate, Store
+from bangazonapi.models.order import order_completed
+from bangazonapi.queries import search
+
+
+def invalidate_products(*pks):
+    """Drop cached payloads for products now and again once committed
+
+    The second bump stops a reader that ran between the first bump and
+    the commit from caching the old row under the new version.
+    """
+    product_cache.bump(*pks)
+    transaction.on_commit(lambda: product_cache.bump(*pks))
+
+
+def rating_changed(*pks):
+    """A product's average rating is part of its payload and ETag"""
+    Product.touch(*pks)
+    invalidate_products(*pks)
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductCategory)
+@receiver(pre_save, sender=Store)
+def stamp_modified_date(sender, instance, raw, **kwargs):
+    """Move modified_date forward on every save except fixture loads
+
+    Conditional GET responses are keyed on it. It is not auto_now so
+    fixtures without the column still load with the default.
+    """
+    if not raw:
+        instance.modified_date = timezone.now()
+
+
+@receiver(pre_save, sender=ProductRating)
+@receiver(pre_save, sender=Rating)
+def remember_previous_rating(sender, instance, **kwargs):
+    """Capture the stored score before a rating is overwritten"""
+    instance._previous_rating = None
+    if instance.pk is not None:
+        instance._previous_rating = (
+            ProductRating.objects.filter(pk=instance.pk)
+            .values_list("product_id", "rating")
+            .first()
+        )
+
+
+@receiver(post_save, sender=ProductRating)
+@receiver(post_save, sender=Rating)
+def add_rating_to_aggregate(sender, instance, **kwargs):
+    previous = getattr(instance, "_previous_rating", None)
+
+    if previous is None:
+        RatingAggregate.apply(instance.product_id, added=instance.rating)
+    elif previous[0] == instance.product_id:
+        RatingAggregate.apply(
+            instance.product_id, added=instance.rating, removed=previous[1]
+        )
+    else:
+        RatingAggregate.apply(previous[0], removed=previous[1])
+        RatingAggregate.apply(instance.product_id, added=instance.rating)
+        rating_changed(previous[0])
+
+    rating_changed(instance.product_id)
+
+
+@receiver(post_delete, sender=ProductRating)
+@receiver(post_delete, sender=Rating)
+def remove_rating_from_aggregate(sender, instance, **kwargs):
+    RatingAggregate.apply(instance.product_id, removed=instance.rating)
+    rating_changed(instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    """Keep the search index and cache in step, including soft deletes"""
+    search.index_product(instance)
+    invalidate_products(instance.pk)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+    invalidate_products(instance.pk)
+
+
+@receiver(order_completed)
+def invalidate_sold_products(sender, order, product_ids, **kwargs):
+    """number_sold changed for every product on a completed order"""
+    invalidate_products(*product_ids)
+
+
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def refresh_liked_products(sender, instance, raw=False, **kwargs):
+    if not raw:
+        profiles.refresh_sections([instance.customer_id], "liked_products")
+
+
+@receiver(post_save, sender=Recommendation)
+@receiver(post_delete, sender=Recommendation)
+def refresh_recommendations(sender, instance, raw=False, **kwargs):
+    if not raw:
+        profiles.refresh_sections([instance.recommender_id], "recommends")
+        profiles.refresh_sections([instance.customer_id], "recommended_by")
+
+
+@receiver(post_save, sender=Store)
+@receiver(post_delete, sender=Store)
+def refresh_profile_store(sender, instance, raw=False, **kwargs):
+    if not raw:
+        profiles.refresh_sections([instance.seller_id], "store")
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def refresh_payment_types(sender, instance, raw=False, **kwargs):
+    """Soft deletes are saves, so they refresh the section too"""
+    if not raw:
+        profiles.refresh_sections([instance.customer_id], "payment_types")
+
+
+@receiver(post_save, sender=Customer)
+def forget_customer_profiles(sender, instance, created, raw, **kwargs):
+    """Names show up in other customers' recommendations, so rebuild those too"""
+    if not created and not raw:
+        profiles.forget_snapshots(profiles.customers_showing_customer(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def forget_user_profiles(sender, instance, created, raw, update_fields, **kwargs):
+    # Logins only stamp last_login, which no profile shows
+    if created or raw or update_fields == frozenset(["last_login"]):
+        return
+    customer_id = Customer.objects.filter(user=instance).values_list("id", flat=True).first()
+    if customer_id is not None:
+        profiles.forget_snapshots(profiles.customers_showing_customer(customer_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def forget_product_profiles(sender, instance, raw=False, **kwargs):
+    """Liked and recommended products are copied into profile snapshots"""
+    if not raw:
+        profiles.forget_product(instance.pk)
+
+
+def create_search_index(sender, **kwargs):
+    """Create the FTS5 table after migrate, which cannot model it"""
+    search.create_product_index()
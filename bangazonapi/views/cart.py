@@ -1,13 +1,124 @@
 """View module for handling requests about customer shopping cart"""
 
 import datetime
+from django.db import transaction
+from django.db.models import Sum
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.decorators import action
+from bangazonapi import carts
+from bangazonapi.fieldsets import Fieldset
 from bangazonapi.models import Order, Customer, Product, OrderProduct
-from .product import ProductSerializer
+from .product import serialize_products
 from .order import OrderSerializer
 
+NO_CART = "Order matching query does not exist."
+
+# Most changes accepted by one /cart/bulk request
+BULK_LIMIT = 100
+
+
+def parse_changes(entries, whole_line):
+    """Units per product id from a list of {product_id, quantity} entries
+
+    Repeated product ids are summed. Without a quantity, `whole_line`
+    entries mean the whole line (None) and others mean one unit.
+
+    Raises:
+        ValueError -- An entry is malformed
+    """
+    if not isinstance(entries, list):
+        raise ValueError("add and remove must be lists")
+    changes = {}
+    for entry in entries:
+        try:
+            product_id = int(entry["product_id"])
+            quantity = entry.get("quantity", None)
+            if quantity is not None:
+                quantity = int(quantity)
+            elif not whole_line:
+                quantity = 1
+        except (KeyError, TypeError, ValueError, AttributeError) as ex:
+            raise ValueError(
+                "Each change needs a product_id and an optional whole number quantity"
+            ) from ex
+        if quantity is not None and quantity < 1:
+            raise ValueError("quantity must be a positive whole number")
+        if quantity is None or changes.get(product_id, 0) is None:
+            changes[product_id] = None
+        else:
+            changes[product_id] = changes.get(product_id, 0) + quantity
+    return changes
+
+
+def summarize_cart(order_id, lines):
+    """Compact cart payload returned by /cart/bulk
+
+    Arguments:
+        order_id {int} -- Open order id
+        lines {iterable} -- (product_id, unit_price, quantity) per line
+    """
+    lines = sorted(lines)
+    products = {
+        pk: (name, price)
+        for pk, name, price in Product.all_objects.filter(
+            pk__in=[line[0] for line in lines]
+        ).values_list("id", "name", "price")
+    }
+    items = [
+        {
+            "product_id": product_id,
+            "name": products[product_id][0],
+            "unit_price": products[product_id][1] if unit_price is None else unit_price,
+            "quantity": quantity,
+        }
+        for product_id, unit_price, quantity in lines
+    ]
+    return {
+        "id": order_id,
+        "size": sum(item["quantity"] for item in items),
+        "total_price": round(sum(item["unit_price"] * item["quantity"] for item in items), 2),
+        "lineitems": items,
+    }
+
+
+def render_cart(cart, request):
+    """Cart list payload for a write-behind cart, without touching Order tables
+
+    Products come through product_cache. Lines not yet written back have
+    a null id.
+    """
+    order = Order(
+        id=cart["order_id"],
+        customer_id=cart["customer_id"],
+        created_date=datetime.date.fromisoformat(cart["created_date"]),
+    )
+    header = Fieldset({"id", "url", "created_date", "payment_type", "customer"})
+    payload = dict(OrderSerializer(order, context={"request": request}, fieldset=header).data)
+
+    lines = cart["lines"]
+    products = serialize_products(list(lines), request)
+    payload["lineitems"] = [
+        {
+            "id": lines[product["id"]]["id"],
+            "product": product,
+            "unit_price": lines[product["id"]]["unit_price"],
+            "quantity": lines[product["id"]]["quantity"],
+        }
+        for product in products
+    ]
+    payload["total_price"] = round(
+        sum(
+            (line["unit_price"] if line["unit_price"] is not None else line["product"]["price"])
+            * line["quantity"]
+            for line in payload["lineitems"]
+        ),
+        2,
+    )
+    payload["size"] = sum(line["quantity"] for line in lines.values())
+    return payload
+
 
 class Cart(ViewSet):
     """Shopping cart for Bangazon eCommerce"""
@@ -20,8 +131,25 @@ class Cart(ViewSet):
 
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
-        @apiParam {Number} product_id Id of product to add
+        @apiParam {Number} id Id of product to add
+        @apiParam {Number} [quantity=1] Units to add; adds to any already in the cart
+        @apiError (400) {String} message quantity is not a positive whole number
         """
+        try:
+            quantity = int(request.data.get("quantity", 1))
+        except (TypeError, ValueError):
+            quantity = 0
+        if quantity < 1:
+            return Response(
+                {"message": "quantity must be a positive whole number"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        store = carts.get_store()
+        if store is not None:
+            store.add(request.auth.user, Product.objects.get(pk=request.data["id"]), quantity)
+            return Response({}, status=status.HTTP_204_NO_CONTENT)
+
         current_user = Customer.objects.get(user=request.auth.user)
 
         try:
@@ -34,16 +162,90 @@ class Cart(ViewSet):
             open_order.customer = current_user
             open_order.save()
 
-        line_item = OrderProduct()
-        line_item.product = Product.objects.get(pk=request.data["id"])
-        line_item.order = open_order
-        line_item.save()
+        product = Product.objects.get(pk=request.data["id"])
+        OrderProduct.add(open_order, product, quantity)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
-    def delete(self, request):
-        current_user = Customer.objects.get(user=request.auth.user)
+    @action(methods=["post"], detail=False)
+    def bulk(self, request):
+        """
+        @api {POST} /cart/bulk POST many cart changes at once
+        @apiName BulkCart
+        @apiGroup ShoppingCart
 
+        @apiParam {Object[]} [add] Products to add
+        @apiParam {Number} add.product_id Id of product to add
+        @apiParam {Number} [add.quantity=1] Units to add
+        @apiParam {Object[]} [remove] Products to take off the cart
+        @apiParam {Number} remove.product_id Id of product to remove
+        @apiParam {Number} [remove.quantity] Units to remove; the whole line when left out
+        @apiParamExample {json} Input
+            {
+                "add": [{"product_id": 52, "quantity": 2}, {"product_id": 7}],
+                "remove": [{"product_id": 12}]
+            }
+
+        @apiSuccessExample {json} Success
+            {
+                "id": 2,
+                "size": 3,
+                "total_price": 2608.95,
+                "lineitems": [
+                    {"product_id": 7, "name": "Kite", "unit_price": 14.99, "quantity": 1},
+                    {"product_id": 52, "name": "900", "unit_price": 1296.98, "quantity": 2}
+                ]
+            }
+        @apiError (400) {String} message A change is malformed or names an unknown product
+        @apiError (404) {String} message Only removals were sent and there is no cart
+        """
+        try:
+            added = parse_changes(request.data.get("add", []), whole_line=False)
+            removed = parse_changes(request.data.get("remove", []), whole_line=True)
+        except ValueError as ex:
+            return Response({"message": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        if len(added) + len(removed) > BULK_LIMIT:
+            return Response(
+                {"message": f"Send at most {BULK_LIMIT} changes per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        products = Product.objects.in_bulk(list(added))
+        unknown = sorted(set(added) - set(products))
+        if unknown:
+            return Response(
+                {"message": f"Unknown product id(s): {', '.join(map(str, unknown))}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        added = {products[pk]: quantity for pk, quantity in added.items()}
+
+        store = carts.get_store()
+        if store is not None:
+            store.edit(request.auth.user, added, removed)
+            cart = store.get(request.auth.user)
+            if cart["order_id"] is None:
+                return Response({"message": NO_CART}, status=status.HTTP_404_NOT_FOUND)
+            lines = [
+                (product_id, line["unit_price"], line["quantity"])
+                for product_id, line in cart["lines"].items()
+            ]
+            return Response(summarize_cart(cart["order_id"], lines))
+
+        with transaction.atomic():
+            customer = Customer.objects.get(user=request.auth.user)
+            open_order = Order.objects.filter(customer=customer, payment_type__isnull=True).first()
+            if open_order is None:
+                if not added:
+                    return Response({"message": NO_CART}, status=status.HTTP_404_NOT_FOUND)
+                open_order = Order.objects.create(
+                    customer=customer, created_date=datetime.datetime.now()
+                )
+            OrderProduct.apply(open_order, added, removed)
+
+        lines = open_order.lineitems.values_list("product_id", "unit_price", "quantity")
+        return Response(summarize_cart(open_order.id, lines))
+
+    def delete(self, request):
         """
         @api {DELETE} /cart DELETE all line items in cart
         @apiName DeleteCart
@@ -57,6 +259,13 @@ class Cart(ViewSet):
             HTTP/1.1 204 No Content
         @apiError (404) {String} message  Not found message.
         """
+        store = carts.get_store()
+        if store is not None:
+            if not store.clear(request.auth.user):
+                return Response({"message": NO_CART}, status=status.HTTP_404_NOT_FOUND)
+            return Response({}, status=status.HTTP_204_NO_CONTENT)
+
+        current_user = Customer.objects.get(user=request.auth.user)
         try:
             open_order = Order.objects.get(customer=current_user, payment_type=None)
             line_items = OrderProduct.objects.filter(order=open_order)
@@ -74,14 +283,30 @@ class Cart(ViewSet):
         @apiGroup ShoppingCart
 
         @apiParam {id} id Product Id to remove from cart
+        @apiParam {Number} [quantity=1] Units to remove; the line is removed when none are left
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
+        @apiError (404) {String} message Product is not in the cart
         """
-        current_user = Customer.objects.get(user=request.auth.user)
-        open_order = Order.objects.get(customer=current_user, payment_type=None)
+        try:
+            quantity = max(1, int(request.query_params.get("quantity", 1)))
+        except ValueError:
+            quantity = 1
 
-        line_item = OrderProduct.objects.filter(product__id=pk, order=open_order)[0]
-        line_item.delete()
+        store = carts.get_store()
+        if store is not None:
+            product_id = int(pk) if str(pk).isdigit() else None
+            removed = store.remove(request.auth.user, product_id, quantity)
+        else:
+            current_user = Customer.objects.get(user=request.auth.user)
+            open_order = Order.objects.get(customer=current_user, payment_type=None)
+            removed = OrderProduct.remove(open_order, pk, quantity)
+
+        if not removed:
+            return Response(
+                {"message": "That product is not in your cart"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -96,9 +321,11 @@ class Cart(ViewSet):
         @apiSuccess (200) {String} created_date Date created
         @apiSuccess (200) {Object} payment_type Payment id use to complete order
         @apiSuccess (200) {String} customer URI for customer
-        @apiSuccess (200) {Number} size Number of items in cart
-        @apiSuccess (200) {Object[]} line_items Line items in cart
+        @apiSuccess (200) {Number} size Number of units in cart
+        @apiSuccess (200) {Object[]} line_items Line items in cart, one per product
         @apiSuccess (200) {Number} line_items.id Line item id
+        @apiSuccess (200) {Number} line_items.quantity Units of the product in cart
+        @apiSuccess (200) {Number} line_items.unit_price Price of one unit when it was added
         @apiSuccess (200) {Object} line_items.product Product in cart
         @apiSuccessExample {json} Success
             {
@@ -129,18 +356,25 @@ class Cart(ViewSet):
                 "size": 1
             }
         """
+        store = carts.get_store()
+        if store is not None:
+            cart = store.get(request.auth.user)
+            if cart["order_id"] is None:
+                return Response({"message": NO_CART}, status=status.HTTP_404_NOT_FOUND)
+            return Response(render_cart(cart, request))
+
         current_user = Customer.objects.get(user=request.auth.user)
         try:
             open_order = Order.objects.get(customer=current_user, payment_type=None)
 
-            products_on_order = Product.objects.filter(lineitems__order=open_order)
+            size = open_order.lineitems.aggregate(units=Sum("quantity"))["units"]
 
             serialized_order = OrderSerializer(
                 open_order, many=False, context={"request": request}
             )
 
             final = {"order": serialized_order.data}
-            final["order"]["size"] = len(products_on_order)
+            final["order"]["size"] = size or 0
 
         except Order.DoesNotExist as ex:
             return Response({"message": ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
@@ -3,7 +3,8 @@ from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
-from bangazonapi.models import Customer
+from django.utils import timezone
+from bangazonapi.models import Customer, Store
 
 
 class CustomerSerializer(serializers.HyperlinkedModelSerializer):
@@ -41,4 +42,7 @@ class Customers(ViewSet):
         customer.user.save()
         customer.save()
 
+        # Store pages embed the seller's name
+        Store.objects.filter(seller=customer).update(modified_date=timezone.now())
+
         return Response({}, status=status.HTTP_204_NO_CONTENT)
@@ -1,12 +1,17 @@
 """View module for handling requests about customer order"""
 
+import datetime
+from django.db.models import Prefetch
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from rest_framework.decorators import action
-from bangazonapi.models import Order, Payment, Customer, Product, OrderProduct
+from bangazonapi import carts
+from bangazonapi.models import Order, OutOfStock, Payment, Customer, Product, OrderProduct
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.fieldsets import Fieldset, SparseFieldsMixin
 from .product import ProductSerializer
 
 
@@ -20,7 +25,7 @@ class OrderLineItemSerializer(serializers.HyperlinkedModelSerializer):
         url = serializers.HyperlinkedIdentityField(
             view_name="lineitem", lookup_field="id"
         )
-        fields = ("id", "product")
+        fields = ("id", "product", "unit_price", "quantity")
         depth = 1
 
 
@@ -36,7 +41,7 @@ class PaymentSerializer(serializers.ModelSerializer):
         ]
 
 
-class OrderSerializer(serializers.HyperlinkedModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     """JSON serializer for customer orders"""
 
     lineitems = OrderLineItemSerializer(many=True)
@@ -54,6 +59,66 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
             "lineitems",
             "total_price",
         )
+        expandable_fields = ("lineitems", "payment_type")
+
+
+def line_price(line):
+    """Recorded unit price of a line, or its product's price on older rows"""
+    return line.product.price if line.unit_price is None else line.unit_price
+
+
+class CompactLineItemSerializer(serializers.ModelSerializer):
+    """Order history line: the product's id and name instead of the full product"""
+
+    name = serializers.CharField(source="product.name")
+    unit_price = serializers.SerializerMethodField()
+
+    class Meta:
+        model = OrderProduct
+        fields = ("product_id", "name", "unit_price", "quantity")
+
+    def get_unit_price(self, obj):
+        return line_price(obj)
+
+
+class OrderHistorySerializer(serializers.ModelSerializer):
+    """Paid order with compact lines, for /orders/history"""
+
+    lineitems = CompactLineItemSerializer(many=True)
+    total_price = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Order
+        fields = ("id", "created_date", "payment_type_id", "total_price", "lineitems")
+
+    def get_total_price(self, obj):
+        """Stored subtotal, or the sum of the prefetched lines for older orders"""
+        if obj.subtotal is not None:
+            return obj.subtotal
+        return round(sum(line_price(line) * line.quantity for line in obj.lineitems.all()), 2)
+
+
+def date_range(request):
+    """Bounds from the `from` and `to` query params, both inclusive
+
+    Raises:
+        ValueError -- A bound is not a YYYY-MM-DD date
+    """
+    bounds = {}
+    for param, lookup in (("from", "created_date__gte"), ("to", "created_date__lte")):
+        value = request.query_params.get(param, None)
+        if value:
+            bounds[lookup] = datetime.date.fromisoformat(value)
+    return bounds
+
+
+def fetch_orders(orders, fieldset):
+    """Join or prefetch only the relations the fieldset will render"""
+    if fieldset.includes("payment_type"):
+        orders = orders.select_related("payment_type")
+    if fieldset.includes("lineitems"):
+        orders = orders.prefetch_related("lineitems__product__rating_aggregate")
+    return orders
 
 
 class Orders(ViewSet):
@@ -69,6 +134,8 @@ class Orders(ViewSet):
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
+        @apiParam {String} [fields] Comma separated fields to return, e.g. id,total_price
+        @apiParam {String} [expand] Relations to include alongside fields: lineitems, payment_type
 
         @apiSuccess (200) {id} id Order id
         @apiSuccess (200) {String} url Order URI
@@ -85,10 +152,11 @@ class Orders(ViewSet):
                 "customer": "http://localhost:8000/customers/5"
             }
         """
+        fieldset = Fieldset.from_request(request, OrderSerializer)
         try:
             customer = Customer.objects.get(user=request.auth.user)
-            order = Order.objects.get(pk=pk, customer=customer)
-            serializer = OrderSerializer(order, context={"request": request})
+            order = fetch_orders(Order.objects.all(), fieldset).get(pk=pk, customer=customer)
+            serializer = OrderSerializer(order, context={"request": request}, fieldset=fieldset)
             return Response(serializer.data)
 
         except Order.DoesNotExist as ex:
@@ -121,11 +189,29 @@ class Orders(ViewSet):
 
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
+        @apiError (409) {String} message Some items are out of stock; the order stays open
+        @apiError (409) {Object[]} items One entry per product without enough stock
+        @apiErrorExample {json} Out of stock
+            HTTP/1.1 409 Conflict
+            {
+                "message": "Some items in this order are out of stock",
+                "items": [
+                    {"product_id": 52, "name": "900", "requested": 2, "available": 1}
+                ]
+            }
         """
+        store = carts.get_store()
+        if store is not None:
+            store.checkout(request.auth.user)
+
         customer = Customer.objects.get(user=request.auth.user)
         order = Order.objects.get(pk=pk, customer=customer)
-        order.payment_type = Payment.objects.get(pk=request.data["payment_type"])
-        order.save()
+        try:
+            order.complete(Payment.objects.get(pk=request.data["payment_type"]))
+        except OutOfStock as ex:
+            return Response(
+                {"message": str(ex), "items": ex.shortages}, status=status.HTTP_409_CONFLICT
+            )
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -139,7 +225,11 @@ class Orders(ViewSet):
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
-        @apiParam {id} payment_id Query param to filter by payment used
+        @apiParam {id} [payment_id] Query param to filter by payment used
+        @apiParam {Number} [page_size] Opt in to cursor pagination, newest orders first
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next or previous link
+        @apiParam {String} [fields] Comma separated fields to return, e.g. id,total_price
+        @apiParam {String} [expand] Relations to include alongside fields: lineitems, payment_type
 
         @apiSuccess (200) {Object[]} orders Array of order objects
         @apiSuccess (200) {id} orders.id Order id
@@ -147,6 +237,7 @@ class Orders(ViewSet):
         @apiSuccess (200) {String} orders.created_date Date order was created
         @apiSuccess (200) {String} orders.payment_type Payment URI
         @apiSuccess (200) {String} orders.customer Customer URI
+        @apiError (400) {String} message payment_id is not a whole number
 
         @apiSuccessExample {json} Success
             [
@@ -159,13 +250,88 @@ class Orders(ViewSet):
                 }
             ]
         """
+        fieldset = Fieldset.from_request(request, OrderSerializer)
         customer = Customer.objects.get(user=request.auth.user)
         orders = Order.objects.filter(customer=customer, payment_type__isnull=False)
+        orders = fetch_orders(orders, fieldset)
 
         payment = self.request.query_params.get("payment_id", None)
         if payment is not None:
-            orders = orders.filter(payment__id=payment)
+            try:
+                orders = orders.filter(payment_type_id=int(payment))
+            except ValueError:
+                return Response(
+                    {"message": "payment_id must be a whole number"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+        paginator = KeysetPagination(ordering=("-created_date", "-id"))
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(orders, request)
+            json_orders = OrderSerializer(
+                page, many=True, context={"request": request}, fieldset=fieldset
+            )
+            return paginator.get_paginated_response(json_orders.data)
 
-        json_orders = OrderSerializer(orders, many=True, context={"request": request})
+        json_orders = OrderSerializer(
+            orders, many=True, context={"request": request}, fieldset=fieldset
+        )
 
         return Response(json_orders.data)
+
+    @action(methods=["get"], detail=False)
+    def history(self, request):
+        """
+        @api {GET} /orders/history GET paid orders with compact line items
+        @apiName GetOrderHistory
+        @apiGroup Orders
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {String} [from] Earliest order date, YYYY-MM-DD
+        @apiParam {String} [to] Latest order date, YYYY-MM-DD
+        @apiParam {Number} [page_size] Orders per page, newest first
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next or previous link
+
+        @apiSuccessExample {json} Success
+            {
+                "next": "http://localhost:8000/orders/history?cursor=eyJvIjpb...",
+                "previous": null,
+                "results": [
+                    {
+                        "id": 1,
+                        "created_date": "2019-08-16",
+                        "payment_type_id": 1,
+                        "total_price": 29.98,
+                        "lineitems": [
+                            {"product_id": 7, "name": "Kite", "unit_price": 14.99, "quantity": 2}
+                        ]
+                    }
+                ]
+            }
+        @apiError (400) {String} message from or to is not a date
+        """
+        try:
+            bounds = date_range(request)
+        except ValueError:
+            return Response(
+                {"message": "from and to must be dates in YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        lines = OrderProduct.objects.select_related("product").only(
+            "order_id", "product_id", "unit_price", "quantity", "product__name", "product__price"
+        )
+        orders = (
+            Order.objects.filter(
+                customer__user=request.auth.user, payment_type__isnull=False, **bounds
+            )
+            .only("id", "created_date", "payment_type_id", "subtotal")
+            .prefetch_related(Prefetch("lineitems", queryset=lines))
+        )
+
+        paginator = KeysetPagination(ordering=("-created_date", "-id"))
+        page = paginator.paginate_queryset(orders, request)
+        return paginator.get_paginated_response(OrderHistorySerializer(page, many=True).data)
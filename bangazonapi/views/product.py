@@ -2,23 +2,42 @@
 
 from rest_framework.decorators import action
 from bangazonapi.models.recommendation import Recommendation
-import base64
-from django.core.files.base import ContentFile
-from django.http import HttpResponseServerError
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from django.core.exceptions import ValidationError
 from rest_framework import status
 from bangazonapi.models import Product, Customer, ProductCategory
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.permissions import IsAdminUser, IsAuthenticatedOrReadOnly
 from rest_framework.parsers import MultiPartParser, FormParser
-from django.core.validators import MaxValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
 from bangazonapi.models.like import Like
-
-class ProductSerializer(serializers.ModelSerializer):
+from bangazonapi.models import ProductRating, RatingAggregate
+from bangazonapi.queries import ProductFacets, ProductQuery, ProductQueryError
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.streaming import stream_json, wants_stream
+from bangazonapi.cache import facet_cache, product_cache
+from bangazonapi.conditional import conditional_response
+from bangazonapi.fieldsets import Fieldset, SparseFieldsMixin
+from bangazonapi.images import pipeline as image_pipeline
+from bangazonapi.images.transform import ImageRejected
+
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """JSON serializer for products"""
 
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        """Absolute URLs of the generated thumbnails and WebP copies"""
+        request = self.context.get("request", None)
+        urls = {}
+        for name, path in obj.image_variants.items():
+            url = default_storage.url(path)
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
     price = serializers.FloatField(
         validators=[
             MaxValueValidator(
@@ -39,12 +58,49 @@ class ProductSerializer(serializers.ModelSerializer):
             "created_date",
             "location",
             "image_path",
+            "image_variants",
+            "image_status",
             "average_rating",
             "can_be_rated",
         )
         depth = 1
 
 
+def serialize_products(products, request, fieldset=None):
+    """ProductSerializer output for many products, read through product_cache
+
+    Arguments:
+        products {list} -- Product instances, or product ids to load on a miss
+        request {Request} -- Current request, used for absolute image URLs
+        fieldset {Fieldset} -- Fields to return; the cache always holds every field
+
+    Returns:
+        list -- Serialized products in the given order, skipping missing ids
+    """
+    products = list(products)
+    pks = [product.pk if isinstance(product, Product) else product for product in products]
+
+    # Absolute image URLs depend on the host the request came in on
+    variant = request.build_absolute_uri("/")
+    payloads, versions = product_cache.get_many(pks, variant)
+
+    missing = [product for product, pk in zip(products, pks) if pk not in payloads]
+    if missing:
+        instances = [product for product in missing if isinstance(product, Product)]
+        ids = [product for product in missing if not isinstance(product, Product)]
+        if ids:
+            instances += Product.objects.select_related("rating_aggregate").in_bulk(ids).values()
+
+        serializer = ProductSerializer(instances, many=True, context={"request": request})
+        fresh = {item["id"]: dict(item) for item in serializer.data}
+        product_cache.set_many(fresh, versions, variant)
+        payloads.update(fresh)
+
+    if fieldset is None:
+        return [dict(payloads[pk]) for pk in pks if pk in payloads]
+    return [fieldset.project(dict(payloads[pk])) for pk in pks if pk in payloads]
+
+
 class Products(ViewSet):
     """Request handlers for Products in the Bangazon Platform"""
 
@@ -66,6 +122,7 @@ class Products(ViewSet):
         @apiParam {Number} quantity Number of items to sell
         @apiParam {String} location City where product is located
         @apiParam {Number} category_id Category of product
+        @apiParam {String} [image_path] Base64 data URL of the product image, processed in the background
         @apiParamExample {json} Input
             {
                 "name": "Kite",
@@ -85,9 +142,13 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants URLs of thumbnails and WebP copies, once processed
+        @apiSuccess (200) {String} product.image_status "pending", "ready" or "failed" when an image was uploaded
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
+        @apiError (400) {String} error Image is not a valid base64 image data URL
+        @apiError (503) {String} error Image queue is full, retry after the Retry-After delay
         @apiSuccessExample {json} Success
             {
                 "id": 101,
@@ -100,6 +161,8 @@ class Products(ViewSet):
                 "created_date": "2019-10-23",
                 "location": "Pittsburgh",
                 "image_path": null,
+                "image_variants": {},
+                "image_status": "pending",
                 "average_rating": 0,
                 "category": {
                     "url": "http://localhost:8000/productcategories/6",
@@ -129,19 +192,32 @@ class Products(ViewSet):
         product_category = ProductCategory.objects.get(pk=request.data["category_id"])
         new_product.category = product_category
 
-        if "image_path" in request.data:
-            format, imgstr = request.data["image_path"].split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(
-                base64.b64decode(imgstr),
-                name=f'{new_product.id}-{request.data["name"]}.{ext}',
-            )
+        image = slot = None
+        if request.data.get("image_path", None):
+            try:
+                image = image_pipeline.parse_data_url(request.data["image_path"])
+            except ImageRejected as ex:
+                return Response({"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+            # Hold the queue slot from here on so the upload never waits for one
+            slot = image_pipeline.reserve()
+            if slot is None:
+                return Response(
+                    {"error": "Too many images are being processed, try again shortly"},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": "5"},
+                )
 
-            new_product.image_path = data
-        else:
-            pass
+        try:
+            new_product.save()
+        except BaseException:
+            if slot is not None:
+                slot.release()
+            raise
 
-        new_product.save()
+        # The image is decoded, checked and resized in a worker process.
+        # image_status moves from "pending" to "ready" or "failed".
+        if image is not None:
+            image_pipeline.submit(new_product, image, slot)
 
         serializer = ProductSerializer(new_product, context={"request": request})
 
@@ -154,6 +230,10 @@ class Products(ViewSet):
         @apiGroup Product
 
         @apiParam {id} id Product Id
+        @apiParam {String} [fields] Comma separated fields to return, e.g. id,name,price
+
+        @apiHeader {String} [If-None-Match] ETag from an earlier response; answered with 304 if unchanged
+        @apiHeader {String} [If-Modified-Since] Last-Modified from an earlier response
 
         @apiSuccess (200) {Object} product Created product
         @apiSuccess (200) {id} product.id Product Id
@@ -186,12 +266,22 @@ class Products(ViewSet):
                 }
             }
         """
+        not_found = Response({"message": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        fieldset = Fieldset.from_request(request, ProductSerializer)
         try:
-            product = Product.objects.get(pk=pk)
-            serializer = ProductSerializer(product, context={"request": request})
-            return Response(serializer.data)
-        except Exception as ex:
-            return HttpResponseServerError(ex)
+            pk = int(pk)
+        except ValueError:
+            return not_found
+
+        modified = Product.objects.filter(pk=pk).values_list("modified_date", flat=True).first()
+        if modified is None:
+            return not_found
+
+        def build():
+            product = serialize_products([pk], request, fieldset)
+            return Response(product[0]) if product else not_found
+
+        return conditional_response(request, build, (pk, modified), modified)
 
     def update(self, request, pk=None):
         """
@@ -258,7 +348,27 @@ class Products(ViewSet):
         @apiName ListProducts
         @apiGroup Product
 
-        @apiSuccess (200) {Object[]} products Array of products
+        @apiHeader {String} [If-None-Match] ETag from an earlier response; answered with 304 if unchanged
+        @apiHeader {String} [If-Modified-Since] Last-Modified from an earlier response
+
+        @apiParam {String} [q] Full-text search over name, description and location, best matches first
+        @apiParam {Number} [category] Only products in this category
+        @apiParam {String} [location] Only products in this city
+        @apiParam {Number} [min_price] Only products at or above this price
+        @apiParam {Number} [max_price] Only products at or below this price
+        @apiParam {Number} [number_sold] Only products with at least this many sold
+        @apiParam {String} [order_by] id, name, price, quantity, location, created_date, number_sold or average_rating
+        @apiParam {String} [direction] "desc" to reverse order_by
+        @apiParam {Number} [quantity] Return at most this many of the newest products
+        @apiParam {Boolean} [recent] Return the 5 newest products
+        @apiParam {Number} [page_size] Opt in to cursor pagination with this many products per page
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next or previous link
+        @apiParam {Boolean} [stream] Stream the whole array row by row (or send Accept: application/json; stream=true)
+        @apiParam {String} [fields] Comma separated fields to return, e.g. id,name,price
+
+        @apiSuccess (200) {Object[]} products Array of products, or when paginated
+            an object with next and previous links and the products in results
+        @apiError (400) {String} error Invalid filter or ordering parameter
         @apiSuccessExample {json} Success
             [
                 {
@@ -280,55 +390,33 @@ class Products(ViewSet):
                 }
             ]
         """
-        products = Product.objects.all()
-
-        # Support filtering by category and/or quantity
-        category = self.request.query_params.get("category", None)
-        quantity = self.request.query_params.get("quantity", None)
-        order = self.request.query_params.get("order_by", None)
-        direction = self.request.query_params.get("direction", None)
-        number_sold = self.request.query_params.get("number_sold", None)
-        location = self.request.query_params.get("location", None)
-        min_price = self.request.query_params.get("min_price")
-        recent = self.request.query_params.get("recent", None)
-
-        if order is not None:
-            order_filter = order
-
-            if direction is not None:
-                if direction == "desc":
-                    order_filter = f"-{order}"
-
-            products = products.order_by(order_filter)
-
-        if category is not None:
-            products = products.filter(category__id=category)
-
-        if quantity is not None:
-            products = products.order_by("-created_date")[: int(quantity)]
-
-        if number_sold is not None:
-
-            def sold_filter(product):
-                if product.number_sold >= int(number_sold):
-                    return True
-                return False
-
-            products = filter(sold_filter, products)
-
-        if location is not None:
-            products = products.filter(location=location)  # Filter by location
-
-        if min_price is not None:
-            products = products.filter(price__gte=min_price)
-
-        if recent is not None:
-            products = products.order_by("-created_date")[:5]
-
-        serializer = ProductSerializer(
-            products, many=True, context={"request": request}
+        try:
+            query = ProductQuery(request.query_params)
+        except ProductQueryError as ex:
+            return Response({"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+        fieldset = Fieldset.from_request(request, ProductSerializer)
+
+        def build():
+            products = query.queryset()
+
+            if wants_stream(request):
+                serializer = ProductSerializer(context={"request": request}, fieldset=fieldset)
+                return stream_json(products, serializer)
+
+            paginator = KeysetPagination(ordering=query.ordering)
+            if query.limit is None and paginator.is_requested(request):
+                page = paginator.paginate_queryset(products, request)
+                return paginator.get_paginated_response(
+                    serialize_products(page, request, fieldset)
+                )
+
+            return Response(serialize_products(products, request, fieldset))
+
+        # Soft deletes move modified_date and hard deletes change the count
+        stamp = Product.all_objects.aggregate(modified=Max("modified_date"), count=Count("id"))
+        return conditional_response(
+            request, build, (stamp["modified"], stamp["count"]), stamp["modified"]
         )
-        return Response(serializer.data)
 
     @action(methods=["post"], detail=True)
     def recommend(self, request, pk=None):
@@ -383,4 +471,140 @@ class Products(ViewSet):
             except Product.DoesNotExist:
                 return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        return Response(None, status=status.HTTP_405_METHOD_NOT_ALLOWED)
\ No newline at end of file
+        return Response(None, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    @action(methods=["post"], detail=True)
+    def rate(self, request, pk=None):
+        """
+        @api {POST} /products/:id/rate POST rating for product
+        @apiName RateProduct
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {id} id Product Id to rate
+        @apiParam {Number} rating Score from 0 to 5. Replaces any earlier rating by the same customer.
+        @apiParamExample {json} Input
+            {
+                "rating": 4
+            }
+
+        @apiSuccess (201) {Number} rating Score that was stored
+        @apiSuccess (201) {Number} average_rating New average rating of product
+        @apiSuccess (201) {Number} rating_count Number of ratings for product
+        @apiSuccess (201) {Object} histogram Number of ratings per score
+        @apiSuccessExample {json} Success
+            {
+                "rating": 4,
+                "average_rating": 3.5,
+                "rating_count": 2,
+                "histogram": {"0": 0, "1": 0, "2": 0, "3": 1, "4": 1, "5": 0}
+            }
+        """
+        try:
+            product = Product.objects.get(pk=pk)
+        except Product.DoesNotExist:
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            score = int(request.data["rating"])
+            MinValueValidator(0)(score)
+            MaxValueValidator(5)(score)
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"error": "A rating from 0 to 5 is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except ValidationError as e:
+            return Response({"error": e.messages}, status=status.HTTP_400_BAD_REQUEST)
+
+        customer = Customer.objects.get(user=request.auth.user)
+        _, created = ProductRating.objects.update_or_create(
+            product=product, customer=customer, defaults={"rating": score}
+        )
+
+        aggregate = RatingAggregate.objects.get(product=product)
+
+        return Response(
+            {
+                "rating": score,
+                "average_rating": aggregate.average,
+                "rating_count": aggregate.rating_count,
+                "histogram": aggregate.histogram,
+            },
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(methods=["get"], detail=False)
+    def facets(self, request):
+        """
+        @api {GET} /products/facets GET product counts by category, location and price
+        @apiName ProductFacets
+        @apiGroup Product
+
+        @apiParam {String} [q] Same filters as GET /products; ordering and limits are ignored
+        @apiParam {Number} [category]
+        @apiParam {String} [location]
+        @apiParam {Number} [min_price]
+        @apiParam {Number} [max_price]
+        @apiParam {Number} [number_sold]
+        @apiParam {String} [price_buckets] Increasing upper bounds of the price ranges, e.g. 10,50,100
+
+        @apiSuccess (200) {Number} count Number of matching products
+        @apiSuccess (200) {Object[]} categories Matching products per category, largest first
+        @apiSuccess (200) {Object[]} locations Matching products per location, largest first
+        @apiSuccess (200) {Object[]} prices Matching products per price range; max is exclusive and null on the last range
+        @apiError (400) {String} error Invalid filter or price_buckets parameter
+        @apiSuccessExample {json} Success
+            {
+                "count": 3,
+                "categories": [
+                    { "id": 6, "name": "Games/Toys", "count": 3 }
+                ],
+                "locations": [
+                    { "location": "Pittsburgh", "count": 2 },
+                    { "location": "Nashville", "count": 1 }
+                ],
+                "prices": [
+                    { "min": 0.0, "max": 25.0, "count": 2 },
+                    { "min": 25.0, "max": null, "count": 1 }
+                ]
+            }
+        """
+        try:
+            facets = ProductFacets(ProductQuery(request.query_params), request.query_params)
+        except ProductQueryError as ex:
+            return Response({"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Counts may lag writes by the cache TIMEOUT, which is fine for filters
+        key = f"facets:{facets.signature}"
+        counts = facet_cache.get(key)
+        if counts is None:
+            counts = facets.counts()
+            facet_cache.set(key, counts)
+        return Response(counts)
+
+    @action(methods=["get"], detail=False, permission_classes=[IsAdminUser])
+    def cachestats(self, request):
+        """
+        @api {GET} /products/cachestats GET product cache hit/miss counters
+        @apiName ProductCacheStats
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token of a staff user
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiSuccess (200) {Number} hits Serialized products served from cache by this worker
+        @apiSuccess (200) {Number} misses Serialized products rebuilt by this worker
+        @apiSuccess (200) {Number} hit_rate hits / (hits + misses)
+        @apiSuccessExample {json} Success
+            {
+                "hits": 950,
+                "misses": 50,
+                "hit_rate": 0.95
+            }
+        """
+        return Response(product_cache.stats())
@@ -12,6 +12,8 @@ from rest_framework import serializers
 from rest_framework import status
 from bangazonapi.models import ProductCategory
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from django.db.models import Count, Max
+from bangazonapi.conditional import conditional_response
 
 
 class ProductCategorySerializer(serializers.HyperlinkedModelSerializer):
@@ -44,16 +46,27 @@ class ProductCategories(ViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def retrieve(self, request, pk=None):
-        """Handle GET requests for single category"""
+        """Handle GET requests for single category
+
+        Answers If-None-Match / If-Modified-Since with 304 when unchanged.
+        """
         try:
             category = ProductCategory.objects.get(pk=pk)
-            serializer = ProductCategorySerializer(category, context={'request': request})
-            return Response(serializer.data)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+        def build():
+            serializer = ProductCategorySerializer(category, context={'request': request})
+            return Response(serializer.data)
+
+        return conditional_response(
+            request, build, (category.id, category.modified_date), category.modified_date)
+
     def list(self, request):
-        """Handle GET requests to ProductCategory resource"""
+        """Handle GET requests to ProductCategory resource
+
+        Answers If-None-Match / If-Modified-Since with 304 when unchanged.
+        """
         product_category = ProductCategory.objects.all()
 
         # Support filtering ProductCategorys by area id
@@ -61,6 +74,11 @@ class ProductCategories(ViewSet):
         # if name is not None:
         #     ProductCategories = ProductCategories.filter(name=name)
 
-        serializer = ProductCategorySerializer(
-            product_category, many=True, context={'request': request})
-        return Response(serializer.data)
+        def build():
+            serializer = ProductCategorySerializer(
+                product_category, many=True, context={'request': request})
+            return Response(serializer.data)
+
+        stamp = ProductCategory.objects.aggregate(modified=Max('modified_date'), count=Count('id'))
+        return conditional_response(
+            request, build, (stamp['modified'], stamp['count']), stamp['modified'])
@@ -5,17 +5,38 @@ from django.http import HttpResponseServerError
 from django.contrib.auth.models import User
 from rest_framework import serializers, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import ViewSet
 from bangazonapi.models import Order, Customer, Product, Like, Store
 from bangazonapi.models import OrderProduct, Favorite
-from bangazonapi.models import Recommendation, Store
+from bangazonapi.models import Recommendation, Store, ProfileSnapshot
+from bangazonapi.fieldsets import Fieldset, SparseFieldsMixin
+from bangazonapi.cache import favorite_sellers
+from bangazonapi.profiles import absolutize, build_snapshot
 from .product import ProductSerializer
 
 # from .order import OrderSerializer
 
 
+COLLECTIONS = ("payment_types", "recommends", "liked_products", "recommended_by", "store")
+
+
+def load_snapshot(user, collections):
+    """The user's ProfileSnapshot with only the needed columns, built if missing"""
+    snapshot = (
+        ProfileSnapshot.objects.filter(customer__user=user)
+        .only("customer_id", "header", *collections)
+        .first()
+    )
+    if snapshot is None:
+        snapshot = build_snapshot(Customer.objects.select_related("user").get(user=user))
+    return snapshot
+
+
 class Profile(ViewSet):
     """Request handlers for user profile info in the Bangazon Platform"""
 
@@ -31,6 +52,12 @@ class Profile(ViewSet):
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
+        @apiParam {String} [fields] Comma separated fields to return, e.g. id,user
+        @apiParam {String} [expand] Relations to include alongside fields: payment_types,
+            recommends, liked_products, recommended_by, store
+        @apiParam {Number} [limit] Return only the first `limit` items of each collection, plus a
+            collections object with each one's count and a link to its next page
+
         @apiSuccess (200) {Number} id Profile id
         @apiSuccess (200) {String} url URI of customer profile
         @apiSuccess (200) {Object} user Related user object
@@ -83,24 +110,62 @@ class Profile(ViewSet):
                 ]
             }
         """
+        fieldset = Fieldset.from_request(request, ProfileSerializer)
         try:
-            current_user = Customer.objects.get(user=request.auth.user)
-            current_user.recommends = Recommendation.objects.filter(
-                recommender=current_user
-            )
-            current_user.recommended_by = Recommendation.objects.filter(
-                customer=current_user
-            )
+            collections = [name for name in COLLECTIONS if fieldset.includes(name)]
+            snapshot = load_snapshot(request.auth.user, collections)
+
+            profile = fieldset.project(dict(snapshot.header))
+            for name in collections:
+                profile[name] = getattr(snapshot, name)
+
+            if "limit" in request.query_params:
+                paginator = LimitOffsetPagination()
+                profile["collections"] = {}
+                for name in collections:
+                    page = paginator.paginate_queryset(profile[name], request, view=self)
+                    next_link = None
+                    if paginator.get_next_link():
+                        url = reverse("profile-collection", kwargs={"collection": name}, request=request)
+                        next_link = replace_query_param(url, "limit", paginator.limit)
+                        next_link = replace_query_param(next_link, "offset", paginator.limit)
+                    profile[name] = page
+                    profile["collections"][name] = {"count": paginator.count, "next": next_link}
+
+            return Response(absolutize(profile, request))
+        except Exception as ex:
+            return HttpResponseServerError(ex)
 
-            current_user.store = Store.objects.filter(seller=current_user)
+    @action(
+        methods=["get"],
+        detail=False,
+        url_path=r"(?P<collection>payment_types|recommends|recommended_by|liked_products|store)",
+        permission_classes=[IsAuthenticated],
+    )
+    def collection(self, request, collection=None):
+        """
+        @api {GET} /profile/:collection GET a page of one profile collection
+        @apiName GetProfileCollection
+        @apiGroup UserProfile
 
-            serializer = ProfileSerializer(
-                current_user, many=False, context={"request": request}
-            )
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
-            return Response(serializer.data)
-        except Exception as ex:
-            return HttpResponseServerError(ex)
+        @apiParam {String} collection payment_types, recommends, recommended_by, liked_products or store
+        @apiParam {Number} [limit] Items per page, 10 by default
+        @apiParam {Number} [offset] Items to skip
+
+        @apiSuccess (200) {Number} count Items in the whole collection
+        @apiSuccess (200) {String} next URL of the next page, or null
+        @apiSuccess (200) {String} previous URL of the previous page, or null
+        @apiSuccess (200) {Object[]} results Items on this page, shaped as in GET /profile
+        @apiError (401) {String} detail No auth token was sent
+        """
+        snapshot = load_snapshot(request.auth.user, [collection])
+        paginator = LimitOffsetPagination()
+        page = paginator.paginate_queryset(getattr(snapshot, collection), request, view=self)
+        return paginator.get_paginated_response(absolutize(page, request))
 
     @action(methods=["get", "post", "delete"], detail=False)
     def favoritesellers(self, request):
@@ -113,6 +178,9 @@ class Profile(ViewSet):
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
+        @apiParam {id} [store_id] POST favorites, and DELETE unfavorites, this store's seller.
+            Favoriting the same seller twice is a no-op.
+
         @apiSuccess (200) {id} id Favorite id
         @apiSuccess (200) {Object} seller Favorited seller
         @apiSuccess (200) {String} seller.url Seller URI
@@ -160,19 +228,19 @@ class Profile(ViewSet):
             return Response(serializer.data)
         
         if request.method == "POST":
-            store = Store.objects.get(pk=request.data['store_id']) 
-            favorite = Favorite()
-            favorite.customer = Customer.objects.get(user=request.auth.user)
-            favorite.seller = store.seller
-            favorite.save()
+            store = Store.objects.get(pk=request.data['store_id'])
+            customer = Customer.objects.get(user=request.auth.user)
+            # The unique constraint makes repeat or concurrent favorites a no-op
+            Favorite.objects.get_or_create(customer=customer, seller_id=store.seller_id)
+            favorite_sellers.forget(request.auth.user.id)
 
             return Response(None, status=status.HTTP_204_NO_CONTENT)
-        
+
         if request.method == "DELETE":
             customer = Customer.objects.get(user=request.auth.user)
             store = Store.objects.get(pk=request.data['store_id'])
-            favorite = Favorite.objects.filter(customer=customer, seller=store.seller)
-            favorite.delete()
+            Favorite.objects.filter(customer=customer, seller_id=store.seller_id).delete()
+            favorite_sellers.forget(request.auth.user.id)
 
             return Response("seller successfully unfavorited", status=status.HTTP_204_NO_CONTENT)
 
@@ -259,7 +327,7 @@ class LikeSerializer(serializers.ModelSerializer):
         )
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """JSON serializer for customer profile
 
     Arguments:
@@ -286,6 +354,13 @@ class ProfileSerializer(serializers.ModelSerializer):
             "recommended_by",
             "store",
         )
+        expandable_fields = (
+            "payment_types",
+            "recommends",
+            "liked_products",
+            "recommended_by",
+            "store",
+        )
         depth = 1
 
 
@@ -1,55 +1,139 @@
-from django.http import HttpResponseServerError
+from functools import partial
+from django.http import HttpResponse
+from django.template.loader import render_to_string
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
-from rest_framework import serializers
 from rest_framework import status
-from django.shortcuts import render
-from bangazonapi.models import Order
+from rest_framework.renderers import JSONRenderer
 from rest_framework.decorators import action
-from bangazonapi.models import Product
+from bangazonapi.cache import report_cache
+from bangazonapi.queries import OrderReport, ProductReport, ReportQueryError, SalesReport
+from bangazonapi.streaming import EXPORT_RENDERERS, export_format, stream_export, wants_gzip
+
+REPORT_RENDERERS = [JSONRenderer, *EXPORT_RENDERERS]
+
+# Reports that render as HTML: name -> (report for some params, template)
+HTML_REPORTS = {
+    "orders": (OrderReport, "order_reports.html"),
+    "expensiveproducts": (partial(ProductReport, "expensive"), "products.html"),
+    "inexpensiveproducts": (partial(ProductReport, "inexpensive"), "products.html"),
+}
+
+
+def render_report(name, params):
+    """HTML of a report for the given parameters, straight from the database"""
+    make, template = HTML_REPORTS[name]
+    report = make(params)
+    context = {
+        "title": report.title,
+        "heading": report.heading,
+        "content": report.queryset(),
+    }
+    return render_to_string(template, context)
+
+
+def respond(request, name, filename):
+    """Stream a report as CSV or NDJSON when asked, otherwise serve its cached HTML"""
+    make, _ = HTML_REPORTS[name]
+    try:
+        report = make(request.query_params)
+    except ReportQueryError as ex:
+        return Response({"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+    fmt = export_format(request)
+    if fmt is not None:
+        return stream_export(
+            report.queryset(), report.columns, fmt, filename, wants_gzip(request)
+        )
+
+    params = dict(sorted(request.query_params.items()))
+    return HttpResponse(report_cache.get(name, params, lambda: render_report(name, params)))
+
 
 class Reports(ViewSet):
-    @action(detail=False, methods=["get"])
+    @action(detail=False, methods=["get"], renderer_classes=REPORT_RENDERERS)
     def orders(self, request):
-        orderstatus = self.request.query_params.get("status", None)
-
-        if orderstatus == "complete":
-            completed_orders = Order.objects.filter(payment_type__isnull=False)
-            context = {
-                "title": "Completed Orders",
-                "heading": "Orders that include a payment type that is not null",
-                "content": completed_orders,
-            }
-            return render(request, "order_reports.html", context)
-        if orderstatus == "incomplete":
-            incomplete_orders = Order.objects.filter(payment_type__isnull=True)
-            context = {
-                "title": "Incomplete Orders",
-                "heading": "Orders that include a payment type that is null",
-                "content": incomplete_orders,
-            }
-            return render(request, "order_reports.html", context)
-        else:
-            return Response("", status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        """
+        @api {GET} /reports/orders GET orders report
+        @apiName OrdersReport
+        @apiGroup Reports
+
+        @apiParam {String} [status] complete or incomplete; every order when left out
+        @apiParam {String} [from] Earliest order date, YYYY-MM-DD
+        @apiParam {String} [to] Latest order date, YYYY-MM-DD
+        @apiParam {Number} [customer] Only this customer's orders
+        @apiParam {String} [format] csv or ndjson to stream an export instead of HTML
+        @apiParam {String} [columns] Comma separated export columns: id, created_date,
+            status, total, customer_id, customer_name, merchant_name, account_number
+        @apiParam {Boolean} [gzip] Gzip the export
+        @apiError (400) {String} error A parameter is malformed
+        """
+        return respond(request, "orders", "orders")
 
-    @action(detail=False, methods=["get"])
+    @action(detail=False, methods=["get"], renderer_classes=REPORT_RENDERERS)
     def expensiveproducts(self, request):
-        
-        expensiveproducts = Product.objects.filter(price__gte=1000)
-        context = {
-            "title": "Expensive Products",
-            "heading": "Products that are greater than or equal to $1000",
-            "content": expensiveproducts,
-        }
-        return render(request, "products.html", context)
-    
-    @action(detail=False, methods=["get"])
+        """
+        @api {GET} /reports/expensiveproducts GET products priced $1000 or more
+        @apiName ExpensiveProductsReport
+        @apiGroup Reports
+
+        @apiParam {String} [format] csv or ndjson to stream an export instead of HTML
+        @apiParam {String} [columns] Comma separated export columns: id, name, price,
+            quantity, location, seller_id, seller_name
+        @apiParam {Boolean} [gzip] Gzip the export
+        @apiError (400) {String} error Unknown column
+        """
+        return respond(request, "expensiveproducts", "expensive_products")
+
+    @action(detail=False, methods=["get"], renderer_classes=REPORT_RENDERERS)
     def inexpensiveproducts(self, request):
-        
-        inexpensiveproducts = Product.objects.filter(price__lte=999)
-        context = {
-            "title": "Inexpensive Products",
-            "heading": "Products that are less than or equal to $1000",
-            "content": inexpensiveproducts,
-        }
-        return render(request, "products.html", context)
+        """
+        @api {GET} /reports/inexpensiveproducts GET products priced under $1000
+        @apiName InexpensiveProductsReport
+        @apiGroup Reports
+
+        @apiParam {String} [format] csv or ndjson to stream an export instead of HTML
+        @apiParam {String} [columns] Comma separated export columns: id, name, price,
+            quantity, location, seller_id, seller_name
+        @apiParam {Boolean} [gzip] Gzip the export
+        @apiError (400) {String} error Unknown column
+        """
+        return respond(request, "inexpensiveproducts", "inexpensive_products")
+
+    @action(detail=False, methods=["get"], renderer_classes=REPORT_RENDERERS)
+    def sales(self, request):
+        """
+        @api {GET} /reports/sales GET units and revenue of completed orders
+        @apiName SalesReport
+        @apiGroup Reports
+
+        @apiParam {String} [by=day] Group by day, product, seller or category
+        @apiParam {String} [from] Earliest sale date, YYYY-MM-DD
+        @apiParam {String} [to] Latest sale date, YYYY-MM-DD
+        @apiParam {Boolean} [live] Aggregate the line items instead of reading the rollups
+        @apiParam {String} [format] csv or ndjson to stream an export instead of JSON
+        @apiParam {String} [columns] Comma separated export columns
+        @apiParam {Boolean} [gzip] Gzip the export
+
+        @apiSuccessExample {json} Success
+            {
+                "by": "seller",
+                "source": "rollups",
+                "rows": [
+                    {"seller_id": 7, "units": 12, "revenue": 4210.5}
+                ]
+            }
+        @apiError (400) {String} error A parameter is malformed
+        """
+        try:
+            report = SalesReport(request.query_params)
+        except ReportQueryError as ex:
+            return Response({"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = report.rows()
+        fmt = export_format(request)
+        if fmt is not None:
+            return stream_export(
+                rows, report.columns, fmt, f"sales_by_{report.by}", wants_gzip(request)
+            )
+        return Response({"by": report.by, "source": report.source, "rows": rows})
@@ -1,12 +1,22 @@
+from collections import defaultdict
+from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from django.http import HttpResponseServerError
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
-from bangazonapi.models import Store, Customer, Product, Favorite
+from bangazonapi.models import Store, Customer, Product
 from rest_framework.exceptions import PermissionDenied
+from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth.models import User
-from .product import ProductSerializer
+from django.db.models import Count, Max, Min, Sum
+from bangazonapi.conditional import conditional_response
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.streaming import CHUNK_SIZE, stream_json, wants_stream
+from bangazonapi.fieldsets import Fieldset, SparseFieldsMixin
+from bangazonapi.cache import analytics_cache, favorite_sellers
+from bangazonapi.queries import ReportQueryError, StoreAnalytics
+from .product import serialize_products
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
     """JSON serializer for Users
@@ -35,11 +45,15 @@ class SellerSerializer(serializers.HyperlinkedModelSerializer):
         depth = 1
 
 
-class StoreSerializer(serializers.HyperlinkedModelSerializer):
+class StoreSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     """JSON serializer for stores"""
 
     seller = SellerSerializer(many=False)
-    products = ProductSerializer(many=True)
+    products = serializers.SerializerMethodField()
+
+    def get_products(self, obj):
+        """The seller's products, serialized through the product cache"""
+        return serialize_products(obj.products, self.context["request"])
 
     class Meta:
         model = Store
@@ -53,11 +67,79 @@ class StoreSerializer(serializers.HyperlinkedModelSerializer):
             "products",
             "seller",
             "created_date",
-            
         )
+        expandable_fields = ("products", "seller")
         depth = 1
 
 
+class StoreSummarySerializer(StoreSerializer):
+    """JSON serializer for stores with product totals instead of products"""
+
+    summary = serializers.DictField(read_only=True)
+
+    class Meta(StoreSerializer.Meta):
+        fields = (
+            "id",
+            "url",
+            "name",
+            "description",
+            "is_favorite",
+            "summary",
+            "seller",
+            "created_date",
+        )
+
+
+def attach_products(stores):
+    """Set store.products on a batch of stores with one product query"""
+    by_seller = defaultdict(list)
+    products = (
+        Product.objects.filter(customer_id__in={store.seller_id for store in stores})
+        .select_related("rating_aggregate")
+        .order_by("id")
+    )
+    for product in products:
+        by_seller[product.customer_id].append(product)
+    for store in stores:
+        store.products = by_seller[store.seller_id]
+
+
+def attach_summaries(stores):
+    """Set store.summary on a batch of stores with one grouped aggregate"""
+    rows = (
+        Product.objects.filter(customer_id__in={store.seller_id for store in stores})
+        .order_by()
+        .values("customer_id")
+        .annotate(
+            product_count=Count("id"),
+            min_price=Min("price"),
+            max_price=Max("price"),
+            total_sold=Sum("number_sold"),
+        )
+    )
+    by_seller = {row.pop("customer_id"): row for row in rows}
+    empty = {"product_count": 0, "min_price": None, "max_price": None, "total_sold": 0}
+    for store in stores:
+        store.summary = by_seller.get(store.seller_id, empty)
+
+
+def attach_nothing(stores):
+    """Stand-in for listings whose fields leave out products and summaries"""
+
+
+def in_batches(stores, attach):
+    """Yield stores from an iterator, running `attach` once per CHUNK_SIZE stores"""
+    batch = []
+    for store in stores:
+        batch.append(store)
+        if len(batch) >= CHUNK_SIZE:
+            attach(batch)
+            yield from batch
+            batch = []
+    if batch:
+        attach(batch)
+        yield from batch
+
 
 class Stores(ViewSet):
     def retrieve(self, request, pk=None):
@@ -69,12 +151,18 @@ class Stores(ViewSet):
         @apiHeader {String} Authorization Auth token
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+        @apiHeader {String} [If-None-Match] ETag from an earlier response; answered with 304 if unchanged
+        @apiHeader {String} [If-Modified-Since] Last-Modified from an earlier response
+
+        @apiParam {String} [fields] Comma separated fields to return, e.g. id,name
+        @apiParam {String} [expand] Relations to include alongside fields: products, seller
 
         @apiSuccess (200) {id} store.id Store Id
         @apiSuccess (200) {String} store.name Short form name of store
         @apiSuccess (200) {String} store.description Long form description of store
         @apiSuccess (200) {Number} store.seller Customer id of the user creating the store
         @apiSuccess (200) {Date} store.created_date Date store was created
+        @apiSuccess (200) {Boolean} store.is_favorite Whether the current user favorited the seller
         @apiSuccessExample {json} Success
             {
                 "id": 1,
@@ -85,17 +173,28 @@ class Stores(ViewSet):
                 "seller": "http://localhost:8000/customers/5"
             }
         """
+        fieldset = Fieldset.from_request(request, StoreSerializer)
         try:
-            customer = Customer.objects.get(user=request.auth.user)
-            store = Store.objects.get(pk=pk)
-            is_favorite = Favorite.objects.filter(customer=customer, seller=store.seller)
-            if len(is_favorite):
-                store.is_favorite = True
-            else:
-                store.is_favorite = False
-            store.products = Product.objects.filter(customer=store.seller)
-            serializer = StoreSerializer(store, context={"request": request})
-            return Response(serializer.data)
+            stores = Store.objects.all()
+            if fieldset.includes("seller"):
+                stores = stores.select_related("seller__user")
+            store = stores.get(pk=pk)
+            store.is_favorite = store.seller_id in favorite_sellers.ids(request.auth.user.id)
+
+            def build():
+                if fieldset.includes("products"):
+                    attach_products([store])
+                serializer = StoreSerializer(
+                    store, context={"request": request}, fieldset=fieldset
+                )
+                return Response(serializer.data)
+
+            products = Product.all_objects.filter(customer_id=store.seller_id).aggregate(
+                modified=Max("modified_date"), count=Count("id")
+            )
+            modified = max(filter(None, (store.modified_date, products["modified"])))
+            stamp = (store.id, store.modified_date, products["modified"], products["count"], store.is_favorite)
+            return conditional_response(request, build, stamp, modified)
 
         except Store.DoesNotExist:
             return Response(
@@ -113,11 +212,19 @@ class Stores(ViewSet):
         @apiHeaderExample {String} Authorization
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
+        @apiParam {Boolean} [summary] Replace each store's products with product_count, min_price, max_price and total_sold
+        @apiParam {Number} [page_size] Opt in to cursor pagination, newest stores first
+        @apiParam {String} [cursor] Opaque cursor from a previous page's next or previous link
+        @apiParam {Boolean} [stream] Stream every store row by row (or send Accept: application/json; stream=true)
+        @apiParam {String} [fields] Comma separated fields to return, e.g. id,name
+        @apiParam {String} [expand] Relations to include alongside fields: products, seller
+
         @apiSuccess (200) {id} store.id Store Id
         @apiSuccess (200) {String} store.name Short form name of store
         @apiSuccess (200) {String} store.description Long form description of store
         @apiSuccess (200) {Number} store.seller Customer id of the user creating the store
         @apiSuccess (200) {Date} store.created_date Date store was created
+        @apiSuccess (200) {Boolean} store.is_favorite Whether the current user favorited the seller
         @apiSuccessExample {json} Success
             {
                 "id": 1,
@@ -128,12 +235,46 @@ class Stores(ViewSet):
                 "seller": "http://localhost:8000/customers/5"
             }
         """
+        if request.query_params.get("summary", "").lower() in ("1", "true", "yes"):
+            attach, store_serializer, related = attach_summaries, StoreSummarySerializer, "summary"
+        else:
+            attach, store_serializer, related = attach_products, StoreSerializer, "products"
+
+        fieldset = Fieldset.from_request(request, store_serializer)
+        if not fieldset.includes(related):
+            attach = attach_nothing
+
+        favorites = frozenset()
+        if fieldset.includes("is_favorite") and request.user.is_authenticated:
+            favorites = favorite_sellers.ids(request.user.id)
+
+        def attach_page(stores):
+            attach(stores)
+            for store in stores:
+                store.is_favorite = store.seller_id in favorites
+
         all_stores = Store.objects.all()
-        for store in all_stores:
-            store.products = Product.objects.filter(customer=store.seller)
-        serializer = StoreSerializer(
-            all_stores, context={"request": request}, many=True
+        if fieldset.includes("seller"):
+            all_stores = all_stores.select_related("seller__user")
+
+        if wants_stream(request):
+            rows = in_batches(all_stores.iterator(chunk_size=CHUNK_SIZE), attach_page)
+            serializer = store_serializer(context={"request": request}, fieldset=fieldset)
+            return stream_json(rows, serializer)
+
+        paginator = KeysetPagination(ordering=("-created_date", "-id"))
+        paginated = paginator.is_requested(request)
+        if paginated:
+            all_stores = paginator.paginate_queryset(all_stores, request)
+        else:
+            all_stores = list(all_stores)
+
+        attach_page(all_stores)
+        serializer = store_serializer(
+            all_stores, context={"request": request}, many=True, fieldset=fieldset
         )
+        if paginated:
+            return paginator.get_paginated_response(serializer.data)
         return Response(serializer.data)
 
     def create(self, request):
@@ -180,8 +321,8 @@ class Stores(ViewSet):
         new_store.description = request.data["description"]
         customer = Customer.objects.get(user=request.auth.user)
         new_store.seller = customer
-        new_store.products = Product.objects.filter(customer=new_store.seller)
         new_store.save()
+        attach_products([new_store])
 
         serializer = StoreSerializer(new_store, context={"request": request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -257,3 +398,82 @@ class Stores(ViewSet):
         store.save()
 
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(methods=["get"], detail=True, permission_classes=[IsAuthenticated])
+    def analytics(self, request, pk=None):
+        """
+        @api {GET} /stores/:id/analytics GET sales figures for the seller's own store
+        @apiName StoreAnalytics
+        @apiGroup Store
+
+        @apiHeader {String} Authorization Auth token of the store's seller
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {String} [from] First sale day, YYYY-MM-DD; defaults to 29 days before to
+        @apiParam {String} [to] Last sale day, YYYY-MM-DD; defaults to today
+        @apiParam {Number} [top] How many best selling products to list, 0 to 100 (default 10)
+
+        @apiSuccess (200) {Number} revenue Revenue of completed orders in the window
+        @apiSuccess (200) {Number} units Units sold in the window
+        @apiSuccess (200) {Number} orders Completed orders including the seller's products
+        @apiSuccess (200) {Object[]} timeline Revenue and units per sale day, every day of the window
+        @apiSuccess (200) {Object[]} top_products Products with the most revenue, largest first
+        @apiSuccess (200) {Object} sell_through Units sold against units sold plus units still in stock
+        @apiSuccess (200) {Object} ratings Ratings of the catalog by score, with their count and average
+        @apiSuccess (200) {Object} buyers Buyers in the window and the share who ordered more than once
+        @apiError (400) {String} error Invalid from, to or top parameter
+        @apiError (401) {String} detail No auth token was sent
+        @apiError (403) {String} detail The store belongs to another seller
+        @apiSuccessExample {json} Success
+            {
+                "store": 1,
+                "from": "2024-05-01",
+                "to": "2024-05-30",
+                "revenue": 1119.76,
+                "units": 24,
+                "orders": 9,
+                "timeline": [
+                    { "day": "2024-05-01", "revenue": 93.31, "units": 2 }
+                ],
+                "top_products": [
+                    {
+                        "id": 52,
+                        "name": "Kite",
+                        "units": 12,
+                        "revenue": 599.88,
+                        "sell_through": 0.1667
+                    }
+                ],
+                "sell_through": { "sold": 24, "in_stock": 216, "rate": 0.1 },
+                "ratings": {
+                    "count": 4,
+                    "average": 3.75,
+                    "distribution": { "0": 0, "1": 0, "2": 1, "3": 0, "4": 2, "5": 1 }
+                },
+                "buyers": { "count": 7, "repeat": 2, "repeat_rate": 0.2857 }
+            }
+        """
+        try:
+            store = Store.objects.select_related("seller").get(pk=pk)
+        except Store.DoesNotExist:
+            return Response(
+                {"message": "The requested store does not exist. Kinda spooky..."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        if store.seller.user_id != request.auth.user.id:
+            raise PermissionDenied("Smile! You're on camera! This is not your store!")
+
+        try:
+            analytics = StoreAnalytics(store, request.query_params)
+        except ReportQueryError as ex:
+            return Response({"error": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Figures may lag new sales by the cache TIMEOUT
+        key = f"analytics:{analytics.signature}"
+        figures = analytics_cache.get(key)
+        if figures is None:
+            figures = analytics.compute()
+            analytics_cache.set(key, figures)
+        return Response(figures)
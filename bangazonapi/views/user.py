@@ -4,6 +4,8 @@ from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from django.contrib.auth.models import User
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.streaming import stream_json, wants_stream
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -45,8 +47,22 @@ class Users(ViewSet):
 
 
     def list(self, request):
-        """Handle GET requests to user resource"""
+        """Handle GET requests to user resource
+
+        Send `page_size` or `cursor` to page through users, newest first,
+        or `stream=true` to stream every user as one JSON array.
+        """
         users = User.objects.all()
+
+        if wants_stream(request):
+            return stream_json(users, UserSerializer(context={'request': request}))
+
+        paginator = KeysetPagination(ordering=("-date_joined", "-id"))
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(users, request)
+            serializer = UserSerializer(page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+
         serializer = UserSerializer(
             users, many=True, context={'request': request})
         return Response(serializer.data)
\ No newline at end of file
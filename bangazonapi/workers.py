@@ -0,0 +1,29 @@
+"""Django setup for process pool workers
+
+Spawned and forkserver workers start from a fresh interpreter and import
+this module before Django is ready, so it must not import models.
+"""
+
+import django
+from django.conf import settings
+from django.db import connections
+
+
+def database_names():
+    """Database file or name per alias, as the current process uses them"""
+    return {alias: connections[alias].settings_dict["NAME"] for alias in connections}
+
+
+def setup_django(names):
+    """Process pool initializer: make Django usable in a worker
+
+    Forked workers inherit a ready Django. Other workers load settings
+    afresh and also need the parent's database names, which test runs
+    change at runtime.
+
+    Arguments:
+        names {dict} -- database_names() of the parent process
+    """
+    for alias, name in names.items():
+        settings.DATABASES[alias]["NAME"] = name
+    django.setup()
@@ -14,3 +14,8 @@ python manage.py loaddata payment
 python manage.py loaddata order
 python manage.py loaddata order_product
 python manage.py loaddata favoritesellers
+python manage.py rebuild_sold_counts
+python manage.py rebuild_rating_aggregates
+python manage.py rebuild_search_index
+python manage.py backfill_order_prices
+python manage.py rollup_sales --rebuild
@@ -1,3 +1,7 @@
 from .product import ProductTests
 from .order import OrderTests
-from .payments import PaymentTests
\ No newline at end of file
+from .payments import PaymentTests
+from .store import StoreTests
+from .profile import ProfileTests
+from .checkout import CheckoutTests
+from .report import ReportTests, RollupRebuildTests
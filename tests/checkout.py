@@ -0,0 +1,155 @@
+import threading
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITransactionTestCase
+from bangazonapi import carts
+from bangazonapi.models import Customer, Order, OrderProduct, Payment, Product, ProductCategory
+
+
+class CheckoutTests(APITransactionTestCase):
+    def setUp(self) -> None:
+        """
+        Create a seller with one product and buyers who each hold it in a cart
+        """
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        seller = self.create_customer("seller")
+        self.product = Product.objects.create(
+            name="Kite",
+            customer=seller,
+            price=14.99,
+            description="It flies high",
+            quantity=5,
+            category=category,
+            location="Pittsburgh",
+        )
+
+    def create_customer(self, username):
+        user = User.objects.create(username=username, first_name=username, last_name="Buyer")
+        return Customer.objects.create(user=user, phone_number="555-1212", address="1 Way")
+
+    def open_cart(self, username, quantity=1):
+        """Customer's token, open order and payment with `quantity` kites in the cart"""
+        customer = self.create_customer(username)
+        order = Order.objects.create(customer=customer, created_date="2024-01-01")
+        OrderProduct.add(order, self.product, quantity)
+        payment = Payment.objects.create(
+            merchant_name="MYMEX",
+            account_number="222222",
+            expiration_date="2030-01-01",
+            customer=customer,
+        )
+        return Token.objects.create(user=customer.user).key, order, payment
+
+    def test_checkout_takes_stock(self):
+        """
+        Ensure checkout lowers stock and refuses orders wanting more than is left.
+        """
+        token, order, payment = self.open_cart("first", quantity=3)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        response = self.client.put(f"/orders/{order.id}", {"payment_type": payment.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Product.objects.get().quantity, 2)
+
+        token, order, payment = self.open_cart("second", quantity=3)
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        response = self.client.put(f"/orders/{order.id}", {"payment_type": payment.id}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            response.json()["items"],
+            [{"product_id": self.product.id, "name": "Kite", "requested": 3, "available": 2}],
+        )
+        order.refresh_from_db()
+        self.assertIsNone(order.payment_type)
+        self.assertEqual(Product.objects.get().quantity, 2)
+
+    def test_parallel_checkouts_never_oversell(self):
+        """
+        Ensure concurrent checkouts of the last units sell exactly the stock on hand.
+        """
+        carts = [self.open_cart(f"buyer{number}") for number in range(12)]
+        start = threading.Barrier(len(carts))
+        results = []
+
+        def checkout(token, order, payment):
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION="Token " + token)
+            start.wait()
+            try:
+                response = client.put(
+                    f"/orders/{order.id}", {"payment_type": payment.id}, format="json"
+                )
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=cart) for cart in carts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(status.HTTP_204_NO_CONTENT), 5)
+        self.assertEqual(results.count(status.HTTP_409_CONFLICT), 7)
+        product = Product.objects.get()
+        self.assertEqual(product.quantity, 0)
+        self.assertEqual(product.number_sold, 5)
+        self.assertEqual(Order.objects.filter(payment_type__isnull=False).count(), 5)
+
+    @override_settings(CART_STORE={"MODE": "write-behind", "FLUSH_INTERVAL": 0, "MAX_DIRTY": 100})
+    def test_checkout_waits_for_background_flush(self):
+        """
+        Ensure checkout waits for a background flush that already took the cart.
+        """
+        token, order, payment = self.open_cart("first")
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token)
+        self.client.post("/cart", {"id": self.product.id, "quantity": 2}, format="json")
+
+        store = carts.get_store()
+        write, taken, resume = store._write, threading.Event(), threading.Event()
+
+        def paused_write(batch):
+            taken.set()
+            resume.wait(5)
+            return write(batch)
+
+        def background_flush():
+            try:
+                store.flush()
+            finally:
+                connection.close()
+
+        responses = []
+
+        def checkout():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION="Token " + token)
+            try:
+                responses.append(
+                    client.put(f"/orders/{order.id}", {"payment_type": payment.id}, format="json")
+                )
+            finally:
+                connection.close()
+
+        store._write = paused_write
+        flusher = threading.Thread(target=background_flush)
+        buyer = threading.Thread(target=checkout)
+        flusher.start()
+        try:
+            self.assertTrue(taken.wait(5))
+            buyer.start()
+            buyer.join(0.3)
+            self.assertTrue(buyer.is_alive())
+        finally:
+            resume.set()
+            flusher.join()
+            if buyer.ident is not None:
+                buyer.join()
+
+        self.assertEqual(responses[0].status_code, status.HTTP_204_NO_CONTENT)
+        order.refresh_from_db()
+        self.assertEqual(order.subtotal, 44.97)
+        self.assertEqual(OrderProduct.objects.get(order=order).quantity, 3)
+        self.assertEqual(Product.objects.get().quantity, 2)
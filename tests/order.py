@@ -1,6 +1,11 @@
 import json
 from rest_framework import status
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APITestCase
+from bangazonapi import carts
+from bangazonapi.models import Order, OrderProduct, Product
 
 
 class OrderTests(APITestCase):
@@ -102,6 +107,117 @@ class OrderTests(APITestCase):
         self.assertEqual(json_response["size"], 0)
         self.assertEqual(len(json_response["lineitems"]), 0)
 
+    def test_add_product_units_to_one_line(self):
+        """
+        Ensure repeat adds raise one line's quantity and removes take units off it.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"id": 1}, format="json")
+        response = self.client.post("/cart", {"id": 1, "quantity": 2}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get("/cart", None, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["size"], 3)
+        self.assertEqual(len(json_response["lineitems"]), 1)
+        self.assertEqual(json_response["lineitems"][0]["quantity"], 3)
+        self.assertEqual(json_response["total_price"], 44.97)
+
+        self.client.delete("/cart/1", None, format="json")
+        response = self.client.get("/cart", None, format="json")
+        self.assertEqual(json.loads(response.content)["lineitems"][0]["quantity"], 2)
+
+        response = self.client.post("/cart", {"id": 1, "quantity": 0}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_cart_changes(self):
+        """
+        Ensure /cart/bulk applies adds and removals together and rejects unknown products.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"id": 1}, format="json")
+
+        data = {"add": [{"product_id": 1, "quantity": 2}, {"product_id": 1}]}
+        response = self.client.post("/cart/bulk", data, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["size"], 4)
+        self.assertEqual(
+            json_response["lineitems"],
+            [{"product_id": 1, "name": "Kite", "unit_price": 14.99, "quantity": 4}],
+        )
+
+        data = {"add": [{"product_id": 99}], "remove": [{"product_id": 1}]}
+        response = self.client.post("/cart/bulk", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(OrderProduct.objects.get().quantity, 4)
+
+        response = self.client.post("/cart/bulk", {"remove": [{"product_id": 1}]}, format="json")
+        self.assertEqual(json.loads(response.content)["size"], 0)
+        self.assertFalse(OrderProduct.objects.exists())
+
+    @override_settings(CART_STORE={"MODE": "write-behind", "FLUSH_INTERVAL": 0, "MAX_DIRTY": 100})
+    def test_write_behind_cart(self):
+        """
+        Ensure write-behind cart edits skip OrderProduct until checkout writes them.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.client.post("/cart", {"id": 1, "quantity": 3}, format="json")
+        self.client.delete("/cart/1", None, format="json")
+        self.assertEqual(OrderProduct.objects.count(), 0)
+
+        response = self.client.get("/cart", None, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["size"], 2)
+        self.assertEqual(json_response["lineitems"][0]["id"], None)
+        self.assertEqual(json_response["total_price"], 29.98)
+
+        self.assertEqual(carts.get_store().flush(), 1)
+        line = OrderProduct.objects.get()
+        self.assertEqual(line.quantity, 2)
+        response = self.client.get("/cart", None, format="json")
+        self.assertEqual(json.loads(response.content)["lineitems"][0]["id"], line.id)
+
+        self.client.post("/cart", {"id": 1}, format="json")
+        response = self.client.put(f"/orders/{line.order_id}", {"payment_type": 1}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Order.objects.get().subtotal, 44.97)
+
+    def test_order_history(self):
+        """
+        Ensure order history pages paid orders in constant queries and filters by date.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        for day in ("2024-01-05", "2024-02-05", "2024-03-05"):
+            self.client.post("/cart", {"id": 1, "quantity": 2}, format="json")
+            order = Order.objects.get(payment_type__isnull=True)
+            self.client.put(f"/orders/{order.id}", {"payment_type": 1}, format="json")
+            Order.objects.filter(pk=order.id).update(created_date=day)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/orders/history?from=2024-02-01&page_size=5")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(
+            [order["created_date"] for order in json_response["results"]],
+            ["2024-03-05", "2024-02-05"],
+        )
+        self.assertEqual(json_response["results"][0]["total_price"], 29.98)
+        self.assertEqual(
+            json_response["results"][0]["lineitems"],
+            [{"product_id": 1, "name": "Kite", "unit_price": 14.99, "quantity": 2}],
+        )
+
+        response = self.client.get("/orders/history?to=2024-01-31")
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+        response = self.client.get("/orders?payment_id=1")
+        self.assertEqual(len(json.loads(response.content)), 3)
+        response = self.client.get("/orders?payment_id=abc")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/orders/history?from=January")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # TODO: Complete order by adding payment type
 
     def test_add_payment_to_order(self):
@@ -125,6 +241,64 @@ class OrderTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(json_response["payment_type"]["id"], 1)
 
+    def test_paid_order_counts_as_sold(self):
+        """
+        Ensure paying for an order increments number_sold exactly once.
+        """
+        self.test_add_payment_to_order()
+
+        # Paying a second time must not count the sale again
+        url = "/orders/1"
+        data = {"payment_type": 1}
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        response = self.client.put(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        url = "/products/1"
+        response = self.client.get(url, None, format="json")
+        json_response = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["number_sold"], 1)
+
+    def test_order_total_keeps_cart_price(self):
+        """
+        Ensure later price changes do not alter a line item's price or a paid order's total.
+        """
+        self.test_add_product_to_order()
+        Product.objects.filter(pk=1).update(price=24.99)
+
+        self.client.put("/orders/1", {"payment_type": 1}, format="json")
+        self.assertEqual(Order.objects.get(pk=1).subtotal, 14.99)
+
+        Product.objects.filter(pk=1).update(price=99.99)
+        response = self.client.get("/orders/1", None, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["total_price"], 14.99)
+        self.assertEqual(json_response["lineitems"][0]["unit_price"], 14.99)
+
+    def test_list_orders_with_sparse_fields(self):
+        """
+        Ensure fields and expand choose what each order renders.
+        """
+        self.test_add_payment_to_order()
+
+        url = "/orders?fields=id,total_price"
+        response = self.client.get(url, None, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response, [{"id": 1, "total_price": 14.99}])
+
+        url = "/orders/1?expand=lineitems"
+        response = self.client.get(url, None, format="json")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["lineitems"][0]["product"]["name"], "Kite")
+        self.assertNotIn("payment_type", json_response)
+
+        url = "/orders?fields=id,password"
+        response = self.client.get(url, None, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     # TODO: New line item is not added to closed order
     def test_product_is_not_added_to_closed_cart(self):
         """
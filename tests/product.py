@@ -1,7 +1,16 @@
+import base64
+import io
 import json
 import datetime
+import tempfile
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from PIL import Image
 from rest_framework import status
 from rest_framework.test import APITestCase
+from bangazonapi.cache import facet_cache, product_cache
+from bangazonapi.images import pipeline as image_pipeline
+from bangazonapi.models import Product
 
 
 class ProductTests(APITestCase):
@@ -51,6 +60,76 @@ class ProductTests(APITestCase):
         self.assertEqual(json_response["description"], "It flies high")
         self.assertEqual(json_response["location"], "Pittsburgh")
 
+    def test_create_product_with_image(self):
+        """
+        Ensure uploads are resized, converted to WebP and stripped of EXIF.
+        """
+        photo = Image.new("RGB", (800, 400), "red")
+        exif = Image.Exif()
+        exif[0x010F] = "Camera Maker"
+        buffer = io.BytesIO()
+        photo.save(buffer, "JPEG", exif=exif)
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+
+        url = "/products"
+        data = {
+            "name": "Kite",
+            "price": 14.99,
+            "quantity": 60,
+            "description": "It flies high",
+            "category_id": 1,
+            "location": "Pittsburgh",
+            "image_path": f"data:image/jpeg;base64,{encoded}"
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+        with tempfile.TemporaryDirectory() as media, override_settings(
+            MEDIA_ROOT=media, IMAGE_PROCESSING={"WORKERS": 0}
+        ):
+            response = self.client.post(url, data, format='json')
+            json_response = json.loads(response.content)
+
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(json_response["image_status"], "ready")
+            self.assertIn("thumb_150_webp", json_response["image_variants"])
+
+            with default_storage.open(json_response["image_path"].split("/media/")[-1]) as stored:
+                original = Image.open(stored)
+                self.assertEqual(original.size, (800, 400))
+                self.assertEqual(len(original.getexif()), 0)
+
+        data["image_path"] = "data:image/png;base64,bm90IGFuIGltYWdl"
+        with override_settings(IMAGE_PROCESSING={"WORKERS": 0}):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(json.loads(response.content)["image_status"], "failed")
+
+    def test_image_upload_refused_when_queue_is_full(self):
+        """
+        Ensure a full upload queue answers 503 at once instead of blocking the request.
+        """
+        data = {
+            "name": "Kite",
+            "price": 14.99,
+            "quantity": 60,
+            "description": "It flies high",
+            "category_id": 1,
+            "location": "Pittsburgh",
+            "image_path": "data:image/png;base64,bm90IGFuIGltYWdl",
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+
+        with override_settings(IMAGE_PROCESSING={"WORKERS": 1, "MAX_PENDING": 1}):
+            slot = image_pipeline.reserve()
+            self.assertIsNotNone(slot)
+            response = self.client.post("/products", data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertFalse(Product.objects.filter(name="Kite").exists())
+
+            slot.release()
+            slot.release()
+            self.assertIsNotNone(image_pipeline.reserve())
+            self.assertIsNone(image_pipeline.reserve())
+
     def test_update_product(self):
         """
         Ensure we can update a product.
@@ -95,6 +174,202 @@ class ProductTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(json_response), 3)
 
+    def test_stream_all_products(self):
+        """
+        Ensure a streamed product list is the same valid JSON array.
+        """
+        self.test_create_product()
+        self.test_create_product()
+
+        response = self.client.get("/products?stream=true", None, format='json')
+        self.assertTrue(response.streaming)
+        json_response = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(json_response), 2)
+        self.assertEqual(json_response[0]["name"], "Kite")
+
+        response = self.client.get(
+            "/products?location=Nowhere", None, format='json',
+            HTTP_ACCEPT="application/json; stream=true"
+        )
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), [])
+
     # TODO: Delete product
 
-    # TODO: Product can be rated. Assert average rating exists.
+    def test_filter_and_order_products(self):
+        """
+        Ensure list filters combine and ordering is restricted to known fields.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        self.client.post("/products/2/rate", {"rating": 5}, format='json')
+
+        url = "/products?location=Pittsburgh&max_price=20&order_by=average_rating&direction=desc&quantity=1"
+        response = self.client.get(url, None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json_response), 1)
+        self.assertEqual(json_response[0]["id"], 2)
+
+        response = self.client.get("/products?number_sold=1", None, format='json')
+        self.assertEqual(len(json.loads(response.content)), 0)
+
+        response = self.client.get("/products?order_by=customer__user__password", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginate_products_with_cursor(self):
+        """
+        Ensure cursor pages cover every product once and link back.
+        """
+        for _ in range(5):
+            self.test_create_product()
+
+        response = self.client.get("/products?page_size=2", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(json_response["previous"])
+
+        seen = [product["id"] for product in json_response["results"]]
+        while json_response["next"]:
+            next_page = json_response["next"]
+            response = self.client.get(next_page, None, format='json')
+            json_response = json.loads(response.content)
+            seen += [product["id"] for product in json_response["results"]]
+
+        self.assertEqual(seen, [5, 4, 3, 2, 1])
+
+        response = self.client.get(json_response["previous"], None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([product["id"] for product in json_response["results"]], [3, 2])
+
+        response = self.client.get("/products?cursor=garbage", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_search_products(self):
+        """
+        Ensure full-text search ranks matches and drops deleted products.
+        """
+        self.test_create_product()
+        self.test_update_product()
+
+        url = "/products"
+        data = {
+            "name": "Skateboard",
+            "price": 60.00,
+            "quantity": 3,
+            "description": "Not a kite",
+            "category_id": 1,
+            "location": "Nashville"
+        }
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post(url, data, format='json')
+
+        response = self.client.get("/products?q=kit", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Name matches outrank the skateboard's description match
+        self.assertEqual(len(json_response), 3)
+        self.assertEqual(json_response[-1]["id"], 3)
+
+        response = self.client.get("/products?q=kite nashville&min_price=50", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([product["id"] for product in json_response], [3])
+
+        self.client.delete("/products/1")
+        response = self.client.get("/products?q=very", None, format='json')
+        self.assertEqual(len(json.loads(response.content)), 0)
+
+    def test_product_facets(self):
+        """
+        Ensure facets count the filtered products per category, location and price.
+        """
+        facet_cache.clear()
+        self.test_create_product()
+        self.test_create_product()
+        self.client.post("/products", {
+            "name": "Skateboard", "price": 60.00, "quantity": 3, "description": "Not a kite",
+            "category_id": 1, "location": "Nashville"
+        }, format='json')
+
+        response = self.client.get("/products/facets?price_buckets=20,100", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["count"], 3)
+        self.assertEqual(json_response["categories"], [{"id": 1, "name": "Sporting Goods", "count": 3}])
+        self.assertEqual(json_response["locations"][0], {"location": "Pittsburgh", "count": 2})
+        self.assertEqual([bucket["count"] for bucket in json_response["prices"]], [2, 1, 0])
+
+        response = self.client.get("/products/facets?location=Nashville", None, format='json')
+        self.assertEqual(json.loads(response.content)["count"], 1)
+
+        response = self.client.get("/products/facets?q=skateboard", None, format='json')
+        self.assertEqual(json.loads(response.content)["locations"], [{"location": "Nashville", "count": 1}])
+
+        response = self.client.get("/products/facets?price_buckets=100,20", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_retrieve_product_from_cache(self):
+        """
+        Ensure repeat reads are cache hits and ratings invalidate the copy.
+        """
+        self.test_create_product()
+        product_cache.reset_stats()
+
+        self.client.get("/products/1", None, format='json')
+        self.client.get("/products/1", None, format='json')
+        self.assertEqual(product_cache.stats()["hits"], 1)
+
+        self.client.post("/products/1/rate", {"rating": 3}, format='json')
+        response = self.client.get("/products/1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["average_rating"], 3)
+
+        response = self.client.get("/products/99", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_conditional_get_product(self):
+        """
+        Ensure unchanged products answer If-None-Match with 304.
+        """
+        self.test_create_product()
+
+        response = self.client.get("/products/1", None, format='json')
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get("/products/1", None, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get("/products", None, format='json')
+        list_etag = response["ETag"]
+
+        self.client.post("/products/1/rate", {"rating": 5}, format='json')
+
+        response = self.client.get("/products/1", None, format='json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get("/products", None, format='json', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rate_product(self):
+        """
+        Ensure a product can be rated and re-rating replaces the old score.
+        """
+        self.test_create_product()
+
+        url = "/products/1/rate"
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, {"rating": 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(url, {"rating": 2}, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["rating_count"], 1)
+        self.assertEqual(json_response["histogram"]["2"], 1)
+        self.assertEqual(json_response["histogram"]["4"], 0)
+
+        response = self.client.get("/products/1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["average_rating"], 2)
+
+        response = self.client.post(url, {"rating": 6}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,103 @@
+import datetime
+import json
+import tempfile
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from bangazonapi.images import pipeline as image_pipeline
+
+
+class ProfileTests(APITestCase):
+    def setUp(self) -> None:
+        """
+        Create an account and a few products for it to like
+        """
+        url = "/register"
+        data = {
+            "username": "steve",
+            "password": "Admin8*",
+            "email": "steve@stevebrownlee.com",
+            "address": "100 Infinity Way",
+            "phone_number": "555-1212",
+            "first_name": "Steve",
+            "last_name": "Brownlee",
+        }
+        response = self.client.post(url, data, format="json")
+        self.token = json.loads(response.content)["token"]
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+
+        self.client.post("/productcategories", {"name": "Sporting Goods"}, format="json")
+        for name in ("Kite", "Skateboard", "Frisbee"):
+            data = {
+                "name": name,
+                "price": 14.99,
+                "quantity": 60,
+                "description": "It flies high",
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            response = self.client.post("/products", data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def get_profile(self, url="/profile"):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, None, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content), len(queries)
+
+    def test_profile_snapshot_follows_likes(self):
+        """
+        Ensure profile reads come from the snapshot and see new likes and product edits.
+        """
+        profile, _ = self.get_profile()
+        self.assertEqual(profile["user"]["first_name"], "Steve")
+        self.assertEqual(profile["liked_products"], [])
+        self.assertTrue(profile["url"].startswith("http://testserver/"))
+
+        self.client.post("/products/1/like", None, format="json")
+        profile, queries = self.get_profile()
+        self.assertEqual(profile["liked_products"][0]["product"]["name"], "Kite")
+        # Token lookup plus the snapshot row
+        self.assertEqual(queries, 2)
+
+        data = {
+            "name": "Box Kite",
+            "price": 24.99,
+            "quantity": 40,
+            "description": "It flies very high",
+            "category_id": 1,
+            "created_date": datetime.date.today(),
+            "location": "Pittsburgh",
+        }
+        self.client.put("/products/1", data, format="json")
+        profile, _ = self.get_profile()
+        self.assertEqual(profile["liked_products"][0]["product"]["name"], "Box Kite")
+
+        # The image pipeline writes with update(), which sends no post_save
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            image_pipeline._store(1, "box-kite", {"original": ("png", b"not checked here")})
+        profile, _ = self.get_profile()
+        image_path = profile["liked_products"][0]["product"]["image_path"]
+        self.assertIn("products/1-box-kite-original", image_path)
+
+    def test_paginate_profile_collections(self):
+        """
+        Ensure limit trims each collection and links to the rest of it.
+        """
+        for pk in (1, 2, 3):
+            self.client.post(f"/products/{pk}/like", None, format="json")
+
+        profile, _ = self.get_profile("/profile?limit=2&fields=id,liked_products")
+        self.assertEqual(set(profile), {"id", "liked_products", "collections"})
+        self.assertEqual(len(profile["liked_products"]), 2)
+        self.assertEqual(profile["collections"]["liked_products"]["count"], 3)
+
+        page, _ = self.get_profile(profile["collections"]["liked_products"]["next"])
+        self.assertEqual(page["count"], 3)
+        self.assertEqual([like["product"]["name"] for like in page["results"]], ["Frisbee"])
+
+        self.client.credentials()
+        response = self.client.get("/profile/liked_products", None, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
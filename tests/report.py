@@ -0,0 +1,278 @@
+import gzip
+import json
+import threading
+import time
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+from bangazonapi import rollups
+from bangazonapi.cache import ReportCache, report_cache
+from bangazonapi.cache.backends import LRUCache
+from bangazonapi.models import (
+    Customer,
+    DailyProductSales,
+    DailySellerSales,
+    Order,
+    OrderProduct,
+    Payment,
+    Product,
+    ProductCategory,
+)
+
+
+class ReportTests(APITestCase):
+    def setUp(self) -> None:
+        """
+        Create a seller, a buyer with a payment type and a product to order
+        """
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        self.seller = self.create_customer("seller", "Sam")
+        self.buyer = self.create_customer("buyer", "Bea")
+        self.product = Product.objects.create(
+            name="Kite",
+            customer=self.seller,
+            price=14.99,
+            description="It flies high",
+            quantity=100,
+            category=category,
+            location="Pittsburgh",
+        )
+        report_cache.backend.clear()
+        self.payment = Payment.objects.create(
+            merchant_name="MYMEX",
+            account_number="222222",
+            expiration_date="2030-01-01",
+            customer=self.buyer,
+        )
+
+    def create_customer(self, username, first_name):
+        user = User.objects.create(username=username, first_name=first_name, last_name="Smith")
+        return Customer.objects.create(user=user, phone_number="555-1212", address="1 Way")
+
+    def create_order(self, customer, day, quantity=2, paid=True):
+        order = Order.objects.create(customer=customer, created_date=day)
+        OrderProduct.add(order, self.product, quantity)
+        if paid:
+            order.complete(self.payment)
+        return order
+
+    def test_orders_report_query_count_is_fixed(self):
+        """
+        Ensure the completed orders report costs the same queries for one order or many.
+        """
+        self.create_order(self.buyer, "2024-01-05")
+        with CaptureQueriesContext(connection) as one:
+            response = self.client.get("/reports/orders?status=complete")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, "$29.98")
+        self.assertContains(response, "Bea Smith")
+        self.assertContains(response, "MYMEX ***222")
+
+        for day in range(6, 12):
+            self.create_order(self.buyer, f"2024-01-{day:02}")
+        report_cache.backend.clear()
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get("/reports/orders?status=complete")
+        self.assertEqual(response.content.decode().count("Order #"), 7)
+        self.assertEqual(len(many), len(one))
+
+    def test_orders_report_filters(self):
+        """
+        Ensure the orders report filters by status, date window and customer.
+        """
+        self.create_order(self.buyer, "2024-01-05")
+        self.create_order(self.buyer, "2024-03-05")
+        self.create_order(self.seller, "2024-03-06")
+        open_order = self.create_order(self.buyer, "2024-03-07", quantity=1, paid=False)
+
+        response = self.client.get("/reports/orders?status=incomplete")
+        self.assertContains(response, f"Order # {open_order.id}")
+        self.assertContains(response, "$14.99")
+        self.assertEqual(response.content.decode().count("Order #"), 1)
+
+        response = self.client.get(
+            f"/reports/orders?status=complete&from=2024-02-01&to=2024-03-31&customer={self.buyer.id}"
+        )
+        self.assertEqual(response.content.decode().count("Order #"), 1)
+
+        response = self.client.get("/reports/orders?status=shipped")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_orders_report_exports(self):
+        """
+        Ensure orders stream as CSV, NDJSON and gzipped CSV with chosen columns.
+        """
+        first = self.create_order(self.buyer, "2024-01-05")
+        second = self.create_order(self.buyer, "2024-01-06", quantity=1)
+
+        response = self.client.get("/reports/orders?status=complete&format=csv")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            lines[0],
+            "id,created_date,status,total,customer_id,customer_name,merchant_name,account_number",
+        )
+        self.assertEqual(
+            lines[1], f"{first.id},2024-01-05,complete,29.98,{self.buyer.id},Bea Smith,MYMEX,***222"
+        )
+        self.assertEqual(len(lines), 3)
+
+        response = self.client.get("/reports/orders?format=ndjson&columns=id,total")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(rows, [{"id": first.id, "total": 29.98}, {"id": second.id, "total": 14.99}])
+
+        response = self.client.get("/reports/orders?format=csv&columns=id&gzip=true")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="orders.csv.gz"', response["Content-Disposition"])
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertEqual(content.splitlines(), ["id", str(first.id), str(second.id)])
+
+        response = self.client.get("/reports/expensiveproducts?format=csv&columns=id,colour")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/reports/inexpensiveproducts?format=ndjson&columns=name,seller_name")
+        self.assertEqual(
+            json.loads(b"".join(response.streaming_content)), {"name": "Kite", "seller_name": "Sam Smith"}
+        )
+
+    @override_settings(SALES_ROLLUP={"LAG_SECONDS": 0, "WORKERS": 0})
+    def test_sales_rollups(self):
+        """
+        Ensure incremental rollups add only new orders and the sales report matches live totals.
+        """
+        response = self.client.get("/reports/sales")
+        self.assertEqual(response.json(), {"by": "day", "source": "live", "rows": []})
+
+        first = self.create_order(self.buyer, "2024-01-05")
+        self.assertEqual(rollups.rebuild(), 1)
+        second = self.create_order(self.seller, "2024-01-06", quantity=1)
+        self.create_order(self.buyer, "2024-01-07", quantity=5, paid=False)
+
+        response = self.client.get("/reports/sales?by=seller")
+        self.assertEqual(response.json()["source"], "rollups")
+        self.assertEqual(
+            response.json()["rows"], [{"seller_id": self.seller.id, "units": 3, "revenue": 44.97}]
+        )
+
+        self.assertEqual(rollups.roll_up(), 1)
+        self.assertEqual(rollups.roll_up(), 0)
+        rollup = DailyProductSales.objects.get()
+        self.assertEqual((rollup.orders, rollup.units, rollup.revenue), (2, 3, 44.97))
+        self.assertEqual(rollup.day, second.completed_at.date())
+        self.assertEqual(DailySellerSales.objects.get().revenue, 44.97)
+
+        for by in ("day", "product", "category"):
+            rolled = self.client.get(f"/reports/sales?by={by}").json()["rows"]
+            live = self.client.get(f"/reports/sales?by={by}&live=true").json()["rows"]
+            self.assertEqual(rolled, live)
+        self.assertEqual(first.completed_at.date(), rollup.day)
+
+        response = self.client.get(f"/reports/sales?by=day&to={rollup.day}&format=csv&columns=units")
+        self.assertEqual(b"".join(response.streaming_content).decode().splitlines(), ["units", "3"])
+        response = self.client.get("/reports/sales?by=week")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_report_cache(self):
+        """
+        Ensure repeat views of a report skip the database within a time bucket.
+        """
+        self.client.get("/reports/expensiveproducts")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/reports/inexpensiveproducts")
+        self.assertContains(response, "Kite")
+        self.assertGreater(len(queries), 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/reports/inexpensiveproducts")
+        self.assertContains(response, "Kite")
+        self.assertEqual(len(queries), 0)
+
+    def test_report_cache_serves_stale_while_refreshing(self):
+        """
+        Ensure a stale report is served while one background build replaces it.
+        """
+        now = [0]
+        cache = ReportCache(LRUCache(), bucket_seconds=60, clock=lambda: now[0])
+        builds = []
+        release = threading.Event()
+
+        def build():
+            builds.append(now[0])
+            if now[0] == 61:
+                release.wait(timeout=5)
+            return f"built at {now[0]}"
+
+        self.assertEqual(cache.get("sales", {}, build), "built at 0")
+        self.assertEqual(cache.get("sales", {}, build), "built at 0")
+
+        now[0] = 61
+        self.assertEqual(cache.get("sales", {}, build), "built at 0")
+        self.assertEqual(cache.get("sales", {}, build), "built at 0")
+        release.set()
+        for _ in range(100):
+            if cache.backend.get(cache.key("sales", {}, 1)):
+                break
+            time.sleep(0.01)
+        self.assertEqual(cache.get("sales", {}, build), "built at 61")
+        self.assertEqual(builds, [0, 61])
+
+        now[0] = 200
+        self.assertEqual(cache.get("sales", {"by": "day"}, build), "built at 200")
+
+
+class RollupRebuildTests(APITransactionTestCase):
+    def setUp(self) -> None:
+        """
+        Commit paid orders over several days where pool workers can read them
+        """
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        user = User.objects.create(username="seller", first_name="Sam", last_name="Smith")
+        customer = Customer.objects.create(user=user, phone_number="555-1212", address="1 Way")
+        payment = Payment.objects.create(
+            merchant_name="MYMEX",
+            account_number="222222",
+            expiration_date="2030-01-01",
+            customer=customer,
+        )
+        products = [
+            Product.objects.create(
+                name=name,
+                customer=customer,
+                price=price,
+                description="It flies high",
+                quantity=100,
+                category=category,
+                location="Pittsburgh",
+            )
+            for name, price in (("Kite", 14.99), ("Frisbee", 5.25))
+        ]
+        for day in range(1, 9):
+            order = Order.objects.create(customer=customer, created_date=f"2024-01-{day:02}")
+            OrderProduct.add(order, products[day % 2], day)
+            order.complete(payment)
+            Order.objects.filter(pk=order.pk).update(completed_at=None)
+
+    def rollup_rows(self):
+        return sorted(
+            DailyProductSales.objects.values_list("day", "product_id", "orders", "units", "revenue")
+        )
+
+    def test_rebuild_in_worker_processes(self):
+        """
+        Ensure a parallel rebuild matches an inline one however workers are started.
+        """
+        with override_settings(SALES_ROLLUP={"LAG_SECONDS": 0, "WORKERS": 0}):
+            self.assertEqual(rollups.rebuild(), 8)
+        inline = self.rollup_rows()
+
+        for method in ("fork", "spawn"):
+            DailyProductSales.objects.all().delete()
+            with override_settings(
+                SALES_ROLLUP={"LAG_SECONDS": 0, "WORKERS": 2, "START_METHOD": method}
+            ):
+                self.assertEqual(rollups.rebuild(), 8)
+            self.assertEqual(self.rollup_rows(), inline)
+        self.assertEqual(DailySellerSales.objects.count(), 8)
@@ -0,0 +1,206 @@
+import json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APITestCase
+from bangazonapi.cache import analytics_cache, favorite_sellers
+from bangazonapi.models import (
+    Customer,
+    Favorite,
+    Order,
+    OrderProduct,
+    Payment,
+    Product,
+    ProductRating,
+)
+
+
+class StoreTests(APITestCase):
+    def setUp(self) -> None:
+        """
+        Create a product category for sellers to stock
+        """
+        favorite_sellers.backend.clear()
+        analytics_cache.clear()
+        self.token = self.create_seller("steve")
+
+        url = "/productcategories"
+        data = {"name": "Sporting Goods"}
+        response = self.client.post(url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def create_seller(self, username, prices=()):
+        """
+        Register a customer, open their store and list a product at each price.
+        """
+        data = {
+            "username": username,
+            "password": "Admin8*",
+            "email": f"{username}@stevebrownlee.com",
+            "address": "100 Infinity Way",
+            "phone_number": "555-1212",
+            "first_name": username.title(),
+            "last_name": "Brownlee",
+        }
+        response = self.client.post("/register", data, format="json")
+        token = json.loads(response.content)["token"]
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + token)
+
+        data = {"name": f"{username.title()}'s Store", "description": "tools and socks"}
+        response = self.client.post("/stores", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        for price in prices:
+            data = {
+                "name": "Kite",
+                "price": price,
+                "quantity": 60,
+                "description": "It flies high",
+                "category_id": 1,
+                "location": "Pittsburgh",
+            }
+            response = self.client.post("/products", data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return token
+
+    def list_stores(self, url="/stores"):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, None, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(response.content), len(queries)
+
+    def test_list_stores_in_fixed_queries(self):
+        """
+        Ensure listing stores costs the same number of queries however many there are.
+        """
+        self.create_seller("ada", prices=(10.00, 20.00))
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        self.list_stores()
+        stores, one_seller_queries = self.list_stores()
+        self.assertEqual(len(stores), 2)
+
+        self.create_seller("grace", prices=(5.00, 7.50, 9.00))
+        self.create_seller("linus", prices=(1.00,))
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        stores, queries = self.list_stores()
+        self.assertEqual(len(stores), 4)
+        self.assertEqual(queries, one_seller_queries)
+
+        products = {store["name"]: len(store["products"]) for store in stores}
+        self.assertEqual(products["Grace's Store"], 3)
+        self.assertEqual(products["Steve's Store"], 0)
+
+    def test_list_store_summaries(self):
+        """
+        Ensure summary mode reports product totals instead of products.
+        """
+        self.create_seller("grace", prices=(5.00, 7.50, 9.00))
+
+        stores, _ = self.list_stores("/stores?summary=true")
+        summaries = {store["name"]: store["summary"] for store in stores}
+        self.assertNotIn("products", stores[0])
+        self.assertEqual(
+            summaries["Grace's Store"],
+            {"product_count": 3, "min_price": 5.0, "max_price": 9.0, "total_sold": 0},
+        )
+        self.assertEqual(summaries["Steve's Store"]["product_count"], 0)
+
+    def test_list_stores_with_sparse_fields(self):
+        """
+        Ensure unrequested relations are neither rendered nor queried.
+        """
+        self.create_seller("grace", prices=(5.00, 7.50, 9.00))
+        _, full_queries = self.list_stores()
+
+        stores, queries = self.list_stores("/stores?fields=id,name")
+        self.assertEqual(set(stores[0]), {"id", "name"})
+        self.assertLess(queries, full_queries)
+
+        stores, _ = self.list_stores("/stores?fields=id&expand=products")
+        products = {store["id"]: store["products"] for store in stores}
+        self.assertEqual(len(products[2]), 3)
+        self.assertNotIn("seller", stores[0])
+
+    def test_favorite_store_seller(self):
+        """
+        Ensure favoriting is idempotent and shows up in the store list.
+        """
+        self.create_seller("grace")
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        stores, _ = self.list_stores()
+        self.assertFalse(any(store["is_favorite"] for store in stores))
+
+        for _ in range(2):
+            response = self.client.post("/profile/favoritesellers", {"store_id": 2}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Favorite.objects.count(), 1)
+
+        stores, _ = self.list_stores()
+        favorites = {store["name"]: store["is_favorite"] for store in stores}
+        self.assertEqual(favorites, {"Steve's Store": False, "Grace's Store": True})
+
+        response = self.client.get("/stores/2", None, format="json")
+        self.assertTrue(json.loads(response.content)["is_favorite"])
+
+        self.client.delete("/profile/favoritesellers", {"store_id": 2}, format="json")
+        response = self.client.get("/stores/2", None, format="json")
+        self.assertFalse(json.loads(response.content)["is_favorite"])
+
+    def buy(self, username, orders):
+        """
+        Complete one order per list of (product, quantity) pairs for a new buyer.
+        """
+        self.create_seller(username)
+        customer = Customer.objects.get(user__username=username)
+        payment = Payment.objects.create(
+            merchant_name="MYMEX",
+            account_number="222222",
+            expiration_date="2030-01-01",
+            customer=customer,
+        )
+        for lines in orders:
+            order = Order.objects.create(customer=customer, created_date="2024-01-01")
+            for product, quantity in lines:
+                OrderProduct.add(order, product, quantity)
+            order.complete(payment)
+        return customer
+
+    def test_store_analytics(self):
+        """
+        Ensure a seller sees revenue, top products, sell-through, ratings and repeat buyers.
+        """
+        grace = self.create_seller("grace", prices=(10.00, 20.00, 5.00))
+        kite, glider, _ = Product.objects.filter(customer__user__username="grace").order_by("id")
+        ada = self.buy("ada", [[(kite, 2)], [(glider, 1)]])
+        self.buy("linus", [[(kite, 1), (glider, 3)]])
+        ProductRating.objects.create(product=kite, customer=ada, rating=4)
+        ProductRating.objects.create(product=glider, customer=ada, rating=2)
+
+        self.client.credentials()
+        response = self.client.get("/stores/2/analytics", None, format="json")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + self.token)
+        response = self.client.get("/stores/2/analytics", None, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.credentials(HTTP_AUTHORIZATION="Token " + grace)
+        response = self.client.get("/stores/2/analytics", None, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        figures = json.loads(response.content)
+
+        self.assertEqual((figures["revenue"], figures["units"], figures["orders"]), (110.0, 7, 3))
+        self.assertEqual(len(figures["timeline"]), 30)
+        self.assertEqual(figures["timeline"][-1]["revenue"], 110.0)
+        self.assertEqual(
+            [(item["id"], item["units"], item["revenue"]) for item in figures["top_products"]],
+            [(glider.id, 4, 80.0), (kite.id, 3, 30.0)],
+        )
+        self.assertEqual(figures["sell_through"], {"sold": 7, "in_stock": 173, "rate": 0.0389})
+        self.assertEqual(figures["ratings"]["count"], 2)
+        self.assertEqual(figures["ratings"]["average"], 3.0)
+        self.assertEqual(figures["ratings"]["distribution"]["4"], 1)
+        self.assertEqual(figures["buyers"], {"count": 2, "repeat": 1, "repeat_rate": 0.5})
+
+        response = self.client.get("/stores/2/analytics?from=2024-02-01&to=2024-01-01")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)